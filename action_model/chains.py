@@ -17,11 +17,14 @@ else:
                      action_correction_prompt)
 import os
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel, Field
 from typing import Type, Dict, Any, List
 from langchain_core.output_parsers import PydanticOutputParser
+from llm_cache import configure_llm_cache
+from llm_replay import make_chat_model
+
+configure_llm_cache()
 
 class CommandList(BaseModel):
     """Model to write commands."""
@@ -69,7 +72,7 @@ class JudgmentModel(BaseModel):
 judgment_parser = PydanticOutputParser(pydantic_object=JudgmentModel)
 judgment_instructions = judgment_parser.get_format_instructions()
 
-llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0, base_url=BASE_URL, max_completion_tokens=1000)
+llm = make_chat_model(model_name=MODEL_NAME, temperature=0, base_url=BASE_URL, max_completion_tokens=1000)
 thought_llm = llm
 action_llm = llm
 reflection_llm = llm
@@ -1,230 +1,400 @@
 import argparse
-from typing import Dict, List, Tuple, Optional
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, Union
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import fnmatch
+import glob
 import json
 import sys
 import os
+import time
 import traceback
+from result_sink import ResultSink
 
 def is_staff_user(username: str) -> bool:
     staff_prefixes = ['[Mod]', '[Mojang]', '[Helper]']
     return any(username.strip().startswith(prefix) for prefix in staff_prefixes)
 
-def find_last_step_before_staff(issue_json: Dict) -> Optional[int]:
-    """Find the last step before a staff member's edit."""
-    try:
-        changelog = issue_json.get('changelog', {}).get('histories', [])
-        if not changelog:
-            #print("No changelog entries found")
-            return None
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
 
-        # Sort changelog by created time (oldest to newest)
-        changelog.sort(key=lambda x: datetime.strptime(x.get('created', '1970-01-01T00:00:00.000+0000'),
-                                                       '%Y-%m-%dT%H:%M:%S.%f%z'))
+def parse_timestamp(value: str) -> int:
+    """Converts a Jira timestamp to integer microseconds since the epoch."""
+    return (datetime.strptime(value, TIMESTAMP_FORMAT) - EPOCH) // ONE_MICROSECOND
 
-        #print("\nProcessing steps from oldest to newest to find staff edit")
-        for i, item in enumerate(changelog):
-            author = item.get('author', {}).get('displayName', '')
-            created_time = item.get('created', '')
-            #print(f"\nChecking step {i + 1}")
-            #print(f"Author: {author}")
-            #print(f"Time: {created_time}")
+def sort_by_time(items: List[Dict], missing: str) -> List[int]:
+    """
+    Stably sorts changelog entries, comments or attachments in place by their 'created' timestamp.
+
+    Args:
+        items: The list to sort.
+        missing: Timestamp assumed for items without one.
+
+    Returns:
+        The parsed timestamps in the new order of the items.
+    """
+    times = [parse_timestamp(item.get('created', missing)) for item in items]
+    order = sorted(range(len(items)), key=times.__getitem__)
+    items[:] = [items[i] for i in order]
+    return [times[i] for i in order]
+
+_ABSENT = object()
+
+def reverted_value(item: Dict):
+    """Returns the value a changelog item reverts its field to, or _ABSENT if it removes the field."""
+    if item.get('fromString') is not None:
+        return item.get('fromString')
+    if item.get('from') is not None:
+        return item.get('from')
+    return _ABSENT
+
+class ChangeIndex:
+    """
+    Field-level index over a time-sorted changelog for point-in-time state queries.
+
+    The state before step k differs from the current fields only in the fields changed at
+    step k or later, and each of those holds the value reverted by its earliest such change.
+    The index keeps, per field, the steps that changed it and the reverted values, so one
+    binary search per field answers any step without replaying or copying anything.
+
+    A backward replay also moves a field to the end of the state whenever it adds it back
+    after it was removed or missing. The index keeps the steps at which that happens, so a
+    state lists its fields in the order the replay would.
+    """
+
+    def __init__(self, fields: Dict, changelog: List[Dict]):
+        self.fields = fields
+        self.steps = len(changelog)
+        self.positions = {}
+        self.values = {}
+        # Per field, the steps at which the replay adds it back and the replay order of the last such addition in each step
+        self.insertion_steps = {}
+        self.insertion_orders = {}
+        present = {}
+        order = 0
+        for step in range(self.steps - 1, -1, -1):
+            reverted = {}
+            for item in changelog[step].get('items', []):
+                field = item.get('field')
+                if not field:
+                    continue
+                value = reverted_value(item)
+                reverted[field] = value  # The last item of a step wins
+                was_present = present.get(field, field in fields)
+                present[field] = value is not _ABSENT
+                if present[field] and not was_present:
+                    steps = self.insertion_steps.setdefault(field, [])
+                    if steps and steps[-1] == step:
+                        self.insertion_orders[field][-1] = order
+                    else:
+                        steps.append(step)
+                        self.insertion_orders.setdefault(field, []).append(order)
+                order += 1
+            for field, value in reverted.items():
+                if field not in self.positions:
+                    self.positions[field] = []
+                    self.values[field] = []
+                self.positions[field].append(step)
+                self.values[field].append(value)
+        for field in self.positions:
+            self.positions[field].reverse()
+            self.values[field].reverse()
+        for field in self.insertion_steps:
+            self.insertion_steps[field].reverse()
+            self.insertion_orders[field].reverse()
+        # Fields missing from the current state, which are only present once the replay added them back
+        self.extra_fields = [field for field in self.positions if field not in fields]
+
+    def value_at(self, field: str, step: int):
+        """Returns a field's value before the changelog entry at index `step`, or _ABSENT."""
+        positions = self.positions.get(field)
+        if positions:
+            i = bisect_left(positions, step)
+            if i < len(positions):
+                return self.values[field][i]
+        return self.fields.get(field, _ABSENT)
+
+    def insertion_at(self, field: str, step: int) -> Optional[int]:
+        """Returns the replay order of the last time a replay down to `step` added a field back, or None if it never did."""
+        steps = self.insertion_steps.get(field)
+        if steps:
+            i = bisect_left(steps, step)
+            if i < len(steps):
+                return self.insertion_orders[field][i]
+        return None
 
-            if is_staff_user(author):
-                #print(f"\nFound staff edit at step {i + 1} by {author}")
-                return max(0, i)
+    def state_at(self, step: int) -> 'IssueState':
+        """Returns a read-only view of the fields before the changelog entry at index `step`; `steps` is the current state."""
+        if not 0 <= step <= self.steps:
+            raise IndexError(f"Step {step} is outside of 0..{self.steps}")
+        return IssueState(self, step)
+
+class IssueState(Mapping):
+    """Read-only view of the issue fields at one step. Fields are resolved on access; dict(view) materializes it."""
+
+    def __init__(self, index: ChangeIndex, step: int):
+        self.index = index
+        self.step = step
+
+    def __getitem__(self, field):
+        value = self.index.value_at(field, self.step)
+        if value is _ABSENT:
+            raise KeyError(field)
+        return value
+
+    def __iter__(self):
+        # Fields the replay never added back keep their place, the others follow in the order they were added back
+        added_back = []
+        for field in self.index.fields:
+            if self.index.value_at(field, self.step) is not _ABSENT:
+                order = self.index.insertion_at(field, self.step)
+                if order is None:
+                    yield field
+                else:
+                    added_back.append((order, field))
+        for field in self.index.extra_fields:
+            if self.index.value_at(field, self.step) is not _ABSENT:
+                added_back.append((self.index.insertion_at(field, self.step), field))
+        added_back.sort()
+        for order, field in added_back:
+            yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"IssueState(step={self.step}, {dict(self)!r})"
+
+class IssueHistory:
+    """
+    Parsed view of an issue.json for backtracing. Every timestamp is parsed once and the
+    changelog, comments and attachments are kept sorted by time, so any number of steps
+    can be backtraced without re-reading, re-parsing or re-sorting the issue.
+
+    The lists of the issue are sorted in place when first used. A list with a malformed
+    timestamp raises ValueError when it is used, leaving the other lists usable.
+    """
+
+    def __init__(self, issue_json: Dict):
+        self.issue_json = issue_json
+        self.fields = issue_json.get('fields', {})
+
+    @classmethod
+    def from_file(cls, json_file_path: str) -> 'IssueHistory':
+        with open(json_file_path, 'r', encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @cached_property
+    def _changelog(self) -> Tuple[List[int], List[Dict]]:
+        histories = self.issue_json.get('changelog', {}).get('histories', [])
+        return sort_by_time(histories, '1970-01-01T00:00:00.000+0000'), histories
+
+    @cached_property
+    def _comments(self) -> Tuple[List[int], List[Dict]]:
+        comments_container = self.fields.get('comment', {})
+        comments = (comments_container.get('comments', []) if comments_container else []) or []
+        # Comments without a timestamp sort last and are never included in a step
+        return sort_by_time(comments, '9999-12-31T23:59:59.999+0000'), comments
+
+    @cached_property
+    def _attachments(self) -> Tuple[List[int], List[Dict]]:
+        attachments = self.fields.get('attachment', []) or []
+        return sort_by_time(attachments, '9999-12-31T23:59:59.999+0000'), attachments
+
+    @property
+    def changelog(self) -> List[Dict]:
+        return self._changelog[1]
+
+    def staff_step(self) -> Optional[int]:
+        """Returns the index of the first staff edit, the number of steps if there is none, or None without a changelog."""
+        changelog = self.changelog
+        if not changelog:
+            return None
+        for i, item in enumerate(changelog):
+            if is_staff_user(item.get('author', {}).get('displayName', '')):
+                return i
+        return len(changelog)
+
+    def comments_until(self, step_time: int) -> List[Dict]:
+        """Returns the comments created at or before a time, oldest first."""
+        times, comments = self._comments
+        return comments[:bisect_right(times, step_time)]
+
+    def attachments_until(self, step_time: int) -> List[Dict]:
+        """Returns the attachments created at or before a time, oldest first."""
+        times, attachments = self._attachments
+        return attachments[:bisect_right(times, step_time)]
+
+    def comments_at(self, step_times: Iterable[int]) -> List[List[Dict]]:
+        """Returns the comments created at or before each of many times, one binary search per time."""
+        times, comments = self._comments
+        return [comments[:bisect_right(times, step_time)] for step_time in step_times]
+
+    def attachments_at(self, step_times: Iterable[int]) -> List[List[Dict]]:
+        """Returns the attachments created at or before each of many times, one binary search per time."""
+        times, attachments = self._attachments
+        return [attachments[:bisect_right(times, step_time)] for step_time in step_times]
+
+    def step_times(self) -> List[Optional[int]]:
+        """Returns the parsed time of every changelog entry, None for entries without one."""
+        times, changelog = self._changelog
+        return [moment if entry.get('created') else None for moment, entry in zip(times, changelog)]
+
+    def backtrace_all(self, strict: bool = False) -> List[Tuple[Optional[str], Dict, List[Dict], List[Dict]]]:
+        """
+        Returns what backtrace() returns for every step of the issue, computing the
+        comment and attachment cuts of all steps in one pass over the step times.
+        """
+        changelog = self.changelog
+        step_times = self.step_times()
+        timed = [step_time for step_time in step_times if step_time is not None]
+        if strict:
+            comments, attachments = self.comments_at(timed), self.attachments_at(timed)
+        else:
+            comments, attachments = self._safe(self.comments_at, timed), self._safe(self.attachments_at, timed)
+            comments = comments or [[] for _ in timed]
+            attachments = attachments or [[] for _ in timed]
+        comments, attachments = iter(comments), iter(attachments)
+
+        steps = []
+        for step, (entry, step_time) in enumerate(zip(changelog, step_times)):
+            if step_time is None:
+                step_comments, step_attachments = [], []
+            else:
+                step_comments, step_attachments = next(comments), next(attachments)
+            change_id = '0' if step == 0 else entry.get('id')
+            steps.append((change_id, self.state_before(step), step_comments, step_attachments))
+        return steps
+
+    @cached_property
+    def change_index(self) -> ChangeIndex:
+        return ChangeIndex(self.fields, self.changelog)
+
+    def state_at(self, step: int) -> IssueState:
+        """Returns a view of the fields before the changelog entry at index `step`. Step len(changelog) is the current state."""
+        return self.change_index.state_at(step)
+
+    def state_at_time(self, moment: Union[str, int]) -> IssueState:
+        """Returns a view of the fields after every change made at or before a timestamp or epoch microseconds."""
+        if isinstance(moment, str):
+            moment = parse_timestamp(moment)
+        return self.state_at(bisect_right(self._changelog[0], moment))
+
+    def state_before(self, step: int) -> Dict:
+        """Returns a copy of the issue fields as they were before the changelog entry at index `step`."""
+        return dict(self.state_at(step))
+
+    def backtrace(self, target_step: int, strict: bool = False) -> Tuple[Optional[str], Optional[Dict], List[Dict], List[Dict]]:
+        """
+        Returns the change id, the fields, the comments and the attachments of the issue at a step.
+        Step 0 is the initial state; step n is the state before the n-th change, which must exist.
+
+        Args:
+            target_step: The step to backtrace to.
+            strict: Raise on malformed comment or attachment timestamps instead of leaving that list empty.
+        """
+        changelog = self.changelog
+        if not changelog or not 0 <= target_step < len(changelog):
+            return None, None, [], []
+        target_entry = changelog[target_step]
+        state = self.state_before(target_step)
+        comments, attachments = self._filter_at(target_entry, strict)
+        return '0' if target_step == 0 else target_entry.get('id'), state, comments, attachments
+
+    def _filter_at(self, entry: Dict, strict: bool = False) -> Tuple[List[Dict], List[Dict]]:
+        created = entry.get('created', '')
+        if not created:
+            return [], []
+        step_time = parse_timestamp(created)
+        if strict:
+            return self.comments_until(step_time), self.attachments_until(step_time)
+        return self._safe(self.comments_until, step_time), self._safe(self.attachments_until, step_time)
+
+    @staticmethod
+    def _safe(filter_function, step_time):
+        # A malformed comment or attachment timestamp drops that list, not the whole backtrace
+        try:
+            return filter_function(step_time)
+        except ValueError:
+            traceback.print_exc()
+            return []
 
-        #print("\nNo staff edits found")
-        return len(changelog)  # Return last step if no staff edits found
+def as_history(issue: Union[Dict, IssueHistory]) -> IssueHistory:
+    return issue if isinstance(issue, IssueHistory) else IssueHistory(issue)
 
+def find_last_step_before_staff(issue_json: Union[Dict, IssueHistory]) -> Optional[int]:
+    """Find the last step before a staff member's edit."""
+    try:
+        return as_history(issue_json).staff_step()
     except Exception as e:
-        #print(f"Error finding staff edit: {str(e)}")
         traceback.print_exc()
         return None
 
-def filter_comments_by_step(issue_json: Dict, step_time: str) -> List[Dict]:
+def filter_comments_by_step(issue_json: Union[Dict, IssueHistory], step_time: str) -> List[Dict]:
     """Filter comments to keep only those before the specified step time."""
     try:
-        comments_container = issue_json.get('fields', {}).get('comment', {})
-        if not comments_container:
-            #print("\nNo comments container found in issue")
-            return []
-
-        comments = comments_container.get('comments', [])
-        if not comments:
-            #print("\nNo comments found in comments container")
-            return []
-
         if not step_time:
-            #print("\nStep 0: No comments included")
             return []
-
-        step_datetime = datetime.strptime(step_time, '%Y-%m-%dT%H:%M:%S.%f%z')
-        filtered_comments = []
-
-        #print(f"\nFiltering comments before {step_time}")
-        #print(f"Total comments found: {len(comments)}")
-
-        comments.sort(key=lambda x: datetime.strptime(x.get('created', '9999-12-31T23:59:59.999+0000'),
-                                                      '%Y-%m-%dT%H:%M:%S.%f%z'))
-
-        for comment in comments:
-            comment_time = comment.get('created')
-            if not comment_time:
-                #print(f"Warning: Comment missing timestamp")
-                continue
-
-            try:
-                comment_datetime = datetime.strptime(comment_time, '%Y-%m-%dT%H:%M:%S.%f%z')
-                if comment_datetime <= step_datetime:
-                    author = comment.get('author', {}).get('displayName', 'Unknown')
-                    #print(f"Including comment from {comment_time} by {author}")
-                    filtered_comments.append(comment)
-                else:
-                    ""
-                    #print(f"Excluding comment from {comment_time} (after step time)")
-            except ValueError as e:
-                #print(f"Warning: Could not parse comment timestamp: {comment_time}")
-                continue
-
-        #print(f"Found {len(filtered_comments)} comments before step time")
-        return filtered_comments
+        return as_history(issue_json).comments_until(parse_timestamp(step_time))
     except Exception as e:
-        #print(f"Error filtering comments: {str(e)}")
         traceback.print_exc()
         return []
 
-def filter_attachments_by_step(issue_json: Dict, step_time: str) -> List[Dict]:
+def filter_attachments_by_step(issue_json: Union[Dict, IssueHistory], step_time: str) -> List[Dict]:
     """Filter attachments to keep only those added before the specified step time."""
     try:
-        attachments = issue_json.get('fields', {}).get('attachment', [])
-        if not attachments:
-            #print("\nNo attachments found in issue")
+        if not step_time:
             return []
+        return as_history(issue_json).attachments_until(parse_timestamp(step_time))
+    except Exception as e:
+        traceback.print_exc()
+        return []
 
-        step_datetime = datetime.strptime(step_time, '%Y-%m-%dT%H:%M:%S.%f%z')
-        filtered_attachments = []
-
-        #print(f"\nFiltering attachments before {step_time}")
-        #print(f"Total attachments found: {len(attachments)}")
-
-        attachments.sort(key=lambda x: datetime.strptime(x.get('created', '9999-12-31T23:59:59.999+0000'),
-                                                         '%Y-%m-%dT%H:%M:%S.%f%z'))
-
-        for attachment in attachments:
-            attachment_time = attachment.get('created')
-            if not attachment_time:
-                #print(f"Warning: Attachment missing timestamp")
-                continue
+def filter_comments_by_steps(issue_json: Union[Dict, IssueHistory], step_times: List[str]) -> List[List[Dict]]:
+    """Filter comments for many step times at once, sorting and parsing the comments only once."""
+    try:
+        history = as_history(issue_json)
+        cuts = iter(history.comments_at([parse_timestamp(step_time) for step_time in step_times if step_time]))
+        return [next(cuts) if step_time else [] for step_time in step_times]
+    except Exception as e:
+        traceback.print_exc()
+        return [[] for _ in step_times]
 
-            try:
-                attachment_datetime = datetime.strptime(attachment_time, '%Y-%m-%dT%H:%M:%S.%f%z')
-                if attachment_datetime <= step_datetime:
-                    author = attachment.get('author', {}).get('displayName', 'Unknown')
-                    #print(f"Including attachment from {attachment_time} by {author}")
-                    filtered_attachments.append(attachment)
-                else:
-                    ""
-                    #print(f"Excluding attachment from {attachment_time} (after step time)")
-            except ValueError as e:
-                #print(f"Warning: Could not parse attachment timestamp: {attachment_time}")
-                continue
-
-        #print(f"Found {len(filtered_attachments)} attachments before step time")
-        return filtered_attachments
+def filter_attachments_by_steps(issue_json: Union[Dict, IssueHistory], step_times: List[str]) -> List[List[Dict]]:
+    """Filter attachments for many step times at once, sorting and parsing the attachments only once."""
+    try:
+        history = as_history(issue_json)
+        cuts = iter(history.attachments_at([parse_timestamp(step_time) for step_time in step_times if step_time]))
+        return [next(cuts) if step_time else [] for step_time in step_times]
     except Exception as e:
-        #print(f"Error filtering attachments: {str(e)}")
         traceback.print_exc()
-        return []
+        return [[] for _ in step_times]
 
-def apply_change_to_state(state: Dict, item: Dict) -> Dict:
+def revert_change(state: Dict, item: Dict) -> None:
+    """Reverts one changelog item on a state in place."""
     field = item.get('field')
     if not field:
-        return state
-
-    new_state = state.copy()
-
-    if item.get('fromString') is not None:
-        new_state[field] = item.get('fromString')
-        #print(f"Restored field {field} to previous value: {item.get('fromString')}")
-    elif item.get('from') is not None:
-        new_state[field] = item.get('from')
-        #print(f"Restored field {field} to previous ID: {item.get('from')}")
+        return
+    value = reverted_value(item)
+    if value is _ABSENT:
+        state.pop(field, None)
     else:
-        new_state.pop(field, None)
-        #print(f"Removed field {field}")
+        state[field] = value
 
+def apply_change_to_state(state: Dict, item: Dict) -> Dict:
+    if not item.get('field'):
+        return state
+    new_state = state.copy()
+    revert_change(new_state, item)
     return new_state
 
-def backtrace_steps(issue_json: Dict, target_step: int) -> Tuple[Optional[str], Optional[Dict], List[Dict], List[Dict]]:
+def backtrace_steps(issue_json: Union[Dict, IssueHistory], target_step: int) -> Tuple[Optional[str], Optional[Dict], List[Dict], List[Dict]]:
     try:
-        changelog = issue_json.get('changelog', {}).get('histories', [])
-        if not changelog:
-            return None, None, [], []
-
-        changelog.sort(key=lambda x: datetime.strptime(x.get('created', '1970-01-01T00:00:00.000+0000'),
-                                                       '%Y-%m-%dT%H:%M:%S.%f%z'))
-        total_steps = len(changelog)
-
-        """print(f"\nTotal steps: {total_steps}")
-        print(f"Target step: {target_step}")"""
-
-        if target_step == 0:
-            #print("Getting initial state (step 0)")
-            initial_state = issue_json.get('fields', {}).copy()
-            for entry in reversed(changelog):
-                for item in entry.get('items', []):
-                    initial_state = apply_change_to_state(initial_state, item)
-            if changelog:
-                first_change_time = changelog[0].get('created', '')
-                filtered_comments = filter_comments_by_step(issue_json, first_change_time)
-                filtered_attachments = filter_attachments_by_step(issue_json, first_change_time)
-            else:
-                filtered_comments, filtered_attachments = [], []
-            return '0', initial_state, filtered_comments, filtered_attachments
-
-        if target_step < 0 or target_step > total_steps:
-            #print(f"\nInvalid step number. Total steps: {total_steps}")
-            return None, None, [], []
-
-        #print("Starting from most recent state")
-
-        current_state = issue_json.get('fields', {}).copy()
-        target_entry = None
-
-        for i, entry in enumerate(reversed(changelog[target_step:])):
-        #print(f"\nProcessing step {i+1} of {len(changelog[target_step:])} (Change ID: {entry.get('id')})")
-            #print(f"Created: {entry.get('created')}")
-            #print(f"Author: {entry.get('author', {}).get('displayName')}\n")
-
-            for item in entry.get('items', []):
-                current_state = apply_change_to_state(current_state, item)
-
-            if i == len(changelog[target_step:]) - 1:
-                target_entry = entry
-                break
-
-        if target_entry:
-            filtered_comments = filter_comments_by_step(issue_json, target_entry.get('created', ''))
-            filtered_attachments = filter_attachments_by_step(issue_json, target_entry.get('created', ''))
-
-            #print(f"\nComments at this step:")
-            for comment in filtered_comments:
-                ""
-                #print(f"Created: {comment.get('created')}")
-                #print(f"Author: {comment.get('author', {}).get('displayName')}")
-                #print(f"Content: {comment.get('body')[:100]}...\n")
-
-            #print(f"\nAttachments at this step:")
-            for attachment in filtered_attachments:
-                ""
-                #print(f"Filename: {attachment.get('filename')}")
-                #print(f"Created: {attachment.get('created')}")
-                #print(f"Author: {attachment.get('author', {}).get('displayName')}")
-
-            return target_entry.get('id'), current_state, filtered_comments, filtered_attachments
-
-        return None, None, [], []
+        return as_history(issue_json).backtrace(target_step)
     except Exception as e:
         #print(f"Error in backtrace_steps: {str(e)}")
         traceback.print_exc()
@@ -249,18 +419,17 @@ def export_state(state: Dict, comments: List[Dict], attachments: List[Dict], out
 
 def backtrace(json_file_path: str, step_number: Optional[int] = None, output_file: Optional[str] = None, find_staff: bool = False) -> Tuple[Optional[str], Optional[Dict], Optional[List[Dict]], Optional[List[Dict]]]:
     try:
-        with open(json_file_path, 'r', encoding="utf-8") as f:
-            data = json.load(f)
+        history = IssueHistory.from_file(json_file_path)
 
         if find_staff:
-            step_number = find_last_step_before_staff(data)
+            step_number = find_last_step_before_staff(history)
             #print(f"\nFound last step before staff edit: {step_number}")
 
         if step_number is None:
             #print("Error: Must specify either step number or --find-staff")
             return None, None, None, None
 
-        change_id, final_state, comments, attachments = backtrace_steps(data, step_number)
+        change_id, final_state, comments, attachments = backtrace_steps(history, step_number)
 
         if change_id and final_state and output_file:
             export_state(final_state, comments, attachments, output_file)
@@ -276,16 +445,123 @@ def backtrace(json_file_path: str, step_number: Optional[int] = None, output_fil
         #print(f"Error: An unexpected error occurred: {str(e)}")
         return None, None, None, None
 
+def backtrace_record(json_file_path: str, step_number: Optional[int] = None, find_staff: bool = False) -> Tuple[bool, str]:
+    """
+    Backtraces one issue for the bulk mode. Unlike backtrace(), errors are reported rather than swallowed.
+
+    Returns:
+        True and the serialized state record, or False and the serialized failure record.
+    """
+    try:
+        history = IssueHistory.from_file(json_file_path)
+        step = history.staff_step() if find_staff else step_number
+        if step is None:
+            raise ValueError("The issue has no changelog")
+        change_id, state, comments, attachments = history.backtrace(step, strict=True)
+        if state is None:
+            raise ValueError(f"No state at step {step}, the issue has {len(history.changelog)} changelog entries")
+        record = {
+            'issue': json_file_path,
+            'step': step,
+            'change_id': change_id,
+            'fields': state,
+            'comments': comments,
+            'attachments': attachments,
+        }
+        return True, json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        failure = {
+            'issue': json_file_path,
+            'error_type': type(e).__name__,
+            'error': str(e),
+            'traceback': traceback.format_exc(),
+        }
+        return False, json.dumps(failure, ensure_ascii=False, separators=(",", ":"))
+
+def iter_issue_files(source: str, pattern: str = 'issue.json') -> Iterator[str]:
+    """
+    Lazily yields the issue files of a directory tree whose names match `pattern`,
+    or the files matching `source` if it is a glob.
+    """
+    if os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if fnmatch.fnmatch(filename, pattern):
+                    yield os.path.join(dirpath, filename)
+    else:
+        yield from glob.iglob(source, recursive=True)
+
+def backtrace_bulk(json_file_paths: Iterable[str], output_file: str, failures_file: str, step_number: Optional[int] = None,
+                   find_staff: bool = False, workers: Optional[int] = None, in_flight: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Backtraces many issues on a process pool and streams one JSONL record per issue.
+    At most `in_flight` issues are queued or running at a time, so memory stays flat however large the corpus is.
+
+    Args:
+        json_file_paths: Iterable of issue files, consumed lazily.
+        output_file: JSONL file receiving the state records. Overwritten.
+        failures_file: JSONL file receiving one record per failed issue. Overwritten.
+        step_number: Step to backtrace every issue to.
+        find_staff: Backtrace every issue to the last step before a staff edit instead.
+        workers: Number of worker processes, defaults to the number of CPUs.
+        in_flight: Maximum number of pending issues, defaults to four per worker.
+
+    Returns:
+        The number of succeeded and failed issues.
+    """
+    workers = workers or os.cpu_count() or 1
+    in_flight = in_flight or workers * 4
+    succeeded = failed = 0
+    for path in (output_file, failures_file):
+        open(path, 'w').close()
+
+    def collect(futures):
+        nonlocal succeeded, failed
+        for future in futures:
+            ok, line = future.result()
+            if ok:
+                states.write_line(line)
+                succeeded += 1
+            else:
+                failures.write_line(line)
+                failed += 1
+
+    with ResultSink(output_file, fsync_every=1000) as states, ResultSink(failures_file, fsync_every=1000) as failures, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for json_file_path in json_file_paths:
+            if len(pending) >= in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(backtrace_record, json_file_path, step_number, find_staff))
+        collect(pending)
+    return succeeded, failed
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Backtrace issue steps and optionally export state')
-    parser.add_argument('json_file', help='Path to the JSON file')
+    parser.add_argument('json_file', help='Path to the JSON file, or a directory or glob of them for the bulk mode')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--step', '-s', type=int, help='Step number to backtrace to (0 for initial state)')
     group.add_argument('--find-staff', '-f', action='store_true', help='Find last step before staff edit')
-    parser.add_argument('--output', '-o', help='Output JSON file for the final state')
+    parser.add_argument('--output', '-o', help='Output JSON file for the final state, or the JSONL file of the bulk mode '
+                                               '(default backtrace_states.jsonl)')
+    parser.add_argument('--failures', default='backtrace_failures.jsonl', help='JSONL file listing the issues that failed in the bulk mode')
+    parser.add_argument('--pattern', default='issue.json', help='File name pattern of the issue files when a directory is given')
+    parser.add_argument('--workers', '-w', type=int, help='Worker processes of the bulk mode, defaults to the number of CPUs')
 
     args = parser.parse_args()
 
+    if os.path.isdir(args.json_file) or glob.has_magic(args.json_file):
+        output_file = args.output or 'backtrace_states.jsonl'
+        start = time.perf_counter()
+        succeeded, failed = backtrace_bulk(iter_issue_files(args.json_file, args.pattern), output_file, args.failures,
+                                           args.step, args.find_staff, args.workers)
+        print(f"Backtraced {succeeded} issues into {output_file} in {time.perf_counter() - start:.1f}s")
+        if failed:
+            print(f"{failed} issues failed, see {args.failures}")
+        sys.exit(1 if failed else 0)
+
     change_id, final_state, comments, attachments = backtrace(args.json_file, args.step, args.output, args.find_staff)
 
     if change_id and final_state:
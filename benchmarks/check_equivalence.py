@@ -0,0 +1,192 @@
+import argparse
+import base64
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+
+# Titles whose normalized form is empty, a single character or non-ASCII, where fuzzy matching has edge cases
+EDGE_TITLES = ["", "!!", "a", "_", "X-ray", "İstanbul", "Ender Pearl", "TNT", "ab", "ba", "Java Edition 1_21"]
+
+def typo(word, rng):
+    """Applies one random transposition, deletion, insertion or substitution to a word, or none."""
+    if len(word) < 2:
+        return word
+    i = rng.randrange(len(word) - 1)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 1:
+        return word[:i] + word[i + 1:]
+    if kind == 2:
+        return word[:i] + rng.choice("xyz_") + word[i:]
+    if kind == 3:
+        return word[:i] + rng.choice("qxy") + word[i + 1:]
+    return word
+
+def random_texts(titles, count, seed):
+    """Yields texts mixing titles, filler words and typos, rendered as plain text or as a node list."""
+    rng = random.Random(seed)
+    words = titles + fixtures.FILLER + ["a", "I", "x", "_"]
+    for _ in range(count):
+        nodes = [rng.choice(words) for _ in range(rng.randint(0, 30))]
+        nodes = [typo(node, rng) if rng.random() < 0.5 else node for node in nodes]
+        yield str(nodes) if rng.random() < 0.5 else " ".join(nodes)
+
+def check_find_matches(pages, texts, seed):
+    """
+    Compares WikiTitleIndex with the reference find_matches scan on random texts.
+
+    Returns:
+        The number of texts on which the matches differ.
+    """
+    from step_synth.utils import WikiTitleIndex, find_matches
+
+    titles = fixtures.make_titles(pages) + EDGE_TITLES
+    index = WikiTitleIndex(titles)
+    mismatches = 0
+    for text in random_texts(titles, texts, seed):
+        expected = find_matches(titles, text)
+        actual = index.find_matches(text)
+        if expected != actual:
+            mismatches += 1
+            print(f"find_matches mismatch on {text!r}: missing {expected - actual}, extra {actual - expected}")
+    return mismatches
+
+def check_title_index(pages, texts, seed):
+    """
+    Compares the titles and deletion keys of the persisted index with a fresh walk of a
+    synthetic wiki, while pages are added and removed between loads. Every change is
+    loaded twice, so the second load reads the files the first one wrote.
+
+    Returns:
+        The number of loads on which the titles differ.
+    """
+    from step_synth.utils import WikiTitleIndex, get_filenames_from_folder
+    from step_synth.wiki_index import load_title_index
+
+    rng = random.Random(seed)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        wiki_directory = os.path.join(workdir, "wiki")
+        fixtures.make_wiki(wiki_directory, pages, 10, seed)
+        os.makedirs(os.path.join(wiki_directory, "nested"))
+        for i in range(min(texts, 20)):
+            if i % 3 == 0:
+                with open(os.path.join(wiki_directory, "nested", f"Added Page {i}.txt"), "w", encoding="utf-8") as f:
+                    f.write("Added")
+            elif i % 3 == 1:
+                pages_on_disk = sorted(name for name in os.listdir(wiki_directory) if name.endswith(".txt"))
+                os.remove(os.path.join(wiki_directory, rng.choice(pages_on_disk)))
+            expected = get_filenames_from_folder(wiki_directory)
+            expected_keys = {key: set(norm_titles) for key, norm_titles in WikiTitleIndex(expected).keys.items()}
+            for load in range(2):
+                titles, title_index = load_title_index(wiki_directory)
+                keys = {key: set(norm_titles) for key, norm_titles in title_index.keys.items()}
+                if titles != expected:
+                    mismatches += 1
+                    print(f"title index mismatch after change {i}: missing {set(expected) - set(titles)}, extra {set(titles) - set(expected)}")
+                elif keys != expected_keys:
+                    mismatches += 1
+                    print(f"title keys mismatch after change {i}, load {load}: {len(set(keys) ^ set(expected_keys))} keys differ")
+    return mismatches
+
+def check_wiki_corpus(pages, texts, seed):
+    """
+    Compares read_wiki_pages with read_files on random page lists of a synthetic wiki,
+    including missing pages, nested pages and Windows line endings.
+
+    Returns:
+        The number of page lists on which the results differ.
+    """
+    from step_synth.utils import read_files
+    from step_synth.wiki_corpus import read_wiki_pages
+
+    rng = random.Random(seed)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        wiki_directory = os.path.join(workdir, "wiki")
+        titles = fixtures.make_wiki(wiki_directory, pages, 50, seed)
+        with open(os.path.join(wiki_directory, "Line endings.txt"), "w", encoding="utf-8", newline="") as f:
+            f.write("Windows\r\nline\rendings\n")
+        os.makedirs(os.path.join(wiki_directory, "nested"))
+        with open(os.path.join(wiki_directory, "nested", "Nested page.txt"), "w", encoding="utf-8") as f:
+            f.write("Nested")
+        names = titles + ["Line endings", "nested/Nested page", "Missing page", titles[0].lower()]
+        for _ in range(texts):
+            file_names = [rng.choice(names) for _ in range(rng.randint(0, 15))]
+            # Both print a line per missing page
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = read_files(wiki_directory, file_names)
+                actual = read_wiki_pages(wiki_directory, file_names)
+            if expected != actual:
+                mismatches += 1
+                print(f"wiki corpus mismatch on {file_names!r}")
+    return mismatches
+
+def check_video_frames(pages, texts, seed):
+    """
+    Compares iter_video_frames at full size and lossless with get_first_frames_each_second_as_base64
+    on synthetic videos of whole and fractional lengths, including one at a fractional frame rate.
+
+    Returns:
+        The number of videos whose timestamps or pixels differ.
+    """
+    import numpy as np
+    from PIL import Image
+    from step_synth.utils import get_first_frames_each_second_as_base64, iter_video_frames
+
+    def decode(frame):
+        return np.asarray(Image.open(io.BytesIO(base64.b64decode(frame["base64"]))).convert("RGB"))
+
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for seconds, size, fps in [(0.5, (160, 120), 24), (3, (320, 240), 24), (4.5, (240, 320), 24), (7.5, (160, 120), 29.97)]:
+            path = os.path.join(workdir, f"video_{seconds}.mp4")
+            fixtures.make_video(path, seconds, size, fps)
+            expected = get_first_frames_each_second_as_base64(path)
+            actual = list(iter_video_frames(path, max_size=0, image_format="PNG"))
+            same = [frame["timestamp"] for frame in expected] == [frame["timestamp"] for frame in actual] and all(
+                np.array_equal(decode(a), decode(b)) for a, b in zip(expected, actual))
+            if not same:
+                mismatches += 1
+                print(f"video frames mismatch on a {seconds}s {size[0]}x{size[1]} {fps} fps video")
+    return mismatches
+
+CHECKS = {
+    "find_matches": check_find_matches,
+    "title_index": check_title_index,
+    "wiki_corpus": check_wiki_corpus,
+    "video_frames": check_video_frames,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that the optimized step synthesis functions give the same results as the reference implementations.")
+    parser.add_argument("--pages", type=int, default=2000, help="Number of synthetic wiki titles.")
+    parser.add_argument("--texts", type=int, default=200, help="Number of random texts per check.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random inputs.")
+    parser.add_argument("--filter", default="", help="Only run the checks whose name contains this text.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+    failed = []
+    for name, check in CHECKS.items():
+        if args.filter not in name:
+            continue
+        mismatches = check(args.pages, args.texts, args.seed)
+        print(f"{name}: {'OK' if not mismatches else f'{mismatches} mismatch(es)'}")
+        if mismatches:
+            failed.append(name)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import ast
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from langchain_core.runnables import RunnableLambda
+
+class FakeLLM:
+    """
+    Deterministic stand-ins for the step synthesis chains and the search tool.
+
+    Every fake answers with an object of the type the real chain's parser produces,
+    derived from its input, so the analysis code runs end to end without network access.
+    `latency` seconds are slept per call to model the API round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def chain(self, name, respond):
+        def count():
+            with self.lock:
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+        def invoke(inputs):
+            count()
+            if self.latency:
+                time.sleep(self.latency)
+            return respond(inputs)
+
+        async def ainvoke(inputs):
+            count()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return respond(inputs)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=name)
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def fakes(self):
+        """Returns the fake chains and search tool keyed by their names in step_synth.analyze."""
+        from step_synth.chains import BooleanModel, ExtractedNodes, JudgmentModel, StepCluster, StepClusterList, StepSelection, StepSelectionList
+
+        def extract_nodes(inputs):
+            words = re.findall(r"[A-Z][a-z]+", str(inputs["bug_report"]))
+            return ExtractedNodes(nodes=list(dict.fromkeys(words))[:20])
+
+        def distill_nodes(inputs):
+            node_list = inputs.get("node_list", "set()")
+            nodes = [] if node_list == "set()" else sorted(ast.literal_eval(node_list))
+            return ExtractedNodes(nodes=nodes[:10])
+
+        def reason(inputs):
+            content = str(inputs["content"])
+            # About a third of the sources are judged irrelevant, like the real model tends to
+            if _digest(content) % 3 == 0:
+                return "IRRELEVANT"
+            return "Relevant because: " + content[:300]
+
+        def steps(inputs):
+            text = str(inputs.get("bug_report") or inputs.get("s2r"))
+            words = re.findall(r"\w+", text)
+            return "\n".join(f"{i + 1}. Do " + " ".join(words[i * 5:i * 5 + 5]) for i in range(min(12, len(words) // 5 + 1)))
+
+        def enhance(inputs):
+            return str(inputs["s2r"]) + "\n" + str(inputs["suggestions"])[:200]
+
+        def cluster(inputs):
+            lines = [line for line in str(inputs["bug_report"]).splitlines() if line.strip()]
+            return StepClusterList(step_clusters=[
+                StepCluster(title=f"Cluster {i // 4 + 1}", steps=lines[i:i + 4]) for i in range(0, len(lines), 4)
+            ])
+
+        def rewrite_clusters(inputs):
+            clusters = inputs.get("step_clusters") or inputs.get("bug_report")
+            return StepClusterList(step_clusters=[
+                StepCluster(title=c["title"], steps=list(c["steps"])) for c in clusters.values()
+            ])
+
+        def select_step(inputs):
+            image_digest = _digest(inputs["image_data"])
+            return StepSelection(
+                annotation=f"Frame {image_digest % 10000}",
+                reasoning="Matches the closest step cluster.",
+                conclusion=str(image_digest % 3 + 1) if image_digest % 5 else "NOT RELEVANT",
+            )
+
+        def select_steps(inputs):
+            # One selection per image part of the batch message, or per frame of the mosaic
+            if "images" in inputs:
+                images = [part["image_url"]["url"] for message in inputs["images"] for part in message.content if part["type"] == "image_url"]
+            else:
+                images = [f"{inputs['image_data']}:{i}" for i in range(inputs["frame_count"])]
+            return StepSelectionList(selections=[select_step({"image_data": image_data}) for image_data in images])
+
+        def summarize(inputs):
+            return (str(inputs["previous_summary"]) + " " + str(inputs["current_frame"]))[-500:]
+
+        def search(query):
+            return [{"url": f"https://example.com/{_digest(query) % 1000}/{i}", "content": f"{query} result {i}"} for i in range(5)]
+
+        fakes = {
+            "node_extract_chain": extract_nodes,
+            "node_distill_chain": distill_nodes,
+            "reasoning_trajectory_chain": reason,
+            "query_chain": lambda inputs: repr(["minecraft " + w for w in re.findall(r"[A-Z][a-z]+", str(inputs["bug_report"]))[:3]]),
+            "judge_chain": lambda inputs: JudgmentModel(reasoning="Enough context.", point=8),
+            "s2r_chain": steps,
+            "alternate_soln_chain": steps,
+            "mob_checker_chain": steps,
+            "crash_checker_chain": lambda inputs: BooleanModel(decision="NO"),
+            "enhance_s2r_chain": enhance,
+            "step_cluster_chain": cluster,
+            "cluster_check_chain": lambda inputs: "The steps are placed correctly.",
+            "cluster_rewrite_chain": rewrite_clusters,
+            "step_selection_chain": select_step,
+            "video_step_chain": select_step,
+            "batch_step_selection_chain": select_steps,
+            "video_mosaic_step_chain": select_steps,
+            "running_summary_chain": summarize,
+            "final_cluster_chain": rewrite_clusters,
+        }
+        chains = {name: self.chain(name, respond) for name, respond in fakes.items()}
+        chains["search_tool"] = self.chain("search_tool", search)
+        return chains
+
+    def install(self, module):
+        """
+        Replaces the chains of a module that star-imports step_synth.chains, e.g. step_synth.analyze.
+
+        Returns:
+            A function that restores the original chains.
+        """
+        originals = {}
+        for name, fake in self.fakes().items():
+            if hasattr(module, name):
+                originals[name] = getattr(module, name)
+                setattr(module, name, fake)
+
+        def restore():
+            for name, original in originals.items():
+                setattr(module, name, original)
+        return restore
+
+def _digest(value):
+    return int(hashlib.md5(str(value).encode("utf-8")).hexdigest()[:8], 16)
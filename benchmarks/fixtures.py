@@ -0,0 +1,152 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoClip
+
+# Words the synthetic wiki titles and bug reports are built from, so that
+# the fuzzy title matching has realistic hits and near misses.
+VOCABULARY = [
+    "Creeper", "Zombie", "Skeleton", "Enderman", "Villager", "Piglin", "Warden", "Allay", "Axolotl", "Bee",
+    "Redstone", "Piston", "Observer", "Hopper", "Dropper", "Dispenser", "Comparator", "Repeater", "Lever", "Rail",
+    "Nether", "End", "Overworld", "Portal", "Beacon", "Conduit", "Anvil", "Enchanting", "Brewing", "Potion",
+    "Chest", "Barrel", "Shulker", "Elytra", "Trident", "Crossbow", "Shield", "Totem", "Lantern", "Campfire",
+    "Block", "Item", "Entity", "Biome", "Structure", "Village", "Stronghold", "Mansion", "Monument", "Bastion",
+    "Water", "Lava", "Ice", "Snow", "Sand", "Gravel", "Obsidian", "Bedrock", "Glass", "Slime",
+]
+FILLER = [
+    "the", "when", "after", "player", "places", "breaks", "does", "not", "appear", "spawns",
+    "inside", "near", "while", "flying", "sneaking", "world", "reloading", "chunk", "server", "client",
+]
+# Pages process_wiki always asks for
+FIXED_TITLES = ["Game mode", "Commands", "Game rule", "Experiments", "Java Edition 1_21"]
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+def make_titles(count, seed=0):
+    """Returns `count` distinct wiki titles of one to three vocabulary words."""
+    rng = random.Random(seed)
+    titles = list(FIXED_TITLES)
+    seen = set(titles)
+    while len(titles) < count:
+        title = " ".join(rng.sample(VOCABULARY, rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            title += f" ({rng.choice(['block', 'item', 'mob', 'Java Edition'])})"
+        if title not in seen:
+            seen.add(title)
+            titles.append(title)
+    return titles
+
+def make_text(words, seed=0, topic=None):
+    """Returns random vocabulary and filler words. A page about a topic, given as a list of words, mentions it every tenth word or so."""
+    rng = random.Random(seed)
+    def word():
+        if topic and rng.random() < 0.1:
+            return rng.choice(topic)
+        return rng.choice(VOCABULARY) if rng.random() < 0.25 else rng.choice(FILLER)
+    return " ".join(word() for _ in range(words))
+
+def make_wiki(directory, pages, page_words=400, seed=0):
+    """
+    Writes a synthetic wiki in the layout WIKI_DIRECTORY expects, one <title>.txt per page.
+
+    Returns:
+        The list of page titles.
+    """
+    os.makedirs(directory, exist_ok=True)
+    titles = make_titles(pages, seed)
+    for i, title in enumerate(titles):
+        with open(os.path.join(directory, f"{title}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{title}\n\n{make_text(page_words, seed + i, title.split())}")
+    return titles
+
+def make_bug_report(words, seed=0):
+    """Returns a bug description in the format main.build_bug_description produces."""
+    rng = random.Random(seed)
+    title = " ".join(rng.sample(VOCABULARY, 3)) + " " + " ".join(rng.sample(FILLER, 4))
+    description = make_text(words, seed)
+    return f"Version: 1.21\nTitle: {title}\nDescription: {description}"
+
+def _timestamp(moment):
+    return moment.strftime(TIMESTAMP_FORMAT)[:-3] + "+0000"
+
+def make_issue(path, histories, comments, attachments, seed=0):
+    """
+    Writes a synthetic issue.json with a changelog of `histories` entries, the last
+    quarter of them authored by staff, plus comments and attachments spread over the same period.
+    """
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+    def moment():
+        return start + timedelta(seconds=rng.randint(0, 365 * 24 * 3600), milliseconds=rng.randint(0, 999))
+
+    fields = {
+        "summary": make_text(8, seed),
+        "description": make_text(120, seed + 1),
+        "versions": [{"name": "Minecraft 1.21"}],
+        "labels": ["synthetic"],
+        "priority": "Normal",
+        "comment": {"comments": []},
+        "attachment": [],
+    }
+    changelog = []
+    for i in range(histories):
+        author = ("[Mod] " if i >= histories * 3 // 4 else "") + f"user{rng.randint(0, 50)}"
+        field = rng.choice(["summary", "description", "labels", "priority", "resolution"])
+        changelog.append({
+            "id": str(1000 + i),
+            "author": {"displayName": author},
+            "created": _timestamp(moment()),
+            "items": [{"field": field, "fromString": make_text(6, seed + i) if rng.random() < 0.8 else None, "toString": make_text(6, seed - i)}],
+        })
+    for i in range(comments):
+        fields["comment"]["comments"].append({
+            "author": {"displayName": f"user{rng.randint(0, 50)}"},
+            "created": _timestamp(moment()),
+            "body": make_text(40, seed + 10000 + i),
+        })
+    for i in range(attachments):
+        fields["attachment"].append({
+            "author": {"displayName": f"user{rng.randint(0, 50)}"},
+            "created": _timestamp(moment()),
+            "filename": f"attachment_{i}.png",
+        })
+    # Shuffled like the exports, the backtrace has to sort everything itself
+    rng.shuffle(changelog)
+    issue = {"key": f"MC-{seed}", "fields": fields, "changelog": {"histories": changelog}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(issue, f)
+    return path
+
+def make_image(path, size=(1280, 720), seed=0):
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)).save(path)
+    return path
+
+def make_video(path, seconds, size=(640, 360), fps=24, static_every=3):
+    """
+    Writes a synthetic video of moving gradients. Every `static_every`-th second shows
+    the same picture as the second before it, like a paused game.
+    """
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+
+    def make_frame(t):
+        second = int(t)
+        if static_every and second % static_every == static_every - 1:
+            second -= 1
+        phase = second * 0.7 + (t - int(t)) * 0.1
+        frame = np.stack([
+            (x * 255 // max(width - 1, 1) + int(phase * 40)) % 256,
+            (y * 255 // max(height - 1, 1) + int(phase * 25)) % 256,
+            ((x + y) // 4 + int(phase * 60)) % 256,
+        ], axis=-1)
+        return frame.astype(np.uint8)
+
+    clip = VideoClip(make_frame, duration=seconds)
+    clip.write_videofile(path, fps=fps, codec="libx264", audio=False, logger=None)
+    clip.close()
+    return path
@@ -0,0 +1,109 @@
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from benchmarks.fake_llm import FakeLLM
+
+def load_bug_reports(bug_reports_folder, limit):
+    """Returns the bug descriptions main.py would build for the first issues of a bug_reports folder."""
+    from issue_store import extract_issue, format_bug_description
+
+    bug_reports = []
+    for dirpath, dirnames, filenames in sorted(os.walk(bug_reports_folder)):
+        if "issue.json" in filenames and len(bug_reports) < limit:
+            try:
+                bug_reports.append(format_bug_description(extract_issue(os.path.join(dirpath, "issue.json"))))
+            except Exception as e:
+                print(f"Skipping {dirpath}: {e}")
+    return bug_reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the wiki candidate pages and latency of the WIKI_RETRIEVAL_MODE settings "
+                                                 "against the entity extraction and fuzzy matching path.")
+    parser.add_argument("--pages", type=int, default=5000, help="Number of synthetic wiki pages.")
+    parser.add_argument("--page-words", type=int, default=300, help="Words per synthetic wiki page.")
+    parser.add_argument("--reports", type=int, default=30, help="Number of synthetic bug reports.")
+    parser.add_argument("--report-words", type=int, default=300, help="Words per synthetic bug report.")
+    parser.add_argument("--top-k", type=int, default=20, help="WIKI_RETRIEVAL_TOP_K.")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds the fake entity extraction call takes.")
+    parser.add_argument("--workdir", help="Directory for the synthetic wiki, kept between runs. Defaults to a temporary directory.")
+    parser.add_argument("--wiki-directory", help="Use this wiki instead of a synthetic one.")
+    parser.add_argument("--bug-reports", help="Use the issues of this bug_reports folder instead of synthetic bug reports.")
+    parser.add_argument("--live-llm", action="store_true", help="Extract the entities with the real node_extract_chain instead of the fake one.")
+    args = parser.parse_args()
+
+    if args.wiki_directory and not os.path.isdir(args.wiki_directory):
+        parser.error(f"{args.wiki_directory} is not a folder")
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="step_synth_retrieval_")
+    wiki_directory = os.path.abspath(args.wiki_directory) if args.wiki_directory else os.path.join(workdir, f"wiki_{args.pages}x{args.page_words}")
+    if not os.path.isdir(wiki_directory):
+        print(f"Generating {args.pages} wiki pages in {wiki_directory}")
+        fixtures.make_wiki(wiki_directory, args.pages, args.page_words)
+    if args.bug_reports:
+        bug_reports = load_bug_reports(args.bug_reports, args.reports)
+    else:
+        bug_reports = [fixtures.make_bug_report(args.report_words, seed=seed) for seed in range(args.reports)]
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from step_synth.logger import logger
+        from step_synth.wiki_index import get_title_index
+        from step_synth.wiki_retrieval import get_bm25_index
+
+        if args.live_llm:
+            from step_synth.chains import node_extract_chain as extract_nodes
+        else:
+            extract_nodes = FakeLLM(latency=args.llm_latency).fakes()["node_extract_chain"]
+        start = time.perf_counter()
+        title_index = get_title_index(wiki_directory)
+        bm25_index = get_bm25_index(wiki_directory)
+        print(f"Loaded the title and BM25 indexes in {time.perf_counter() - start:.2f}s")
+
+        seconds = {"llm": [], "bm25": [], "hybrid": []}
+        recalls = {"bm25": [], "hybrid": []}
+        candidates = {"llm": [], "bm25": [], "hybrid": []}
+        for bug_report in bug_reports:
+            start = time.perf_counter()
+            nodes = extract_nodes.invoke({"bug_report": bug_report}).nodes
+            matches = title_index.find_matches(str(nodes))
+            seconds["llm"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ranked = bm25_index.rank(bug_report, args.top_k)
+            seconds["bm25"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            narrowed = bm25_index.narrow(bug_report, matches, args.top_k)
+            seconds["hybrid"].append(seconds["llm"][-1] + time.perf_counter() - start)
+
+            candidates["llm"].append(len(matches))
+            candidates["bm25"].append(len(ranked))
+            candidates["hybrid"].append(len(narrowed))
+            # Recall against the pages the current path hands to the distillation call
+            if matches:
+                recalls["bm25"].append(len(matches & set(ranked)) / len(matches))
+                recalls["hybrid"].append(len(narrowed) / len(matches))
+
+        print(f"\n{'mode':<8} {'median latency':>15} {'LLM calls':>10} {'candidates':>11} {'recall vs llm':>14}")
+        for mode in ("llm", "bm25", "hybrid"):
+            recall = f"{statistics.mean(recalls[mode]):.2f}" if recalls.get(mode) else "-"
+            print(f"{mode:<8} {statistics.median(seconds[mode]) * 1000:>13.1f}ms {0 if mode == 'bm25' else 1:>10} "
+                  f"{statistics.mean(candidates[mode]):>11.1f} {recall:>14}")
+        logger.close()
+    finally:
+        os.chdir(previous_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
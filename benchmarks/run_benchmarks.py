@@ -0,0 +1,388 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from benchmarks.fake_llm import FakeLLM
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Fixture sizes per suite size. Bug reports are in words, videos are (seconds, (width, height)).
+SIZES = {
+    "small": {
+        "wiki_pages": 500,
+        "page_words": 200,
+        "bug_reports": [100, 1000],
+        "videos": [(5, (640, 360))],
+        "issues": [(50, 20, 5)],
+        "images": 2,
+    },
+    "large": {
+        "wiki_pages": 5000,
+        "page_words": 400,
+        "bug_reports": [100, 1000, 5000],
+        "videos": [(5, (640, 360)), (20, (1280, 720))],
+        "issues": [(50, 20, 5), (2000, 500, 100)],
+        "images": 8,
+    },
+}
+
+# Flags pinned for every benchmark run so the numbers do not depend on the local .env
+PINNED_ENV = {
+    "USE_WIKI": "True",
+    "USE_SEARCH": "False",
+    "USE_MOB_CHECKER": "True",
+    "USE_REASONING_TRAJECTORY": "True",
+    "USE_ALTERNATE_SOLUTIONS": "False",
+    "USE_FINAL_CLUSTERING": "True",
+    "USE_PARALLEL_ENHANCE_S2R": "False",
+    "SEARCH_BACKEND": "stub",
+    "SEARCH_CONCURRENCY": "5",
+    "USE_SEARCH_CACHE": "False",
+    "USE_WIKI_CORPUS": "True",
+    "WIKI_RETRIEVAL_MODE": "llm",
+    "CONTEXT_TOKEN_BUDGET": "0",
+    "CONTEXT_TOKEN_BUDGETS": "",
+    "VIDEO_FRAME_MAX_SIZE": "1024",
+    "VIDEO_FRAME_FORMAT": "JPEG",
+    "VIDEO_FRAME_QUALITY": "85",
+    "VIDEO_KEYFRAME_THRESHOLD": "5",
+    "VIDEO_SCENE_CUT_THRESHOLD": "20",
+    "VIDEO_MAX_KEYFRAMES": "30",
+    "IMAGE_BATCH_SIZE": "1",
+    "VIDEO_MOSAIC_FRAMES": "1",
+    "ATTACHMENT_WORKERS": "4",
+    "IMAGE_MAX_SIZE": "1024",
+    "LLM_CACHE_MODE": "off",
+    "LLM_BACKEND": "live",
+}
+
+def build_fixtures(workdir, size):
+    """
+    Generates the synthetic wiki, bug reports, issues, images and videos of a suite size,
+    reusing the ones a previous run left in the same working directory.
+
+    Returns:
+        A dictionary describing the generated fixtures.
+    """
+    sizes = SIZES[size]
+    marker = os.path.join(workdir, f"fixtures_{size}.json")
+    if os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    print(f"Generating {size} fixtures in {workdir}")
+    wiki_directory = os.path.join(workdir, f"wiki_{size}")
+    titles = fixtures.make_wiki(wiki_directory, sizes["wiki_pages"], sizes["page_words"])
+
+    issues_directory = os.path.join(workdir, "issues")
+    os.makedirs(issues_directory, exist_ok=True)
+    issues = []
+    for histories, comments, attachments in sizes["issues"]:
+        path = os.path.join(issues_directory, f"issue_{histories}.json")
+        if not os.path.exists(path):
+            fixtures.make_issue(path, histories, comments, attachments, seed=histories)
+        issues.append({"histories": histories, "path": path})
+
+    media_directory = os.path.join(workdir, "media")
+    os.makedirs(media_directory, exist_ok=True)
+    videos = []
+    for seconds, (width, height) in sizes["videos"]:
+        path = os.path.join(media_directory, f"video_{seconds}s_{width}x{height}.mp4")
+        if not os.path.exists(path):
+            fixtures.make_video(path, seconds, (width, height))
+        videos.append({"name": f"{seconds}s_{width}x{height}", "path": path})
+    images = []
+    for i in range(sizes["images"]):
+        path = os.path.join(media_directory, f"image_{i}.png")
+        if not os.path.exists(path):
+            fixtures.make_image(path, seed=i)
+        images.append(path)
+
+    fixture_info = {
+        "size": size,
+        "wiki_directory": wiki_directory,
+        "titles": titles,
+        "bug_reports": {str(words): fixtures.make_bug_report(words, seed=words) for words in sizes["bug_reports"]},
+        "issues": issues,
+        "videos": videos,
+        "images": images,
+    }
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(fixture_info, f)
+    return fixture_info
+
+def build_cases(fixture_info, fake_llm):
+    """
+    Returns the benchmark cases as (name, function) pairs. The functions take no arguments;
+    everything they need is prepared here so that only the benchmarked call is measured.
+    """
+    # Imported late, WIKI_DIRECTORY and the pinned flags have to be set first
+    from step_synth import analyze, context, utils, wiki_corpus, wiki_index, wiki_retrieval
+    from step_synth.cli import FileProcessor
+    from backtrace import IssueHistory, backtrace
+
+    def backtrace_every_step(path):
+        return IssueHistory.from_file(path).backtrace_all()
+
+    def with_settings(function, **settings):
+        """Runs a function with step_synth.analyze settings overridden, e.g. a batch size."""
+        originals = {name: getattr(analyze, name) for name in settings}
+        for name, value in settings.items():
+            setattr(analyze, name, value)
+        try:
+            return function()
+        finally:
+            for name, value in originals.items():
+                setattr(analyze, name, value)
+
+    cases = []
+    titles = fixture_info["titles"]
+    title_index = utils.WikiTitleIndex(titles)
+    cases.append((f"WikiTitleIndex[pages={len(titles)}]", lambda: utils.WikiTitleIndex(titles)))
+    # The first run writes the index file next to the fixture wiki, the timed runs load it
+    cases.append((f"get_filenames_from_folder[pages={len(titles)}]", lambda: utils.get_filenames_from_folder(fixture_info["wiki_directory"])))
+    cases.append((f"load_title_index[pages={len(titles)}]", lambda: wiki_index.load_title_index(fixture_info["wiki_directory"])))
+    # Every issue reads its distilled pages plus the pages process_wiki always appends
+    common_pages = ["Java Edition 1_21", titles[0], titles[1], titles[2], titles[3]]
+    page_batches = [titles[i * 10:i * 10 + 10] + common_pages for i in range(50)]
+    cases.append((f"read_files[batches={len(page_batches)}]",
+                  lambda: [utils.read_files(fixture_info["wiki_directory"], batch) for batch in page_batches]))
+    cases.append((f"read_wiki_pages[batches={len(page_batches)}]",
+                  lambda: [wiki_corpus.read_wiki_pages(fixture_info["wiki_directory"], batch) for batch in page_batches]))
+    extract_nodes = fake_llm.fakes()["node_extract_chain"]
+
+    for words, bug_report in fixture_info["bug_reports"].items():
+        nodes = str(extract_nodes.invoke({"bug_report": bug_report}).nodes)
+        cases.append((f"find_matches[pages={len(titles)},report={words}]", lambda nodes=nodes: utils.find_matches(titles, nodes)))
+        cases.append((f"WikiTitleIndex.find_matches[pages={len(titles)},report={words}]",
+                      lambda nodes=nodes: title_index.find_matches(nodes)))
+
+        cases.append((f"rank_wiki_pages[pages={len(titles)},report={words}]",
+                      lambda bug_report=bug_report: wiki_retrieval.rank_wiki_pages(fixture_info["wiki_directory"], bug_report, 20)))
+
+        pages = utils.read_files(fixture_info["wiki_directory"], titles[:20])
+        cases.append((f"prepare_br[report={words},pages=20]", lambda bug_report=bug_report, pages=pages: utils.prepare_br(bug_report, pages)))
+        # The assembled context is cached per prompt, clear it so every run assembles it again
+        cases.append((f"prepare_context[report={words},pages=20,budget=4000]",
+                      lambda bug_report=bug_report, pages=pages: (context._assemble.cache_clear(),
+                                                                  context.prepare_context(bug_report, pages, "s2r_chain", 4000))))
+
+        # The search tool is faked as well, with the same latency as the chains
+        cases.append((f"search_iterations[report={words}]", lambda bug_report=bug_report, pages=pages: analyze.search_iterations(bug_report, pages)))
+
+        # Both with the alternate solutions, the path where the parallel variant saves the most round trips
+        s2r = "\n".join(f"{i + 1}. Step" for i in range(10))
+        cases.append((f"enhance_s2r[report={words}]",
+                      lambda bug_report=bug_report, pages=pages: with_settings(lambda: analyze.enhance_s2r(s2r, pages, bug_report),
+                                                                                USE_ALTERNATE_SOLUTIONS=True)))
+        cases.append((f"aenhance_s2r[report={words}]",
+                      lambda bug_report=bug_report, pages=pages: with_settings(lambda: asyncio.run(analyze.aenhance_s2r(s2r, pages, bug_report)),
+                                                                                USE_ALTERNATE_SOLUTIONS=True)))
+
+        if analyze.USE_ASYNC_STAGES:
+            cases.append((f"process_wiki[report={words}]", lambda bug_report=bug_report: asyncio.run(analyze.aprocess_wiki(bug_report, "1.21", title_index))))
+        else:
+            cases.append((f"process_wiki[report={words}]", lambda bug_report=bug_report: analyze.process_wiki(bug_report, "1.21", title_index)))
+
+    for video in fixture_info["videos"]:
+        cases.append((f"get_first_frames_each_second_as_base64[{video['name']}]",
+                      lambda path=video["path"]: utils.get_first_frames_each_second_as_base64(path)))
+        # Consumed one frame at a time, like evaluate_videos does
+        cases.append((f"iter_video_frames[{video['name']}]",
+                      lambda path=video["path"]: sum(len(frame["base64"]) for frame in utils.iter_video_frames(path))))
+        # The LLM calls of the case show how many frames were analysed
+        cases.append((f"evaluate_videos[{video['name']}]",
+                      lambda path=video["path"]: analyze.evaluate_videos([], [], ["video_0"], {"video_0": path})))
+        cases.append((f"evaluate_videos[{video['name']},mosaic=4]",
+                      lambda path=video["path"]: with_settings(lambda: analyze.evaluate_videos([], [], ["video_0"], {"video_0": path}),
+                                                               VIDEO_MOSAIC_FRAMES=4)))
+
+    staged_images = {f"image_{i}": image_path for i, image_path in enumerate(fixture_info["images"])}
+    for batch_size in (1, 4):
+        cases.append((f"evaluate_images[images={len(staged_images)},batch={batch_size}]",
+                      lambda batch_size=batch_size: with_settings(lambda: analyze.evaluate_images([], [], list(staged_images), staged_images),
+                                                                  IMAGE_BATCH_SIZE=batch_size)))
+
+    for issue in fixture_info["issues"]:
+        cases.append((f"backtrace[histories={issue['histories']}]",
+                      lambda path=issue["path"]: backtrace(path, None, None, True)))
+        cases.append((f"IssueHistory.backtrace[histories={issue['histories']},every step]",
+                      lambda path=issue["path"]: backtrace_every_step(path)))
+
+    file_processor = FileProcessor()
+    image_codes = []
+    for i, image_path in enumerate(fixture_info["images"]):
+        file_processor.staged_files[f"image_{i}"] = image_path
+        image_codes.append(f"image_{i}")
+    video = fixture_info["videos"][0]
+    file_processor.staged_files["video_0"] = video["path"]
+    words = sorted(fixture_info["bug_reports"], key=int)[-1]
+    bug_report = fixture_info["bug_reports"][words]
+    cases.append((f"FileProcessor.analyze[report={words},images={len(image_codes)},video={video['name']}]",
+                  lambda: file_processor.analyze([], bug_report, "1.21", ["video_0"], image_codes)))
+    # Same media passed as attachments, prepared on the attachment pool while the LLM stages run
+    attachment_paths = list(fixture_info["images"]) + [video["path"]]
+    cases.append((f"FileProcessor.analyze[report={words},attachments={len(attachment_paths)}]",
+                  lambda: file_processor.analyze(attachment_paths, bug_report, "1.21")))
+    return cases
+
+def measure(function, repeat, fake_llm):
+    """
+    Times `repeat` runs of a function, then runs it once more under tracemalloc for its peak memory.
+    Tracing slows Python down, so the timed runs are not traced.
+    """
+    from step_synth.logger import logger
+
+    seconds = []
+    for _ in range(repeat):
+        logger.messages.clear()
+        fake_llm.reset()
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    llm_calls = fake_llm.total_calls()
+
+    logger.messages.clear()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": repeat,
+        "min_seconds": min(seconds),
+        "median_seconds": statistics.median(seconds),
+        "peak_bytes": peak,
+        "llm_calls": llm_calls,
+    }
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Compares the results with a baseline and prints one line per case.
+
+    Returns:
+        The names of the cases that got slower or use more memory than the tolerances allow.
+    """
+    regressions = []
+    if baseline.get("config") != results["config"]:
+        print("Warning: the baseline was recorded with a different configuration, the comparison may be meaningless.")
+    print(f"\n{'case':<80} {'time':>10} {'memory':>10}")
+    for name, current in results["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            print(f"{name:<80} {'new':>10} {'new':>10}")
+            continue
+        time_ratio = current["median_seconds"] / previous["median_seconds"] if previous["median_seconds"] else 1.0
+        memory_ratio = current["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else 1.0
+        regressed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+        print(f"{name:<80} {time_ratio:>9.2f}x {memory_ratio:>9.2f}x{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the step synthesis functions against synthetic inputs with a fake LLM.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="Size of the synthetic fixtures.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case.")
+    parser.add_argument("--filter", default="", help="Only run the cases whose name contains this text.")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Seconds every fake LLM call sleeps, to model the API round trip.")
+    parser.add_argument("--async-stages", action="store_true", help="Benchmark with USE_ASYNC_STAGES enabled.")
+    parser.add_argument("--workdir", help="Directory for the fixtures. Kept between runs so they are only generated once. "
+                                          "Defaults to a temporary directory that is removed afterwards.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Allowed relative slowdown before a case counts as a regression.")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10, help="Allowed relative peak memory growth before a case counts as a regression.")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="step_synth_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    fixture_info = build_fixtures(workdir, args.size)
+
+    config = dict(PINNED_ENV)
+    config["USE_ASYNC_STAGES"] = str(args.async_stages)
+    config["WIKI_DIRECTORY"] = fixture_info["wiki_directory"]
+    os.environ.update(config)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+    # The step synthesis logger opens its log file in the working directory on import
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from step_synth import analyze
+        from step_synth.logger import logger
+
+        fake_llm = FakeLLM(latency=args.llm_latency)
+        restore = fake_llm.install(analyze)
+        try:
+            results = {
+                "created": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "config": {
+                    "size": args.size,
+                    "repeat": args.repeat,
+                    "llm_latency": args.llm_latency,
+                    "USE_ASYNC_STAGES": args.async_stages,
+                    "pinned_env": PINNED_ENV,
+                },
+                "cases": {},
+            }
+            for name, function in build_cases(fixture_info, fake_llm):
+                if args.filter not in name:
+                    continue
+                print(f"Running {name}")
+                results["cases"][name] = measure(function, args.repeat, fake_llm)
+                case = results["cases"][name]
+                print(f"    median {case['median_seconds']:.4f}s, min {case['min_seconds']:.4f}s, "
+                      f"peak {case['peak_bytes'] / 1024 / 1024:.1f} MiB, {case['llm_calls']} LLM calls")
+        finally:
+            restore()
+            logger.close()
+    finally:
+        os.chdir(previous_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output_path}")
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {baseline_path}")
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}, run with --save-baseline to record one.")
+        return
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {baseline_path}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
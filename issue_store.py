@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from backtrace import backtrace
+
+class IssueStoreError(Exception):
+    """Raised when an issue could not be ingested, carrying the error recorded at ingest time."""
+
+def extract_issue(issue_json):
+    """
+    Backtraces an issue to the last state before a staff edit and extracts what step synthesis needs from it.
+
+    Returns:
+        A dictionary with the change id, summary, description, version, comment bodies and attachment filenames.
+    """
+    change_id, final_state, comments, attachments = backtrace(issue_json, None, None, True)
+    return {
+        "change_id": change_id,
+        "summary": final_state["summary"],
+        "description": final_state["description"],
+        "version": final_state["versions"][0]["name"].removeprefix("Minecraft").strip(),
+        "comments": [comment["body"] for comment in comments],
+        "attachments": [attachment.get("filename") for attachment in attachments],
+    }
+
+def format_bug_description(issue):
+    """Renders an extracted issue as the bug description given to the step synthesizer."""
+    bug_description = f"Version: {issue['version']}\nTitle: {issue['summary']}\nDescription: {issue['description']}"
+    for i, comment in enumerate(issue["comments"]):
+        bug_description += f"\nComment {i + 1}: {comment}\n"
+    return bug_description
+
+class IssueStore:
+    """
+    SQLite store of the bug report corpus, holding only what a run needs per issue: the
+    pre-staff summary, description, version, comments and attachments, and the files next
+    to the issue.json. Built once by ingesting the bug_reports folder; later ingests only
+    re-read the issues whose issue.json or folder listing changed since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS issues (
+                issue_json TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                dir_mtime_ns INTEGER NOT NULL,
+                files TEXT NOT NULL,
+                issue TEXT,
+                error TEXT,
+                ingested REAL NOT NULL
+            )""")
+        self.connection.commit()
+
+    def ingest(self, root_folder):
+        """
+        Brings the store in line with the issue.json files under a folder. Issues whose file and
+        folder are unchanged since the last ingest are not read again, and issues that disappeared are removed.
+
+        Returns:
+            The number of added, updated, unchanged, removed and failed issues.
+        """
+        with self.lock:
+            known = {
+                row[0]: tuple(row[1:])
+                for row in self.connection.execute("SELECT issue_json, mtime_ns, size, dir_mtime_ns FROM issues")
+            }
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        seen = set()
+        rows = []
+        for dirpath, dirnames, filenames in os.walk(root_folder):
+            if "issue.json" not in filenames:
+                continue
+            issue_json = os.path.abspath(os.path.join(dirpath, "issue.json"))
+            seen.add(issue_json)
+            file_stat = os.stat(issue_json)
+            signature = (file_stat.st_mtime_ns, file_stat.st_size, os.stat(dirpath).st_mtime_ns)
+            if known.get(issue_json) == signature:
+                stats["unchanged"] += 1
+                continue
+
+            files = [os.path.abspath(os.path.join(dirpath, f)) for f in filenames if f != "issue.json"]
+            issue, error = None, None
+            try:
+                issue = json.dumps(extract_issue(issue_json), ensure_ascii=False)
+            except Exception:
+                error = traceback.format_exc()
+                stats["failed"] += 1
+            stats["updated" if issue_json in known else "added"] += 1
+            rows.append((issue_json, *signature, json.dumps(files), issue, error, time.time()))
+
+        removed = [(issue_json,) for issue_json in known if issue_json not in seen]
+        stats["removed"] = len(removed)
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("""
+                    INSERT OR REPLACE INTO issues (issue_json, mtime_ns, size, dir_mtime_ns, files, issue, error, ingested)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+                self.connection.executemany("DELETE FROM issues WHERE issue_json = ?", removed)
+        return stats
+
+    def issue_jsons(self):
+        """Returns the paths of all stored issues, sorted."""
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT issue_json FROM issues ORDER BY issue_json")]
+
+    def dir_contents(self):
+        """Returns the files next to every stored issue.json, like main.find_issue_json_files."""
+        with self.lock:
+            return {row[0]: json.loads(row[1]) for row in self.connection.execute("SELECT issue_json, files FROM issues")}
+
+    def get(self, issue_json):
+        """
+        Returns the extracted issue as produced by extract_issue.
+
+        Raises:
+            KeyError: If the issue is not in the store.
+            IssueStoreError: If the issue failed to ingest.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT issue, error FROM issues WHERE issue_json = ?", (issue_json,)).fetchone()
+        if row is None:
+            raise KeyError(f"{issue_json} is not in the issue store {self.path}")
+        if row[1] is not None:
+            raise IssueStoreError(f"{issue_json} failed to ingest:\n{row[1]}")
+        return json.loads(row[0])
+
+    def files(self, issue_json):
+        with self.lock:
+            row = self.connection.execute("SELECT files FROM issues WHERE issue_json = ?", (issue_json,)).fetchone()
+        if row is None:
+            raise KeyError(f"{issue_json} is not in the issue store {self.path}")
+        return json.loads(row[0])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the bug report corpus into an issue store for fast repeated runs.")
+    parser.add_argument("root_folder", nargs="?", default="./bug_reports", help="Folder with one subfolder per issue (default: ./bug_reports).")
+    parser.add_argument("--store", default="issue_store.sqlite", help="SQLite file of the store (default: issue_store.sqlite).")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = IssueStore(args.store)
+    stats = store.ingest(args.root_folder)
+    store.close()
+    print(f"Ingested {args.root_folder} into {args.store} in {time.perf_counter() - start:.1f}s: {stats}")
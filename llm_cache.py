@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from dotenv import load_dotenv
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core._api import LangChainBetaWarning
+
+load_dotenv()
+
+# loads() is marked beta, but the cache only ever reads back what dumps() wrote
+warnings.filterwarnings("ignore", category=LangChainBetaWarning, module=__name__)
+
+# "off" disables the cache, "read_only" serves cached responses without storing new ones,
+# "record" serves cached responses and stores every new one.
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "2048"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "0"))  # 0 means entries never expire
+
+# Set in the generation_info of every response served from the cache
+CACHE_HIT_KEY = "llm_cache_hit"
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Disk-backed LangChain cache for chat model responses, shared by every chain that uses ChatOpenAI.
+
+    Entries are keyed by a hash of the model parameters and the fully rendered messages. The rendered
+    messages include the base64 image payloads and the parser format instructions, so a different
+    image or output schema never hits a stale entry. The file is capped in size by evicting the least
+    recently used entries, and entries older than the TTL are treated as misses.
+    """
+
+    def __init__(self, path, mode="record", max_bytes=None, ttl_seconds=None):
+        if mode not in ("read_only", "record"):
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    @staticmethod
+    def make_key(prompt, llm_string):
+        digest = hashlib.sha256()
+        digest.update(llm_string.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                if self.mode == "record":
+                    self.connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self.counters["hits"] += 1
+            if self.mode == "record":
+                self.connection.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        generations = [loads(generation) for generation in json.loads(row[0])]
+        for generation in generations:
+            # Lets the stage timer tell cached responses from model calls
+            generation.generation_info = {**(generation.generation_info or {}), CACHE_HIT_KEY: True}
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        if self.mode != "record":
+            return
+        key = self.make_key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now))
+            self.counters["writes"] += 1
+            if self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.connection.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.counters["evictions"] += 1
+
+    def clear(self, **kwargs):
+        with self.lock:
+            self.connection.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "mode": self.mode,
+            "entries": entries,
+            "bytes": size,
+            "hit_rate": stats["hits"] / lookups if lookups else None,
+        })
+        return stats
+
+def configure_llm_cache():
+    """
+    Installs the disk cache as the global LangChain LLM cache according to the LLM_CACHE_* settings.
+    Safe to call from every chains module; the cache is only created once.
+
+    Returns:
+        The active SQLiteLLMCache, or None if caching is off.
+    """
+    if LLM_CACHE_MODE == "off":
+        return None
+    llm_cache = get_llm_cache()
+    if isinstance(llm_cache, SQLiteLLMCache):
+        return llm_cache
+    llm_cache = SQLiteLLMCache(
+        LLM_CACHE_PATH,
+        mode=LLM_CACHE_MODE,
+        max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024) if LLM_CACHE_MAX_MB > 0 else None,
+        ttl_seconds=LLM_CACHE_TTL_HOURS * 3600 if LLM_CACHE_TTL_HOURS > 0 else None,
+    )
+    set_llm_cache(llm_cache)
+    return llm_cache
+
+def llm_cache_stats():
+    """Returns the counters of the active cache, or None if caching is off."""
+    llm_cache = get_llm_cache()
+    return llm_cache.stats() if isinstance(llm_cache, SQLiteLLMCache) else None
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, List, Optional
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+# "live" calls the API, "record" calls the API and writes every call to the trace file,
+# "replay" serves the calls from the trace file without touching the network.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "live").lower()
+LLM_TRACE_PATH = os.getenv("LLM_TRACE_PATH", "llm_trace.jsonl")
+# Multiplier applied to the recorded latency when replaying, 0 answers immediately
+LLM_REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "0"))
+
+class ReplayMissError(KeyError):
+    """Raised when a replayed call has no recorded response in the trace."""
+
+def message_key(model_name, messages):
+    """
+    Hashes a model name and the rendered messages of one call.
+    The recorder and the replay backend use it to line up calls.
+    """
+    rendered = json.dumps([[message.type, message.content] for message in messages], sort_keys=True)
+    digest = hashlib.sha256()
+    digest.update(str(model_name).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(rendered.encode("utf-8"))
+    return digest.hexdigest()
+
+class TraceRecorder(BaseCallbackHandler):
+    """Appends every call of the model it is attached to, with its response and latency, to a JSONL trace."""
+
+    _file_lock = threading.Lock()
+
+    def __init__(self, trace_path, model_name):
+        self.trace_path = trace_path
+        self.model_name = model_name
+        self.pending = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.pending[run_id] = (message_key(self.model_name, messages[0]), messages[0], time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id not in self.pending:
+            return
+        key, messages, start = self.pending.pop(run_id)
+        record = {
+            "key": key,
+            "model": self.model_name,
+            "messages": [[message.type, message.content] for message in messages],
+            "response": response.generations[0][0].message.content,
+            "latency": time.perf_counter() - start,
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._file_lock:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.pending.pop(run_id, None)
+
+class ReplayTrace:
+    """
+    Recorded responses grouped by call key. A key that was recorded several times
+    is served in recording order, repeating the last response once exhausted.
+    """
+
+    def __init__(self, trace_path):
+        self.responses = {}
+        self.served = {}
+        self.lock = threading.Lock()
+        with open(trace_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses.setdefault(record["key"], []).append((record["response"], record.get("latency", 0.0)))
+
+    def next_response(self, key):
+        with self.lock:
+            if key not in self.responses:
+                raise ReplayMissError(f"No recorded response for call {key}")
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+            responses = self.responses[key]
+            return responses[min(index, len(responses) - 1)]
+
+_replay_trace = None
+_replay_trace_lock = threading.Lock()
+
+def get_replay_trace():
+    global _replay_trace
+    with _replay_trace_lock:
+        if _replay_trace is None:
+            _replay_trace = ReplayTrace(LLM_TRACE_PATH)
+        return _replay_trace
+
+class ReplayChatModel(BaseChatModel):
+    """Offline stand-in for ChatOpenAI that answers from a recorded trace, optionally with simulated latency."""
+
+    model_name: str
+    latency_scale: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        response, latency = get_replay_trace().next_response(message_key(self.model_name, messages))
+        if self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    async def _agenerate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        response, latency = get_replay_trace().next_response(message_key(self.model_name, messages))
+        if self.latency_scale > 0:
+            await asyncio.sleep(latency * self.latency_scale)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+def make_chat_model(**kwargs):
+    """
+    Creates the chat model for a chain according to LLM_BACKEND.
+    Takes the same keyword arguments as ChatOpenAI.
+    """
+    model_name = kwargs.get("model_name") or kwargs.get("model")
+    if LLM_BACKEND == "replay":
+        return ReplayChatModel(model_name=model_name, latency_scale=LLM_REPLAY_LATENCY_SCALE)
+    if LLM_BACKEND == "record":
+        kwargs["callbacks"] = list(kwargs.get("callbacks") or []) + [TraceRecorder(LLM_TRACE_PATH, model_name)]
+    return ChatOpenAI(**kwargs)
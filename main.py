@@ -1,7 +1,15 @@
 from step_synth.cli import FileProcessor
 from action_model.action_model_agent import ready_apis
-from backtrace import backtrace
+from issue_store import IssueStore, extract_issue, format_bug_description
 from action_model.macro_api import run_api as macro_run
+from pipeline import run_pipeline
+from run_manifest import RunManifest, run_config, code_version
+from result_sink import ResultSink, rebuild_legacy_log
+from stage_timer import RunTimer, stage
+from llm_cache import llm_cache_stats
+from step_synth.search import search_cache_stats
+from step_synth.wiki_corpus import wiki_corpus_stats
+from work_queue import WorkQueue, run_worker, default_worker_id, SYNTHESIS_STAGE, REPRODUCTION_STAGE
 import os
 import threading
 import re
@@ -94,102 +102,306 @@ def dict_to_array(data):
     })
   return result
 
+error_lock = threading.Lock()
+
+def record_error(counts, key, message):
+    """
+    Prints the current exception, appends it to error_counts.txt and bumps the given counter.
+    Safe to call from the synthesis worker threads.
+    """
+    error_trace = traceback.format_exc()  # Get full stack trace
+    print(f"{message}:\n{error_trace}")
+    with error_lock:
+        counts[key] += 1
+        with open("error_counts.txt", "a") as f:
+            f.write(f"{message}:\n{error_trace}\n")
+    return error_trace
+
+def build_bug_description(issue_json, store=None):
+    """
+    Backtraces an issue to the last state before a staff edit and renders it as a bug description.
+
+    Args:
+        issue_json: Path to the issue.json file.
+        store: Optional IssueStore to read the already backtraced issue from.
+
+    Returns:
+        A tuple of the bug description text and the affected Minecraft version.
+    """
+    with stage("backtrace"):
+        issue = store.get(issue_json) if store else extract_issue(issue_json)
+    return format_bug_description(issue), issue["version"]
+
+def synthesize_issue(file_processor, issue_json, dir_contents, counts, manifest=None, store=None, with_attachments=False):
+    """
+    Runs the step synthesis stage for one issue. Failures are recorded in the run manifest if one is given.
+    The issue is read from the issue store if one is given. With with_attachments, the files next to the
+    issue are unpacked and their images and videos evaluated, prepared while the LLM stages run.
+
+    Returns:
+        A tuple of the log entry for step_clusters_log.json and the issue version,
+        or None if the issue failed.
+    """
+    try:
+        bug_description, version = build_bug_description(issue_json, store)
+    except Exception:
+        error_trace = record_error(counts, "file_processor_errors", f"Error processing {issue_json}")
+        if manifest:
+            manifest.mark_failed(issue_json, "backtrace", error_trace)
+        return None
+    try:
+        print(f"Processing: {issue_json}")
+        print(bug_description)
+        file_paths = dir_contents[issue_json]
+        print(f"Processing files: {file_paths}")
+
+        # process_files returns the worlds and datapacks directly instead of storing them
+        # on the processor, so several issues can be synthesized at the same time.
+        step_clusters, worlds, datapacks = file_processor.process_files([], [], bug_description, version, {}, file_paths if with_attachments else None)
+        step_clusters = dict_to_array(step_clusters)
+        print(f"Step clusters: {step_clusters}")
+    except Exception:
+        error_trace = record_error(counts, "analyze_errors", f"Error in file_processor.analyze for {issue_json}")
+        if manifest:
+            manifest.mark_failed(issue_json, "analyze", error_trace)
+        return None
+
+    log_entry = {
+        "issue-json": issue_json,
+        "bug_description": bug_description,
+        "step_clusters": step_clusters,
+        "worlds": worlds,
+        "datapacks": datapacks
+    }
+    return log_entry, version
+
+def reproduce_issue(log_entry, version, counts, manifest=None):
+    """
+    Runs the action model on the synthesized step clusters of one issue, then tears the game down.
+    Must only be called from one thread at a time since there is a single game slot.
+
+    Returns:
+        The log entry extended with whether the reproduction succeeded.
+    """
+    issue_json = log_entry["issue-json"]
+    error_trace = None
+    try:
+        release_version = convert_version_string(version)
+        issue_name = os.path.basename(os.path.dirname(issue_json))
+        with stage("ready_apis"):
+            success = ready_apis(
+                log_entry["step_clusters"],
+                release_version,
+                issue_name,
+                worlds=None,
+                datapacks=None
+            )
+        if success:
+            counts["all_success"] += 1
+    except Exception:
+        error_trace = record_error(counts, "ready_apis_errors", f"Error in ready_apis for {issue_json}")
+    with stage("teardown"):
+        kill_all_processes_except_cmd_python()
+    if manifest:
+        if error_trace:
+            manifest.mark_failed(issue_json, "ready_apis", error_trace)
+        else:
+            manifest.mark_completed(issue_json)
+    return {**log_entry, "reproduced": not error_trace and bool(success)}
+
+def list_issue_files(issue_json):
+    """Returns the absolute paths of the files next to an issue.json, like find_issue_json_files does."""
+    dirpath = os.path.dirname(issue_json)
+    return [
+        os.path.abspath(os.path.join(dirpath, f))
+        for f in os.listdir(dirpath)
+        if f != "issue.json" and os.path.isfile(os.path.join(dirpath, f))
+    ]
+
+def print_counts(counts):
+    print(f"Total successes: {counts['all_success']}")
+    print(f"Total file processing errors: {counts['file_processor_errors']}")
+    print(f"Total analyze errors: {counts['analyze_errors']}")
+    print(f"Total ready_apis errors: {counts['ready_apis_errors']}")
+
+def run_coordinator(args, manifest, store=None):
+    """Enqueues every issue that has to be processed into the work queue."""
+    work_queue = WorkQueue(args.queue_db, args.lease_seconds)
+    issue_jsons = store.issue_jsons() if store else find_issue_json_files("./bug_reports")[0]
+    enqueued = 0
+    in_flight = 0
+    for issue_json in issue_jsons:
+        if manifest.should_run(issue_json, force=args.force, only_failed=args.only_failed):
+            if work_queue.enqueue(SYNTHESIS_STAGE, issue_json):
+                enqueued += 1
+            else:
+                in_flight += 1
+    print(f"Enqueued {enqueued} of {len(issue_jsons)} issues into {args.queue_db}")
+    if in_flight:
+        print(f"Skipped {in_flight} issues that are still leased to a worker")
+    print(f"Queue status: {work_queue.counts()}")
+
+def run_queue_worker(args, manifest, counts, result_sink, timer, store=None):
+    """
+    Runs this process as a worker of the work queue. Synthesis workers can be started on as many
+    processes and machines as needed; every reproduction worker is bound to one game slot.
+    """
+    work_queue = WorkQueue(args.queue_db, args.lease_seconds)
+
+    if args.role == "synthesis-worker":
+        file_processor = FileProcessor()
+
+        def handle(job):
+            issue_json = job["issue_json"]
+            with timer.track(issue_json):
+                files = store.files(issue_json) if store else list_issue_files(issue_json)
+                result = synthesize_issue(file_processor, issue_json, {issue_json: files}, counts, manifest, store, args.with_attachments)
+            if result is None:
+                entry = manifest.load(issue_json)
+                return entry["error"] if entry else "Step synthesis failed"
+            log_entry, version = result
+            if args.only_step:
+                result_sink.write(log_entry)
+                manifest.mark_completed(issue_json)
+            else:
+                work_queue.enqueue(REPRODUCTION_STAGE, issue_json, {"log_entry": log_entry, "version": version})
+
+        processed = run_worker(work_queue, SYNTHESIS_STAGE, args.worker_id, handle)
+    else:
+        if not work_queue.claim_slot(args.slot, args.worker_id):
+            print(f"Game slot {args.slot} is already held by another worker.")
+            return
+
+        def handle(job):
+            payload = job["payload"]
+            with timer.track(job["issue_json"]):
+                result_sink.write(reproduce_issue(payload["log_entry"], payload["version"], counts, manifest))
+
+        try:
+            processed = run_worker(work_queue, REPRODUCTION_STAGE, args.worker_id, handle, upstream_stages=[SYNTHESIS_STAGE], slot=args.slot)
+        finally:
+            work_queue.release_slot(args.slot, args.worker_id)
+    print(f"Worker {args.worker_id} processed {processed} jobs.")
+
 def main():
     parser = argparse.ArgumentParser(description="Process bug reports and optionally execute steps.")
     parser.add_argument("--only-step", action="store_true", help="Only perform step extraction, do not execute steps.")
+    parser.add_argument("--pipeline", action="store_true", help="Synthesize steps for upcoming issues while the current one is being reproduced.")
+    parser.add_argument("--with-attachments", action="store_true", help="Unpack the files of every issue and evaluate its images and videos. They are prepared on a worker pool while the LLM stages run.")
+    parser.add_argument("--synth-workers", type=int, default=2, help="Number of issues synthesized concurrently in pipeline mode (default: 2).")
+    parser.add_argument("--queue-size", type=int, default=2, help="Number of synthesized issues that may wait for reproduction in pipeline mode (default: 2).")
+    parser.add_argument("--manifest-dir", default="run_manifest", help="Directory holding the per-issue run manifest (default: run_manifest).")
+    selector = parser.add_mutually_exclusive_group()
+    selector.add_argument("--force", action="store_true", help="Process every issue, even the ones already completed with the same inputs.")
+    selector.add_argument("--only-failed", action="store_true", help="Only retry issues whose last run failed.")
+    parser.add_argument("--results", help="JSONL file results are appended to as issues complete (default: step_clusters_log.jsonl, or one file per queue worker).")
+    parser.add_argument("--no-legacy-log", action="store_true", help="Do not rebuild step_clusters_log.json from the results file at the end of the run.")
+    parser.add_argument("--role", choices=["coordinator", "synthesis-worker", "reproduction-worker"], help="Run as part of a work queue instead of processing the bug reports in this process.")
+    parser.add_argument("--queue-db", default="work_queue.sqlite", help="SQLite file of the work queue (default: work_queue.sqlite).")
+    parser.add_argument("--worker-id", default=default_worker_id(), help="Unique id of this queue worker (default: hostname-pid).")
+    parser.add_argument("--slot", help="Game slot a reproduction worker is bound to, e.g. the machine name.")
+    parser.add_argument("--lease-seconds", type=int, default=900, help="Seconds before a job of a crashed worker is handed out again (default: 900).")
+    parser.add_argument("--store", help="Issue store to read the bug reports from instead of parsing ./bug_reports, see issue_store.py. "
+                                        "It is brought up to date with ./bug_reports first.")
+    parser.add_argument("--skip-ingest", action="store_true", help="Use the issue store as is, without checking ./bug_reports for changes.")
+    parser.add_argument("--timing-report", help="JSON file the per-stage timing summary is written to (default: timing_report.json, or one file per queue worker).")
     args = parser.parse_args()
+    if args.role == "reproduction-worker" and not args.slot:
+        parser.error("--slot is required for reproduction workers")
+    if args.results is None:
+        args.results = f"step_clusters_log.{args.worker_id}.jsonl" if args.role else "step_clusters_log.jsonl"
+    if args.timing_report is None:
+        args.timing_report = f"timing_report.{args.worker_id}.json" if args.role else "timing_report.json"
 
-    macro_thread = threading.Thread(target=macro_run)
-    macro_thread.daemon = True
-    macro_thread.start()
-    
-    all_success = 0
-    file_processor_errors = 0
-    analyze_errors = 0
-    ready_apis_errors = 0
-    issue_jsons, dir_contents = find_issue_json_files("./bug_reports")
+    manifest = RunManifest(args.manifest_dir, run_config(args.only_step, args.with_attachments), code_version())
+    store = None
+    if args.store:
+        store = IssueStore(args.store)
+        # Queue workers read the store the coordinator brought up to date
+        if not args.skip_ingest and args.role in (None, "coordinator"):
+            print(f"Issue store ingest: {store.ingest('./bug_reports')}")
+    if args.role == "coordinator":
+        run_coordinator(args, manifest, store)
+        return
+
+    if args.role != "synthesis-worker":
+        macro_thread = threading.Thread(target=macro_run)
+        macro_thread.daemon = True
+        macro_thread.start()
+
+    counts = {
+        "all_success": 0,
+        "file_processor_errors": 0,
+        "analyze_errors": 0,
+        "ready_apis_errors": 0,
+    }
+    result_sink = ResultSink(args.results)
+    timer = RunTimer()
+    if args.role:
+        try:
+            run_queue_worker(args, manifest, counts, result_sink, timer, store)
+        finally:
+            result_sink.close()
+        print_counts(counts)
+        timer.write(args.timing_report)
+        return
+
+    if store:
+        issue_jsons, dir_contents = store.issue_jsons(), store.dir_contents()
+    else:
+        issue_jsons, dir_contents = find_issue_json_files("./bug_reports")
     print(f"Number of issue.json files found: {len(issue_jsons)}")
+    selected_issue_jsons = [
+        issue_json for issue_json in issue_jsons
+        if manifest.should_run(issue_json, force=args.force, only_failed=args.only_failed)
+    ]
+    print(f"Number of issues to process: {len(selected_issue_jsons)} (skipped {len(issue_jsons) - len(selected_issue_jsons)})")
     file_processor = FileProcessor()
-    log_data = []
 
-    for issue_json in issue_jsons:
-        try:
-            change_id, final_state, comments, attachments = backtrace(issue_json, None, None, True)
-            title = final_state["summary"]
-            description = final_state["description"]
-            version = final_state["versions"][0]["name"].removeprefix("Minecraft").strip()
-            new_comments = []
-            for comment in comments:
-                new_comments.append(comment["body"])
-            bug_description = f"Version: {version}\nTitle: {title}\nDescription: {description}"
-            for i, comment in enumerate(new_comments):
-                bug_description += f"\nComment {i + 1}: {comment}\n"
-            try:
-                print(f"Processing: {issue_json}")
-                print(bug_description)
-                file_paths = dir_contents[issue_json]
-                print(f"Processing files: {file_paths}")
-                
-                step_clusters = file_processor.analyze(None, bug_description, version, None, None, None)
-                step_clusters = dict_to_array(step_clusters)
-                print(f"Step clusters: {step_clusters}")
-
-                log_data.append({
-                    "issue-json": issue_json,
-                    "bug_description": bug_description,
-                    "step_clusters": step_clusters,
-                    "worlds": file_processor.current_worlds,
-                    "datapacks": file_processor.current_datapacks
-                })
-
-            except Exception as e:
-                analyze_errors += 1
-                error_trace = traceback.format_exc()  # Get full stack trace
-                print(f"Error in file_processor.analyze for {issue_json}:\n{error_trace}")
-                with open("error_counts.txt", "a") as f:
-                    f.write(f"Error in file_processor.analyze for {issue_json}:\n{error_trace}\n")
-                continue
-
-            if not args.only_step:
-                try:
-                    release_version = convert_version_string(version)
-                    issue_name = os.path.basename(os.path.dirname(issue_json))
-                    success = ready_apis(
-                        step_clusters, 
-                        release_version,
-                        issue_name,
-                        worlds=None,
-                        datapacks=None
-                    )
-                    if success:
-                        all_success += 1
-                except Exception as e:
-                    ready_apis_errors += 1
-                    error_trace = traceback.format_exc()  # Get full stack trace
-                    print(f"Error in ready_apis for {issue_json}:\n{error_trace}")
-                    with open("error_counts.txt", "a") as f:
-                        f.write(f"Error in ready_apis for {issue_json}:\n{error_trace}\n")
-                kill_all_processes_except_cmd_python()
-        except Exception as e:
-            file_processor_errors += 1
-            error_trace = traceback.format_exc()  # Get full stack trace
-            print(f"Error processing {issue_json}:\n{error_trace}")
-            with open("error_counts.txt", "a") as f:
-                f.write(f"Error processing {issue_json}:\n{error_trace}\n")
-
-    print(f"Total successes: {all_success}")
-    print(f"Total file processing errors: {file_processor_errors}")
-    print(f"Total analyze errors: {analyze_errors}")
-    print(f"Total ready_apis errors: {ready_apis_errors}")
+    def synthesize(issue_json):
+        with timer.track(issue_json):
+            return synthesize_issue(file_processor, issue_json, dir_contents, counts, manifest, store, args.with_attachments)
+
+    def consume(result):
+        log_entry, version = result
+        if args.only_step:
+            result_sink.write(log_entry)
+            manifest.mark_completed(log_entry["issue-json"])
+        else:
+            with timer.track(log_entry["issue-json"]):
+                result_sink.write(reproduce_issue(log_entry, version, counts, manifest))
+
+    if args.pipeline:
+        run_pipeline(selected_issue_jsons, synthesize, consume, workers=args.synth_workers, queue_size=args.queue_size)
+    else:
+        for issue_json in selected_issue_jsons:
+            result = synthesize(issue_json)
+            if result is not None:
+                consume(result)
+    result_sink.close()
+
+    print_counts(counts)
 
     with open("error_counts.txt", "w") as f:
-        f.write(f"Total successes: {all_success}\n")
-        f.write(f"Total file processing errors: {file_processor_errors}\n")
-        f.write(f"Total analyze errors: {analyze_errors}\n")
-        f.write(f"Total ready_apis errors: {ready_apis_errors}\n")
+        f.write(f"Total successes: {counts['all_success']}\n")
+        f.write(f"Total file processing errors: {counts['file_processor_errors']}\n")
+        f.write(f"Total analyze errors: {counts['analyze_errors']}\n")
+        f.write(f"Total ready_apis errors: {counts['ready_apis_errors']}\n")
+
+    summary = timer.write(args.timing_report)
+    print(f"Throughput: {summary['issues_per_hour']} issues/hour, timing report written to {args.timing_report}")
+    cache_stats = llm_cache_stats()
+    if cache_stats:
+        print(f"LLM cache: {cache_stats}")
+    search_stats = search_cache_stats()
+    if search_stats:
+        print(f"Search cache: {search_stats}")
+    for wiki_directory, corpus_stats in wiki_corpus_stats().items():
+        print(f"Wiki page cache for {wiki_directory}: {corpus_stats}")
 
-    with open("step_clusters_log.json", "w") as f:
-        json.dump(log_data, f, indent=4)
+    # Issues skipped in this run keep the results recorded by earlier runs
+    if not args.no_legacy_log:
+        rebuild_legacy_log(args.results, "step_clusters_log.json", set(issue_jsons))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
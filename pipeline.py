@@ -0,0 +1,64 @@
+import queue
+import threading
+import traceback
+
+_WORKER_DONE = object()
+
+def run_pipeline(items, produce, consume, workers=2, queue_size=2):
+    """
+    Runs a two-stage pipeline over the given items.
+
+    `produce` is called for every item on a pool of worker threads and its results
+    are handed to `consume` on the calling thread through a bounded queue. Workers
+    block once the queue is full, so at most `workers + queue_size` items are
+    produced ahead of the one currently being consumed.
+
+    Args:
+        items: Iterable of inputs for the producer stage.
+        produce: Function taking one item and returning a result, or None to drop it.
+        consume: Function taking one produced result. Runs sequentially.
+        workers: Number of producer threads.
+        queue_size: Maximum number of produced results waiting to be consumed.
+
+    Returns:
+        The number of results that were consumed.
+    """
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    ready = queue.Queue(maxsize=max(1, queue_size))
+
+    def worker():
+        try:
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    result = produce(item)
+                except Exception:
+                    print(f"Error in pipeline producer for {item}:\n{traceback.format_exc()}")
+                    continue
+                if result is not None:
+                    ready.put(result)
+        finally:
+            ready.put(_WORKER_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+
+    consumed = 0
+    finished = 0
+    while finished < len(threads):
+        result = ready.get()
+        if result is _WORKER_DONE:
+            finished += 1
+            continue
+        consume(result)
+        consumed += 1
+
+    for thread in threads:
+        thread.join()
+    return consumed
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import textwrap
+import threading
+import time
+
+class ResultSink:
+    """
+    Appends one compact JSON record per line to a results file as soon as an issue completes.
+
+    Every record is flushed to the OS right away, while the more expensive fsync is batched:
+    it runs after `fsync_every` records or once `fsync_interval` seconds have passed since the
+    last one, and again on close.
+
+    A truncated last line left by a crash mid-write is cut off when the file is opened, so the
+    first record of the next run starts on its own line.
+    """
+
+    def __init__(self, path, fsync_every=10, fsync_interval=30.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        truncate_partial_line(path)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.write_line(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+    def write_line(self, line):
+        """Appends a record that was already serialized, e.g. by a worker process."""
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+def truncate_partial_line(path, chunk_size=65536):
+    """Cuts a results file back to its last newline if it does not end with one."""
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            chunk = f.read(end - start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            print(f"Removing a truncated record at the end of {path}: {size - end} bytes")
+            f.truncate(end)
+
+def read_results(path):
+    """
+    Yields the records of a results file one at a time.
+    A truncated last line, e.g. from a crash mid-write, is skipped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping malformed record in {path}: {line[:80]!r}")
+
+def latest_results(paths, issue_jsons=None):
+    """
+    Yields the most recent record of every issue in one or more results files, in the
+    order the issues first appear. Only the line offsets are kept in memory, not the records.
+
+    Args:
+        paths: Path to a JSONL results file, or a list of them (e.g. one per worker).
+        issue_jsons: Optional collection of issue.json paths to restrict the output to.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    offsets = {}
+    for file_index, path in enumerate(paths):
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    issue_json = json.loads(line)["issue-json"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    issue_json = None
+                if issue_json is not None and (issue_jsons is None or issue_json in issue_jsons):
+                    offsets[issue_json] = (file_index, offset)
+                offset += len(line)
+
+    files = [open(path, "rb") for path in paths]
+    try:
+        for file_index, offset in offsets.values():
+            f = files[file_index]
+            f.seek(offset)
+            yield json.loads(f.readline())
+    finally:
+        for f in files:
+            f.close()
+
+def rebuild_legacy_log(results_paths, output_path="step_clusters_log.json", issue_jsons=None):
+    """
+    Converts one or more JSONL results files into the legacy step_clusters_log.json array,
+    writing one record at a time. The output matches json.dump(..., indent=4).
+
+    Returns:
+        The number of records written.
+    """
+    count = 0
+    with open(output_path, "w") as f:
+        f.write("[")
+        for record in latest_results(results_paths, issue_jsons):
+            f.write(",\n" if count else "\n")
+            f.write(textwrap.indent(json.dumps(record, indent=4), " " * 4))
+            count += 1
+        f.write("\n]" if count else "]")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild step_clusters_log.json from JSONL results files.")
+    parser.add_argument("results_files", nargs="+", help="Paths to the JSONL results files.")
+    parser.add_argument("-o", "--output", default="step_clusters_log.json", help="Output path (default: step_clusters_log.json).")
+    args = parser.parse_args()
+    count = rebuild_legacy_log(args.results_files, args.output)
+    print(f"Wrote {count} records to {args.output}")
+
+if __name__ == "__main__":
+    main()
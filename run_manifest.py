@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from step_synth import environment as step_synth_env
+from action_model import environment as action_model_env
+import llm_cache
+import llm_replay
+
+# Sources whose changes invalidate previously completed issues
+CODE_PATHS = ["main.py", "backtrace.py", "issue_store.py", "step_synth", "action_model"]
+
+def code_version(root_folder="."):
+    """
+    Computes a digest of the Python sources that influence the results of a run.
+
+    Args:
+        root_folder: The project root.
+
+    Returns:
+        A hex digest that changes whenever one of the tracked source files changes.
+    """
+    digest = hashlib.sha256()
+    for code_path in CODE_PATHS:
+        full_path = os.path.join(root_folder, code_path)
+        if os.path.isfile(full_path):
+            source_files = [full_path]
+        else:
+            source_files = []
+            for dirpath, dirnames, filenames in os.walk(full_path):
+                dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+                source_files += [os.path.join(dirpath, f) for f in filenames if f.endswith(".py")]
+        for source_file in sorted(source_files):
+            digest.update(os.path.relpath(source_file, root_folder).replace("\\", "/").encode("utf-8"))
+            with open(source_file, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+# Settings added after the manifest was introduced, with their defaults, by the module defining them.
+# They are only recorded when they differ from the default, so runs with the defaults keep the keys of earlier runs.
+OPTIONAL_SETTINGS = {
+    step_synth_env: {
+        "WIKI_RETRIEVAL_MODE": "llm",
+        "WIKI_RETRIEVAL_TOP_K": 20,
+        "CONTEXT_TOKEN_BUDGET": 0,
+        "CONTEXT_TOKEN_BUDGETS": {},
+        "CONTEXT_CHUNK_TOKENS": 256,
+        "VIDEO_FRAME_MAX_SIZE": 1024,
+        "VIDEO_FRAME_FORMAT": "JPEG",
+        "VIDEO_FRAME_QUALITY": 85,
+        "VIDEO_KEYFRAME_THRESHOLD": 5,
+        "VIDEO_SCENE_CUT_THRESHOLD": 20,
+        "VIDEO_MAX_KEYFRAMES": 30,
+        "IMAGE_BATCH_SIZE": 1,
+        "VIDEO_MOSAIC_FRAMES": 1,
+        "IMAGE_MAX_SIZE": 1024,
+        "USE_PARALLEL_ENHANCE_S2R": False,
+        "SEARCH_BACKEND": "tavily",
+        "SEARCH_MAX_RESULTS": 5,
+    },
+    # Cached responses can stand in for new model calls
+    llm_cache: {
+        "LLM_CACHE_MODE": "off",
+    },
+    # Replayed runs must not mark issues complete for live runs
+    llm_replay: {
+        "LLM_BACKEND": "live",
+    },
+}
+
+def run_config(only_step, with_attachments=False):
+    """Returns the configuration values that change what a run produces for an issue."""
+    config = {
+        "USE_WIKI": step_synth_env.USE_WIKI,
+        "USE_SEARCH": step_synth_env.USE_SEARCH,
+        "USE_MOB_CHECKER": step_synth_env.USE_MOB_CHECKER,
+        "USE_REASONING_TRAJECTORY": step_synth_env.USE_REASONING_TRAJECTORY,
+        "USE_ALTERNATE_SOLUTIONS": step_synth_env.USE_ALTERNATE_SOLUTIONS,
+        "USE_FINAL_CLUSTERING": step_synth_env.USE_FINAL_CLUSTERING,
+        "STEP_SYNTH_MODEL_NAME": step_synth_env.MODEL_NAME,
+        "ACTION_MODEL_NAME": action_model_env.MODEL_NAME,
+        "MAKE_FULLSCREEN": action_model_env.MAKE_FULLSCREEN,
+        "SEPERATE_THOUGHT": action_model_env.SEPERATE_THOUGHT,
+        "USE_CORRECTION": action_model_env.USE_CORRECTION,
+        "ONLY_STEP": only_step,
+    }
+    # Only recorded when set, so runs without attachments keep the keys of earlier runs
+    if with_attachments:
+        config["WITH_ATTACHMENTS"] = True
+    for module, settings in OPTIONAL_SETTINGS.items():
+        for name, default in settings.items():
+            value = getattr(module, name)
+            if value != default:
+                config[name] = value
+    return config
+
+class RunManifest:
+    """
+    Keeps one small JSON file per issue recording whether it completed or failed
+    and under which key; the results themselves go to the result sink. The key is
+    a hash of the issue.json content, the run configuration and the code version,
+    so a changed input marks the issue as stale and it gets processed again.
+    """
+
+    def __init__(self, directory, config, version):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        run_digest = hashlib.sha256()
+        run_digest.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+        run_digest.update(version.encode("utf-8"))
+        self.run_digest = run_digest.hexdigest()
+        self.keys = {}
+
+    def issue_key(self, issue_json):
+        """Returns the content-addressed key of an issue for the current configuration."""
+        if issue_json not in self.keys:
+            digest = hashlib.sha256()
+            with open(issue_json, "rb") as f:
+                digest.update(f.read())
+            digest.update(self.run_digest.encode("utf-8"))
+            self.keys[issue_json] = digest.hexdigest()
+        return self.keys[issue_json]
+
+    def entry_path(self, issue_json):
+        issue_name = os.path.basename(os.path.dirname(issue_json))
+        path_digest = hashlib.sha1(os.path.abspath(issue_json).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.directory, f"{issue_name}_{path_digest}.json")
+
+    def load(self, issue_json):
+        """Returns the manifest entry of an issue, or None if it was never processed."""
+        try:
+            with open(self.entry_path(issue_json), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def status(self, issue_json):
+        """
+        Returns one of "new", "stale", "failed" or "completed" for an issue.
+        """
+        entry = self.load(issue_json)
+        if entry is None:
+            return "new"
+        if entry["status"] == "failed":
+            return "failed"
+        if entry["key"] != self.issue_key(issue_json):
+            return "stale"
+        return "completed"
+
+    def should_run(self, issue_json, force=False, only_failed=False):
+        """
+        Decides whether an issue has to be processed in this run.
+
+        Args:
+            issue_json: Path to the issue.json file.
+            force: Process the issue regardless of its manifest entry.
+            only_failed: Only process issues whose last run failed.
+        """
+        if force:
+            return True
+        status = self.status(issue_json)
+        if only_failed:
+            return status == "failed"
+        return status != "completed"
+
+    def write(self, issue_json, entry):
+        entry_path = self.entry_path(issue_json)
+        temp_path = entry_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(temp_path, entry_path)
+
+    def mark_completed(self, issue_json):
+        self.write(issue_json, {
+            "issue-json": issue_json,
+            "key": self.issue_key(issue_json),
+            "status": "completed",
+            "updated": datetime.now().isoformat(),
+        })
+
+    def mark_failed(self, issue_json, stage, error):
+        self.write(issue_json, {
+            "issue-json": issue_json,
+            "key": self.issue_key(issue_json),
+            "status": "failed",
+            "stage": stage,
+            "error": error,
+            "updated": datetime.now().isoformat(),
+        })
@@ -0,0 +1,156 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from llm_cache import CACHE_HIT_KEY
+
+class LLMCallCounter(BaseCallbackHandler):
+    """
+    Counts the chat model and LLM calls made while it is attached to a stage. Calls are counted
+    when they end, as responses served from the LLM cache are only known then; those are not
+    model calls and are counted as cache hits instead.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        generations = [generation for generation_list in response.generations for generation in generation_list]
+        cached = bool(generations) and all((generation.generation_info or {}).get(CACHE_HIT_KEY) for generation in generations)
+        with self.lock:
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.calls += 1
+
+    def on_llm_error(self, error, **kwargs):
+        with self.lock:
+            self.calls += 1
+
+# Every chain invoked while a stage is running picks up that stage's counter,
+# so the chains themselves need no changes.
+_llm_call_counter = contextvars.ContextVar("llm_call_counter", default=None)
+register_configure_hook(_llm_call_counter, inheritable=True)
+
+_current_issue = contextvars.ContextVar("current_issue", default=None)
+
+class IssueTiming:
+    """Seconds, LLM calls and LLM cache hits spent in each stage of one issue."""
+
+    def __init__(self, issue_json):
+        self.issue_json = issue_json
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage_name, seconds, llm_calls, llm_cache_hits):
+        with self.lock:
+            entry = self.stages.setdefault(stage_name, {"seconds": 0.0, "llm_calls": 0, "llm_cache_hits": 0})
+            entry["seconds"] += seconds
+            entry["llm_calls"] += llm_calls
+            entry["llm_cache_hits"] += llm_cache_hits
+
+    def to_dict(self):
+        with self.lock:
+            return {"issue-json": self.issue_json, "stages": {k: dict(v) for k, v in self.stages.items()}}
+
+@contextmanager
+def stage(stage_name):
+    """
+    Times a stage of the issue being tracked in the current context and counts its LLM calls.
+    Does nothing when no issue is tracked, e.g. in the FastAPI service.
+    """
+    issue_timing = _current_issue.get()
+    if issue_timing is None:
+        yield
+        return
+    counter = LLMCallCounter()
+    token = _llm_call_counter.set(counter)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _llm_call_counter.reset(token)
+        issue_timing.add(stage_name, time.perf_counter() - start, counter.calls, counter.cache_hits)
+
+def percentile(values, q):
+    """Returns the q-th percentile (0-100) of the values with linear interpolation."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class RunTimer:
+    """
+    Collects the stage timings of every issue in a batch run and summarizes them.
+    An issue may be tracked from several threads, e.g. synthesized on a pipeline
+    worker and reproduced on the main thread.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.issues = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def track(self, issue_json):
+        with self.lock:
+            issue_timing = self.issues.setdefault(issue_json, IssueTiming(issue_json))
+        token = _current_issue.set(issue_timing)
+        try:
+            yield issue_timing
+        finally:
+            _current_issue.reset(token)
+
+    def summary(self):
+        """
+        Returns p50/p95/max seconds and LLM call counts per stage, plus its LLM cache hits and the
+        overall issue throughput.
+        """
+        with self.lock:
+            issues = [issue_timing.to_dict() for issue_timing in self.issues.values()]
+        wall_seconds = time.time() - self.started
+        per_stage = {}
+        for issue in issues:
+            for stage_name, entry in issue["stages"].items():
+                per_stage.setdefault(stage_name, []).append(entry)
+
+        stages = {}
+        for stage_name, entries in per_stage.items():
+            seconds = [entry["seconds"] for entry in entries]
+            llm_calls = [entry["llm_calls"] for entry in entries]
+            llm_cache_hits = [entry["llm_cache_hits"] for entry in entries]
+            stages[stage_name] = {
+                "issues": len(entries),
+                "total_seconds": sum(seconds),
+                "p50_seconds": percentile(seconds, 50),
+                "p95_seconds": percentile(seconds, 95),
+                "max_seconds": max(seconds),
+                "llm_calls": sum(llm_calls),
+                "p50_llm_calls": percentile(llm_calls, 50),
+                "max_llm_calls": max(llm_calls),
+                "llm_cache_hits": sum(llm_cache_hits),
+            }
+
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(),
+            "wall_seconds": wall_seconds,
+            "issues": len(issues),
+            "issues_per_hour": len(issues) / (wall_seconds / 3600) if wall_seconds > 0 else None,
+            "stages": stages,
+            "per_issue": issues,
+        }
+
+    def write(self, path):
+        summary = self.summary()
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=4)
+        return summary
@@ -2,64 +2,123 @@ from step_synth.chains import *
 from step_synth.utils import *
 from step_synth.environment import *
 from step_synth.logger import logger
+from step_synth.concurrency import ainvoke_limited, batch_limited, gather_limited
+from step_synth.wiki_corpus import read_wiki_pages
+from step_synth.wiki_retrieval import narrow_wiki_pages, rank_wiki_pages
+from step_synth.context import prepare_context
+from step_synth.search import dedupe_results, parse_queries
 import asyncio
 
 
-def process_wiki(bug_report, version, filenames):
-        nodes = node_extract_chain.invoke({"bug_report": bug_report}).nodes
-        logger.log(f"NER (Named Entity Recognition) is done. Extracted Entities: {nodes}")
+def rank_wiki_titles(bug_report):
+    """Returns the titles of the WIKI_RETRIEVAL_TOP_K wiki pages BM25 ranks best for the bug report."""
+    pages = rank_wiki_pages(WIKI_DIRECTORY, bug_report, WIKI_RETRIEVAL_TOP_K)
+    logger.log(f"BM25 retrieval has been done over Minecraft wiki pages. Top ranked title names are: {pages}")
+    return pages
+
+def match_wiki_titles(bug_report, filenames, nodes):
+    """Returns the wiki titles matching the entities node_extract_chain extracted, narrowed with BM25 in hybrid mode."""
+    logger.log(f"NER (Named Entity Recognition) is done. Extracted Entities: {nodes}")
+
+    pages = find_matches(filenames, str(nodes))
+    logger.log(f"Fuzzy matching has been done with Minecraft wiki pages. Matched title names are: {pages}")
+
+    if WIKI_RETRIEVAL_MODE == "hybrid":
+        pages = narrow_wiki_pages(WIKI_DIRECTORY, bug_report, pages, WIKI_RETRIEVAL_TOP_K)
+        logger.log(f"Matched titles have been narrowed with BM25. Top ranked title names are: {pages}")
+    return pages
+
+def read_distilled_pages(distilled_nodes, version):
+    """Reads the wiki pages node_distill_chain selected, plus the pages every bug report is given."""
+    if version:
+        distilled_nodes.append("Java Edition " + version.replace('.', '_'))
+    distilled_nodes.append("Game mode")
+    distilled_nodes.append("Commands")
+    distilled_nodes.append("Game rule")
+    distilled_nodes.append("Experiments")
+    logger.log(f"Node names have been reselected with LLM assistance. Final titles are: {distilled_nodes}")
 
-        pages = find_matches(filenames, str(nodes))
-        logger.log(f"Fuzzy matching has been done with Minecraft wiki pages. Matched title names are: {pages}")
+    wiki_content = read_wiki_pages(WIKI_DIRECTORY, distilled_nodes) if USE_WIKI_CORPUS else read_files(WIKI_DIRECTORY, distilled_nodes)
+    for content in wiki_content:
+        logger.log(content, "wiki_page")
+    return wiki_content
+
+def relevant_trajectories(content_list, trajectories):
+    """Logs the reasoning trajectory of every wiki page and keeps those not judged IRRELEVANT."""
+    relevant = []
+    for content, trajectory in zip(content_list, trajectories):
+        logger.log({"title": content["title"], "text": trajectory}, "wiki_page_reasoning")
+        if trajectory.strip() != "IRRELEVANT":
+            relevant.append(trajectory)
+    return relevant
+
+def process_wiki(bug_report, version, filenames):
+        if WIKI_RETRIEVAL_MODE == "bm25":
+            pages = rank_wiki_titles(bug_report)
+        else:
+            nodes = node_extract_chain.invoke({"bug_report": bug_report}).nodes
+            pages = match_wiki_titles(bug_report, filenames, nodes)
 
         distilled_nodes = node_distill_chain.invoke({"bug_report": bug_report, "node_list": str(pages)}).nodes
-        if version:
-            distilled_nodes.append("Java Edition " + version.replace('.', '_'))
-        distilled_nodes.append("Game mode")
-        distilled_nodes.append("Commands")
-        distilled_nodes.append("Game rule")
-        distilled_nodes.append("Experiments")
-        logger.log(f"Node names have been reselected with LLM assistance. Final titles are: {distilled_nodes}")
-
-        wiki_content = read_files(WIKI_DIRECTORY, distilled_nodes)
-        for content in wiki_content:
-            logger.log(content, "wiki_page")
+        wiki_content = read_distilled_pages(distilled_nodes, version)
 
         if USE_REASONING_TRAJECTORY:
             wiki_content = generate_reasoning_trajectories(bug_report, wiki_content)
 
         return wiki_content
 
+async def aprocess_wiki(bug_report, version, filenames):
+        """Async variant of process_wiki that reasons over the wiki pages concurrently."""
+        if WIKI_RETRIEVAL_MODE == "bm25":
+            pages = rank_wiki_titles(bug_report)
+        else:
+            nodes = (await ainvoke_limited(node_extract_chain, {"bug_report": bug_report})).nodes
+            pages = match_wiki_titles(bug_report, filenames, nodes)
+
+        distilled_nodes = (await ainvoke_limited(node_distill_chain, {"bug_report": bug_report, "node_list": str(pages)})).nodes
+        wiki_content = read_distilled_pages(distilled_nodes, version)
+
+        if USE_REASONING_TRAJECTORY:
+            wiki_content = await agenerate_reasoning_trajectories(bug_report, wiki_content)
+
+        return wiki_content
+
 def generate_reasoning_trajectories(bug_report, content_list):
-        trajectories = []
-        for content in content_list:
-            trajectory = reasoning_trajectory_chain.invoke({"bug_report": bug_report, "content": content})
-            logger.log({"title": content["title"], "text": trajectory}, "wiki_page_reasoning")
-            if trajectory.strip() != "IRRELEVANT":
-                trajectories.append(trajectory)
-        return trajectories
+        trajectories = [reasoning_trajectory_chain.invoke({"bug_report": bug_report, "content": content}) for content in content_list]
+        return relevant_trajectories(content_list, trajectories)
+
+async def agenerate_reasoning_trajectories(bug_report, content_list):
+        """Async variant of generate_reasoning_trajectories. The output keeps the order of content_list."""
+        trajectories = await gather_limited(reasoning_trajectory_chain, [{"bug_report": bug_report, "content": content} for content in content_list])
+        return relevant_trajectories(content_list, trajectories)
 
 def search_iterations(bug_report, all_results):
+    """
+    Searches the queries of an iteration concurrently, SEARCH_CONCURRENCY at a time, and reasons
+    over the results concurrently, every call holding one of the MAX_CONCURRENT_LLM_CALLS slots. Results whose URL an earlier query already returned are skipped.
+    """
     iter = 0
     search_results = []
+    seen_urls = set()
     while iter < SOURCE_MAX_ITERATION:
         logger.log(f"Search tool is being used. Iteration:{iter + 1}")
-        queries = eval(query_chain.invoke({"bug_report": prepare_br(bug_report, all_results)}))
+        queries = parse_queries(query_chain.invoke({"bug_report": prepare_context(bug_report, all_results, "query_chain")}))
         logger.log(f"Generated queries: {queries}")
 
-        for query in queries:
-            results = search_tool.invoke(query)
-            for result in results:
-                content = result.get("content") or ""
-                if content:
-                    if USE_REASONING_TRAJECTORY:
-                        content = reasoning_trajectory_chain.invoke({"bug_report": bug_report, "content": content}) 
-                        print("Reasoning Generated: ", content)
-                    if content.strip() != 'IRRELEVANT':
-                        logger.log({"title": query, "text": content}, "search_tool_query")
-                        search_results.append(content)
-        
-        judgment_model = judge_chain.invoke({"bug_report": prepare_br(bug_report, all_results + search_results)})
+        query_results = batch_limited(search_tool, queries, SEARCH_CONCURRENCY)
+        contents = [(query, result.get("content") or "") for query, result in dedupe_results(queries, query_results, seen_urls)]
+        contents = [(query, content) for query, content in contents if content]
+        if USE_REASONING_TRAJECTORY:
+            trajectories = batch_limited(reasoning_trajectory_chain, [{"bug_report": bug_report, "content": content} for _, content in contents])
+            for trajectory in trajectories:
+                print("Reasoning Generated: ", trajectory)
+            contents = [(query, trajectory) for (query, _), trajectory in zip(contents, trajectories)]
+        for query, content in contents:
+            if content.strip() != 'IRRELEVANT':
+                logger.log({"title": query, "text": content}, "search_tool_query")
+                search_results.append(content)
+
+        judgment_model = judge_chain.invoke({"bug_report": prepare_context(bug_report, all_results + search_results, "judge_chain")})
         judge_score = judgment_model.point
         logger.log(f"Judge Score: {judge_score}")
         
@@ -70,6 +129,48 @@ def search_iterations(bug_report, all_results):
         iter += 1
     return search_results
 
+async def asearch_iterations(bug_report, all_results):
+    """
+    Async variant of search_iterations. The queries of an iteration are searched concurrently
+    and every result is reasoned over concurrently, keeping the query and result order.
+    """
+    iter = 0
+    search_results = []
+    seen_urls = set()
+    search_slots = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+    async def search(query):
+        async with search_slots:
+            return await ainvoke_limited(search_tool, query)
+
+    while iter < SOURCE_MAX_ITERATION:
+        logger.log(f"Search tool is being used. Iteration:{iter + 1}")
+        queries = parse_queries(await ainvoke_limited(query_chain, {"bug_report": prepare_context(bug_report, all_results, "query_chain")}))
+        logger.log(f"Generated queries: {queries}")
+
+        query_results = await asyncio.gather(*(search(query) for query in queries))
+        contents = [(query, result.get("content") or "") for query, result in dedupe_results(queries, query_results, seen_urls)]
+        contents = [(query, content) for query, content in contents if content]
+
+        if USE_REASONING_TRAJECTORY:
+            trajectories = await gather_limited(reasoning_trajectory_chain, [{"bug_report": bug_report, "content": content} for _, content in contents])
+            contents = [(query, trajectory) for (query, _), trajectory in zip(contents, trajectories)]
+        for query, content in contents:
+            if content.strip() != 'IRRELEVANT':
+                logger.log({"title": query, "text": content}, "search_tool_query")
+                search_results.append(content)
+
+        judgment_model = await ainvoke_limited(judge_chain, {"bug_report": prepare_context(bug_report, all_results + search_results, "judge_chain")})
+        judge_score = judgment_model.point
+        logger.log(f"Judge Score: {judge_score}")
+
+        if judge_score >= JUDGE_THRESHOLD:
+            logger.log("Judge score threshold met. Exiting iterations.")
+            break
+
+        iter += 1
+    return search_results
+
 def generate_s2r(bug_report, all_results, datapack_names):
     logger.log("Initial steps to reproduce (S2R) is being generated.")
     if datapack_names and len(datapack_names) > 0:
@@ -79,9 +180,9 @@ def generate_s2r(bug_report, all_results, datapack_names):
         datapack_names_str = ", ".join(new_datapack_name)
         new_br = bug_report + "\nProvided Datapack Name(s):\n" + datapack_names_str
         print(new_br)
-        s2r = s2r_chain.invoke({"bug_report": prepare_br(new_br, all_results)})
+        s2r = s2r_chain.invoke({"bug_report": prepare_context(new_br, all_results, "s2r_chain")})
     else:
-        s2r = s2r_chain.invoke({"bug_report": prepare_br(bug_report, all_results)})
+        s2r = s2r_chain.invoke({"bug_report": prepare_context(bug_report, all_results, "s2r_chain")})
     logger.log("Initial steps to reproduce (S2R) has been generated.")
     logger.log(s2r,"steps_to_reproduce")
     return s2r
@@ -89,7 +190,7 @@ def generate_s2r(bug_report, all_results, datapack_names):
 def enhance_s2r(s2r, all_results, initial_bug_report):
     logger.log("Enhancing S2R by generating alternate suggestions.")
     if USE_ALTERNATE_SOLUTIONS:
-        alternate_soln_str = alternate_soln_chain.invoke({"bug_report": prepare_br(s2r, all_results)})
+        alternate_soln_str = alternate_soln_chain.invoke({"bug_report": prepare_context(s2r, all_results, "alternate_soln_chain")})
         logger.log(f"Generated suggestions: {alternate_soln_str}")
         
         # Check alternate solutions with crash checker
@@ -108,7 +209,7 @@ def enhance_s2r(s2r, all_results, initial_bug_report):
     else:
         enhanced_s2r = s2r
     logger.log("Looking at mob interactions to enhance the S2R.")
-    mob_checker_str = mob_checker_chain.invoke({"bug_report": prepare_br(enhanced_s2r, all_results)})
+    mob_checker_str = mob_checker_chain.invoke({"bug_report": prepare_context(enhanced_s2r, all_results, "mob_checker_chain")})
     logger.log(f"Generated suggestions for mob interactions: {mob_checker_str}")
     crash_decision = crash_checker_chain.invoke({"s2r": str(enhanced_s2r), "suggestions": mob_checker_str})
     if crash_decision.decision == "NO":
@@ -124,6 +225,39 @@ def enhance_s2r(s2r, all_results, initial_bug_report):
     
     return enhanced_s2r
 
+async def aenhance_s2r(s2r, all_results, initial_bug_report):
+    """
+    Speculative variant of enhance_s2r. The alternate solutions and the mob interactions are both
+    suggested for the initial S2R and crash checked concurrently, then all accepted suggestions are
+    applied in one enhance_s2r_chain call, three round trips instead of six.
+    """
+    logger.log("Enhancing S2R with alternate solution and mob interaction suggestions in parallel.")
+
+    async def suggest(chain_name, chain, label):
+        suggestions = await ainvoke_limited(chain, {"bug_report": prepare_context(s2r, all_results, chain_name)})
+        logger.log(f"Generated suggestions for {label}: {suggestions}")
+        crash_decision = await ainvoke_limited(crash_checker_chain, {"s2r": str(s2r), "suggestions": suggestions})
+        if crash_decision.decision != "NO":
+            logger.log(f"Suggestions for {label} didn't pass crash checker.")
+            return None
+        return f"{label.upper()}:\n{suggestions}"
+
+    suggesters = [("mob_checker_chain", mob_checker_chain, "mob interactions")]
+    if USE_ALTERNATE_SOLUTIONS:
+        suggesters.insert(0, ("alternate_soln_chain", alternate_soln_chain, "alternate solutions"))
+    accepted = [suggestions for suggestions in await asyncio.gather(*(suggest(*suggester) for suggester in suggesters)) if suggestions]
+    if not accepted:
+        return s2r
+
+    enhanced_s2r = await ainvoke_limited(enhance_s2r_chain, {
+        "initial_bug_report": initial_bug_report,
+        "s2r": s2r,
+        "suggestions": "\n\n".join(accepted)
+    })
+    logger.log(f"Enhanced S2R with {len(accepted)} of {len(suggesters)} suggestion sets.")
+    logger.log(enhanced_s2r,"steps_to_reproduce")
+    return enhanced_s2r
+
 def process_clusters(enhanced_s2r):
     logger.log("Clustering the S2R steps.")
     clusters = step_cluster_chain.invoke({"bug_report": enhanced_s2r}).step_clusters
@@ -140,45 +274,210 @@ def refine_clusters(clusters):
     logger.log(clusters, "step_clusters")
     return clusters
 
-def evaluate_images(clusters, all_results, image_codes, staged_files):  # Add staged_files parameter
+def select_steps(bug_report, images):
+    """
+    Selects the step cluster of every image, in one batch_step_selection_chain call for several images.
+    If the model does not answer with one selection per image, the images are selected one by one.
+
+    Args:
+        bug_report: The step clusters and web content, as given to step_selection_chain.
+        images: Base64 encoded images.
+
+    Returns:
+        One StepSelection per image, in their order.
+    """
+    if len(images) > 1:
+        selections = batch_step_selection_chain.invoke({"bug_report": bug_report, "images": image_batch_message(images)}).selections
+        if len(selections) == len(images):
+            return selections
+        logger.log(f"Batched step selection returned {len(selections)} selections for {len(images)} images, selecting them one by one.")
+    return [step_selection_chain.invoke({"bug_report": bug_report, "image_data": image_data}) for image_data in images]
+
+async def aselect_steps(bug_report, images):
+    """Async variant of select_steps."""
+    if len(images) > 1:
+        selections = (await ainvoke_limited(batch_step_selection_chain, {"bug_report": bug_report, "images": image_batch_message(images)})).selections
+        if len(selections) == len(images):
+            return selections
+        logger.log(f"Batched step selection returned {len(selections)} selections for {len(images)} images, selecting them one by one.")
+    return await gather_limited(step_selection_chain, [{"bug_report": bug_report, "image_data": image_data} for image_data in images])
+
+def read_base64(path):
+    with open(path, 'rb') as file:
+        return base64.b64encode(file.read()).decode('utf-8')
+
+def evaluate_images(clusters, all_results, image_codes, staged_files, prepared_images=None):  # Add staged_files parameter
+    """Selects the step cluster of every image. Images found in prepared_images, keyed by code, are not read again."""
     image_datas = {}
     logger.log("Image evaluation started")
-    for image_code in image_codes:
-        image_path = staged_files[image_code]  # Access from the passed dictionary
-        with open(image_path, 'rb') as image_file:
+    bug_report = prepare_context(clusters, all_results, "step_selection_chain")
+    batch_size = max(IMAGE_BATCH_SIZE, 1)
+    for start in range(0, len(image_codes), batch_size):
+        batch = image_codes[start:start + batch_size]
+        images = []
+        for image_code in batch:
             logger.log(f"Processing Image: {image_code}")
-            image_byte = image_file.read()
-            base64_encoded_data = base64.b64encode(image_byte)
-            base64_string = base64_encoded_data.decode('utf-8')
-            selected_step = step_selection_chain.invoke({
-                "bug_report": prepare_br(clusters, all_results),
-                "image_data": base64_string
-            })
+            if prepared_images and image_code in prepared_images:
+                images.append(prepared_images[image_code])
+            else:
+                images.append(read_base64(staged_files[image_code]))  # Access from the passed dictionary
+        for image_code, selected_step in zip(batch, select_steps(bug_report, images)):
             image_datas[image_code] = selected_step  # Store result with the code
             logger.log({"file": image_code, "selection": selection_to_dict(selected_step)}, "image_step")
     return image_datas
 
-def evaluate_videos(clusters, all_results, video_codes, staged_files):  # Add staged_files parameter
+async def aevaluate_images(clusters, all_results, image_codes, staged_files, prepared_images=None):
+    """Async variant of evaluate_images that evaluates all images, or batches of images, concurrently."""
+    logger.log("Image evaluation started")
+    bug_report = prepare_context(clusters, all_results, "step_selection_chain")
+    batch_size = max(IMAGE_BATCH_SIZE, 1)
+    batches = [image_codes[start:start + batch_size] for start in range(0, len(image_codes), batch_size)]
+    prepared_images = prepared_images or {}
+    batch_steps = await asyncio.gather(*(
+        aselect_steps(bug_report, [prepared_images.get(image_code) or read_base64(staged_files[image_code]) for image_code in batch])
+        for batch in batches
+    ))
+
+    image_datas = {}
+    for batch, selected_steps in zip(batches, batch_steps):
+        for image_code, selected_step in zip(batch, selected_steps):
+            logger.log(f"Processing Image: {image_code}")
+            image_datas[image_code] = selected_step
+            logger.log({"file": image_code, "selection": selection_to_dict(selected_step)}, "image_step")
+    return image_datas
+
+def select_keyframes(frames):
+    """
+    Decides which video frames are sent to the vision model. A frame is analysed when it drifted
+    away from the last analysed one or the scene cut since the previous frame, until
+    VIDEO_MAX_KEYFRAMES frames were analysed. The first frame is always analysed.
+
+    Yields:
+        Every frame with None if it is analysed, or the message logged for skipping it.
+    """
+    analysed_hash = None  # Perceptual hash of the last analysed frame
+    previous_hash = None
+    analysed_frames = 0
+    for i, frame in enumerate(frames):
+        changed = i == 0 or hamming_distance(frame["dhash"], analysed_hash) > VIDEO_KEYFRAME_THRESHOLD
+        scene_cut = i > 0 and hamming_distance(frame["dhash"], previous_hash) >= VIDEO_SCENE_CUT_THRESHOLD
+        capped = i > 0 and VIDEO_MAX_KEYFRAMES > 0 and analysed_frames >= VIDEO_MAX_KEYFRAMES
+        previous_hash = frame["dhash"]
+        if (changed or scene_cut) and not capped:
+            analysed_hash = frame["dhash"]
+            analysed_frames += 1
+            yield frame, None
+        elif capped:
+            yield frame, "Frame skipped (frame cap reached)"
+        else:
+            yield frame, "Frame skipped (similar to the last analysed frame)"
+
+def evaluate_video_mosaics(clusters, all_results, video_code, frames):
+    """
+    Analyses the keyframes of a video in mosaics of VIDEO_MOSAIC_FRAMES consecutive keyframes,
+    one video_mosaic_step_chain call per mosaic. A mosaic the model does not answer with one
+    selection per frame is analysed frame by frame with video_step_chain instead.
+
+    Mosaics are sent as soon as their keyframes are decoded. Frames skipped before the mosaic
+    of the keyframe they follow is answered are kept without their image until then.
+
+    Returns:
+        One StepSelection per frame, like evaluate_videos.
+    """
+    bug_report = prepare_context(clusters, all_results, "video_step_chain")
+    running_summary = ""
+    last_conclusion = None
+    frame_results = []
+    mosaic_frames = []
+    pending_frames = []  # (frame, message) of every frame waiting for the mosaic being collected
+    analysed_frames = 0
+    mosaics = 0
+
+    def log_frame(frame, message, selection):
+        if message is None:
+            logger.log({"file": video_code, "selection": selection_to_dict(selection), "timestamp": frame["timestamp"]}, "video_step")
+        else:
+            logger.log({"file": video_code, "message": message, "timestamp": frame["timestamp"], "selection": selection_to_dict(selection)}, "video_step")
+        frame_results.append(selection)
+
+    def analyse_mosaic():
+        nonlocal running_summary, last_conclusion
+        mosaic_selections = video_mosaic_step_chain.invoke({
+            "bug_report": bug_report,
+            "image_data": make_mosaic(mosaic_frames),
+            "summary": running_summary,
+            "conclusion": last_conclusion,
+            "frame_count": len(mosaic_frames)
+        }).selections
+        if len(mosaic_selections) != len(mosaic_frames):
+            logger.log(f"Mosaic step selection returned {len(mosaic_selections)} selections for {len(mosaic_frames)} frames, selecting them one by one.")
+            mosaic_selections = [
+                video_step_chain.invoke({
+                    "bug_report": bug_report,
+                    "image_data": frame["base64"],
+                    "summary": running_summary,
+                    "conclusion": last_conclusion
+                }) for frame in mosaic_frames
+            ]
+
+        last_conclusion = mosaic_selections[-1].conclusion
+        running_summary = running_summary_chain.invoke({
+            "previous_summary": running_summary,
+            "current_frame": "\n".join(f"{frame['timestamp']}: {selection.annotation}" for frame, selection in zip(mosaic_frames, mosaic_selections))
+        })
+        # A skipped frame takes the selection of the keyframe before it
+        analysed_selections = iter(mosaic_selections)
+        for frame, message in pending_frames:
+            log_frame(frame, message, next(analysed_selections) if message is None else frame_results[-1])
+        mosaic_frames.clear()
+        pending_frames.clear()
+
+    for frame, message in select_keyframes(frames):
+        if message is None:
+            mosaic_frames.append(frame)
+            pending_frames.append((frame, None))
+            analysed_frames += 1
+        elif pending_frames:
+            pending_frames.append(({**frame, "base64": None}, message))
+        else:
+            log_frame(frame, message, frame_results[-1])
+        if len(mosaic_frames) == VIDEO_MOSAIC_FRAMES:
+            analyse_mosaic()
+            mosaics += 1
+    if mosaic_frames:
+        analyse_mosaic()
+        mosaics += 1
+    logger.log(f"Analysed {analysed_frames} of {len(frame_results)} frames of {video_code} in {mosaics} mosaics.")
+    return frame_results
+
+def evaluate_videos(clusters, all_results, video_codes, staged_files, prepared_frames=None):  # Add staged_files parameter
+    """Selects the step cluster of every second of every video. Videos found in prepared_frames, keyed by code, are not decoded again."""
     video_datas = {}
     logger.log("Video evaluation started")
     for video_code in video_codes:
-        video_path = staged_files[video_code]  # Access from the passed dictionary
-        frames = get_first_frames_each_second_as_base64(video_path)
+        if prepared_frames and video_code in prepared_frames:
+            frames = prepared_frames[video_code]
+        else:
+            frames = iter_video_frames(staged_files[video_code])  # Access from the passed dictionary
+        if VIDEO_MOSAIC_FRAMES > 1:
+            video_datas[video_code] = evaluate_video_mosaics(clusters, all_results, video_code, frames)
+            continue
+
         frame_results = []
         running_summary = ""
-        previous_frame_base64 = None  # Initialize previous frame variable
         selected_step = None  # Initialize selected_step variable
+        analysed_frames = 0
 
-        for i, frame in enumerate(frames):
-            if i == 0 or frame["base64"] != previous_frame_base64:  # Analyze only if it's the first frame or different from the previous one
+        for i, (frame, message) in enumerate(select_keyframes(frames)):
+            if message is None:
                 if i == 0:
                     selected_step = step_selection_chain.invoke({
-                        "bug_report": prepare_br(clusters, all_results),
+                        "bug_report": prepare_context(clusters, all_results, "step_selection_chain"),
                         "image_data": frame["base64"]
                     })
                 else:
                     selected_step = video_step_chain.invoke({
-                        "bug_report": prepare_br(clusters, all_results),
+                        "bug_report": prepare_context(clusters, all_results, "video_step_chain"),
                         "image_data": frame["base64"],
                         "summary": running_summary,
                         "conclusion": last_conclusion
@@ -191,12 +490,13 @@ def evaluate_videos(clusters, all_results, video_codes, staged_files):  # Add st
                 })
                 logger.log({"file": video_code, "selection": selection_to_dict(selected_step), "summary": running_summary, "timestamp": frame["timestamp"]}, "video_step")
                 frame_results.append(selected_step)
-                previous_frame_base64 = frame["base64"]  # Update previous frame
+                analysed_frames += 1
             else:
-                # Log as skipped if the frame is the same as the previous
-                logger.log({"file": video_code, "message": "Frame skipped (same as previous)", "timestamp": frame["timestamp"], "selection": selection_to_dict(frame_results[-1])}, "video_step")
+                # Log as skipped if the frame looks like the last analysed one or the frame cap is reached
+                logger.log({"file": video_code, "message": message, "timestamp": frame["timestamp"], "selection": selection_to_dict(frame_results[-1])}, "video_step")
                 frame_results.append(frame_results[-1]) # Append the last result to maintain the list length
 
+        logger.log(f"Analysed {analysed_frames} of {len(frame_results)} frames of {video_code}.")
         video_datas[video_code] = frame_results  # Store results with the code
     return video_datas
 
@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from step_synth.environment import ATTACHMENT_WORKERS, IMAGE_MAX_SIZE, VIDEO_FRAME_FORMAT, VIDEO_FRAME_QUALITY
+from step_synth.logger import logger
+from step_synth.utils import encode_image, find_media_files, iter_video_frames
+
+ARCHIVE_EXTENSIONS = ['.zip', '.rar', '.7z', '.tar', '.gz', '.tar.gz']
+PICTURE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Returns the worker pool attachments are prepared on, shared by every issue in the process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ATTACHMENT_WORKERS, thread_name_prefix="attachments")
+        return _executor
+
+def extract_archive(file_path):
+    """
+    Unpacks an archive into a new temporary folder.
+
+    Returns:
+        The folder the archive was extracted to, or None if it could not be extracted.
+    """
+    abs_path = os.path.abspath(file_path)
+    try:
+        extract_dir = os.path.join(tempfile.mkdtemp(), os.path.basename(os.path.splitext(file_path)[0]))
+        if file_path.endswith('.zip'):
+            with zipfile.ZipFile(abs_path, 'r') as zip_ref:
+                zip_ref.extractall(extract_dir)
+        else:
+            # For other archive types, use shutil which supports various formats
+            shutil.unpack_archive(abs_path, extract_dir)
+        logger.log(f"Extracted {file_path} to {extract_dir}")
+        return extract_dir
+    except Exception as e:
+        logger.log(f"Error extracting {file_path}: {e}")
+        return None
+
+def prepare_image(image_path, max_size=IMAGE_MAX_SIZE, image_format=VIDEO_FRAME_FORMAT, quality=VIDEO_FRAME_QUALITY):
+    """
+    Decodes an image, downscales it so its longest side is at most max_size pixels (0 keeps the
+    original size) and encodes it like the video frames.
+
+    Returns:
+        The image, base64 encoded.
+    """
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    return encode_image(image, image_format, quality)
+
+def prepare_video(video_path):
+    """
+    Decodes a video into its frames, one per second. Only the keyframes select_keyframes picks keep
+    their image; the other frames keep their timestamp and hash, which is all evaluate_videos needs
+    of them, so a prepared video holds at most VIDEO_MAX_KEYFRAMES images.
+    """
+    from step_synth.analyze import select_keyframes
+
+    return [frame if message is None else {**frame, "base64": None}
+            for frame, message in select_keyframes(iter_video_frames(video_path))]
+
+class AttachmentPreparation:
+    """
+    Prepares the files of a bug report on the attachment worker pool while the LLM stages run.
+    Archives are unpacked, the images and videos among the files and inside the archives are
+    found with find_media_files, and every image is decoded and downscaled and every video
+    decoded into its frames.
+
+    The results are collected with archives() and media(), which wait for the work they need.
+    """
+
+    def __init__(self, file_paths, executor=None):
+        self.executor = executor or get_executor()
+        self.lock = threading.Lock()
+        self.images = {}  # code -> (path, future of the base64 image)
+        self.videos = {}  # code -> (path, future of the frames)
+        self.archive_futures = {}
+        for file_path in file_paths or []:
+            if any(file_path.endswith(ext) for ext in ARCHIVE_EXTENSIONS):
+                self.archive_futures[file_path] = self.executor.submit(self._extract, file_path)
+            elif os.path.isdir(file_path):
+                self._add_media(*find_media_files(file_path, PICTURE_EXTENSIONS, VIDEO_EXTENSIONS))
+            else:
+                extension = os.path.splitext(file_path)[1].lower()
+                if extension in PICTURE_EXTENSIONS:
+                    self._add_media([file_path], [])
+                elif extension in VIDEO_EXTENSIONS:
+                    self._add_media([], [file_path])
+
+    def _add_media(self, image_files, video_files):
+        with self.lock:
+            for image_path in image_files:
+                self.images[str(uuid.uuid4())] = (image_path, self.executor.submit(prepare_image, image_path))
+            for video_path in video_files:
+                self.videos[str(uuid.uuid4())] = (video_path, self.executor.submit(prepare_video, video_path))
+
+    def _extract(self, file_path):
+        # The media of the archive are queued before the extraction counts as done, so media() never misses them
+        extract_dir = extract_archive(file_path)
+        if extract_dir is not None:
+            self._add_media(*find_media_files(extract_dir, PICTURE_EXTENSIONS, VIDEO_EXTENSIONS))
+        return extract_dir
+
+    def archives(self):
+        """
+        Returns:
+            The folder every archive was extracted to, keyed by the archive path. Archives that could not be extracted are left out.
+        """
+        extracted_paths = {file_path: future.result() for file_path, future in self.archive_futures.items()}
+        return {file_path: extract_dir for file_path, extract_dir in extracted_paths.items() if extract_dir is not None}
+
+    def media(self):
+        """
+        Waits for every image and video to be prepared. Files that cannot be decoded are logged and left out.
+
+        Returns:
+            A tuple containing:
+            - staged_files: The path of every image and video, keyed by a new code
+            - image_codes: Codes of the images
+            - video_codes: Codes of the videos
+            - prepared_images: The base64 encoded image of every image code
+            - prepared_frames: The frames of every video code
+        """
+        self.archives()
+        with self.lock:
+            images, videos = dict(self.images), dict(self.videos)
+
+        staged_files, prepared_images, prepared_frames = {}, {}, {}
+        for prepared, media in ((prepared_images, images), (prepared_frames, videos)):
+            for code, (path, future) in media.items():
+                try:
+                    prepared[code] = future.result()
+                    staged_files[code] = path
+                except Exception as e:
+                    logger.log(f"Could not prepare attachment {path}: {e}")
+        return staged_files, list(prepared_images), list(prepared_frames), prepared_images, prepared_frames
@@ -1,21 +1,19 @@
 from step_synth.prompts import *
 from step_synth.environment import *
 import os
-from langchain_community.tools import TavilySearchResults
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 from typing import Type, Dict, Any, List
 from langchain_core.output_parsers import PydanticOutputParser
+from llm_cache import configure_llm_cache
+from llm_replay import make_chat_model
+from step_synth.search import make_search_tool
 
-search_tool = TavilySearchResults(
-    max_results=5,
-    search_depth="advanced",
-    include_answer=False,
-    include_raw_content=True,
-    include_images=False,
-)
+configure_llm_cache()
+
+search_tool = make_search_tool()
 
 class JudgmentModel(BaseModel):
     """Model to judge a response."""
@@ -94,26 +92,33 @@ class StepSelection(BaseModel):
     )
 step_selection_parser = PydanticOutputParser(pydantic_object=StepSelection)
 step_selection_instructions = step_selection_parser.get_format_instructions()
+class StepSelectionList(BaseModel):
+    """Model to match steps with several images at once."""
+    selections: List[StepSelection] = Field(
+        description="One step selection per image or frame, in their order."
+    )
+step_selection_list_parser = PydanticOutputParser(pydantic_object=StepSelectionList)
+step_selection_list_instructions = step_selection_list_parser.get_format_instructions()
 
-s2r_rewrite_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-query_gen_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-judge_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-contradiction_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-suggestion_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-enhance_s2r_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-alternate_soln_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-node_extract_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-node_distill_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-step_cluster_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-reasnoning_trajectory_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-step_selection_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-cluster_check_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-cluster_rewrite_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-video_step_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-running_summary_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-final_cluster_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-mob_checker_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
-crash_checker_llm = ChatOpenAI(model_name=MODEL_NAME, temperature=0)
+s2r_rewrite_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+query_gen_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+judge_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+contradiction_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+suggestion_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+enhance_s2r_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+alternate_soln_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+node_extract_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+node_distill_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+step_cluster_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+reasnoning_trajectory_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+step_selection_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+cluster_check_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+cluster_rewrite_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+video_step_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+running_summary_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+final_cluster_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+mob_checker_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
+crash_checker_llm = make_chat_model(model_name=MODEL_NAME, temperature=0)
 query_gen_chat = ChatPromptTemplate(
     [("system", query_gen_prompt), ("user", "{bug_report}")]
 )
@@ -202,6 +207,32 @@ video_step_chat = ChatPromptTemplate(
     ],
     partial_variables= {"format_instructions": step_selection_instructions}
 )
+def image_batch_message(images):
+    """Returns the user message of batch_step_selection_chat for base64 encoded images, each preceded by its number."""
+    content = []
+    for i, image_data in enumerate(images):
+        content.append({"type": "text", "text": f"IMAGE {i + 1}:"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}})
+    return [HumanMessage(content=content)]
+
+# The images of a batch are passed as a user message built by image_batch_message
+batch_step_selection_chat = ChatPromptTemplate(
+    [("system", batch_step_selection_prompt + "\n" + "{format_instructions}"), ("user", "STEPS: \n {bug_report}"),
+    MessagesPlaceholder("images"),
+    ],
+    partial_variables= {"format_instructions": step_selection_list_instructions}
+)
+video_mosaic_step_chat = ChatPromptTemplate(
+    [("system", video_mosaic_step_prompt + "\n" + "{format_instructions}"), ("user", [
+        {"type": "text", "text": "STEPS: \n {bug_report} \n PREVIOUS FRAMES SUMMARY: \n {summary} \n LAST FRAME CONCLUSION: {conclusion} \n FRAMES IN THE MOSAIC: {frame_count}"},
+        {
+            "type": "image_url",
+            "image_url": {"url": "data:image/jpeg;base64,{image_data}"},
+        },
+    ]),
+    ],
+    partial_variables= {"format_instructions": step_selection_list_instructions}
+)
 running_summary_chat = ChatPromptTemplate(
     [("system", running_summary_prompt), ("user", "PREVIOUS SUMMARY: \n {previous_summary} \n CURRENT FRAME: \n {current_frame}"),
     ],
@@ -226,6 +257,8 @@ step_selection_chain = step_selection_chat | step_cluster_llm | step_selection_p
 cluster_check_chain = cluster_check_chat | cluster_check_llm | StrOutputParser()
 cluster_rewrite_chain = cluster_rewrite_chat | cluster_rewrite_llm | step_cluster_parser
 video_step_chain = video_step_chat | video_step_llm | step_selection_parser
+batch_step_selection_chain = batch_step_selection_chat | step_cluster_llm | step_selection_list_parser
+video_mosaic_step_chain = video_mosaic_step_chat | video_step_llm | step_selection_list_parser
 running_summary_chain = running_summary_chat | running_summary_llm | StrOutputParser()
 final_cluster_chain = final_cluster_chat | final_cluster_llm | step_cluster_parser
 mob_checker_chain = mob_checker_chat | mob_checker_llm | StrOutputParser()
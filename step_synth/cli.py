@@ -2,7 +2,11 @@ from typing import List, Optional, Dict
 from step_synth.environment import *
 from step_synth.analyze import *
 from step_synth.utils import *
+from step_synth.wiki_index import get_title_index
+from step_synth.attachments import AttachmentPreparation, get_executor
 from step_synth.logger import logger
+from stage_timer import stage
+import asyncio
 import threading
 import tempfile
 import os
@@ -14,9 +18,13 @@ from pathlib import Path
 
 class FileProcessor:
     def __init__(self):
-        self.filenames = get_filenames_from_folder(WIKI_DIRECTORY)
         self.staged_files = {}  # Dictionary to store staged files
         
+    @property
+    def title_index(self):
+        """Index of the wiki titles, loaded on first use from the file next to the wiki."""
+        return get_title_index(WIKI_DIRECTORY)
+
     def verify_world_structure(self, world_path):
         """
         Verify that a directory has the correct structure to be a Minecraft world.
@@ -36,54 +44,17 @@ class FileProcessor:
             raise Exception(f"Not a valid datapack - missing pack.mcmeta in {datapack_path}")
         return True
 
-    def process_files(
-        self,
-        video_codes: Optional[List[str]],
-        image_codes: Optional[List[str]],
-        description: Optional[str],
-        version: Optional[str],
-        config: Dict[str, str],
-        file_paths: Optional[List[str]] = None,
-    ):
+    def find_worlds_and_datapacks(self, file_paths, extracted_paths):
         """
-        Process files and generate clusters based on the description and available resources.
-        Identifies and validates worlds and datapacks but does not handle loading them.
-        
+        Finds the worlds and datapacks among the files of a bug report and inside its extracted archives.
+
         Args:
-            video_codes: List of video file codes
-            image_codes: List of image file codes
-            description: Bug description text
-            version: Minecraft version
-            config: Configuration dictionary
             file_paths: List of absolute paths to files in the bug report directory
-            
+            extracted_paths: The folder every archive was extracted to, keyed by the archive path
+
         Returns:
-            A tuple containing:
-            - clusters: The generated step clusters
-            - worlds: List of world paths
-            - datapacks: List of datapack paths
+            A tuple of the world and datapack dictionaries
         """
-        # First extract all archives
-        extracted_paths = {}
-        archive_extensions = ['.zip', '.rar', '.7z', '.tar', '.gz', '.tar.gz']
-        if file_paths:
-            for file_path in file_paths:
-                # Convert relative path to absolute path (redundant now since we already have absolute paths)
-                abs_path = os.path.abspath(file_path)
-                if any(file_path.endswith(ext) for ext in archive_extensions):
-                    try:
-                        extract_dir = os.path.join(tempfile.mkdtemp(), os.path.splitext(file_path)[0])
-                        if file_path.endswith('.zip'):
-                            with zipfile.ZipFile(abs_path, 'r') as zip_ref:
-                                zip_ref.extractall(extract_dir)
-                        else:
-                            # For other archive types, use shutil which supports various formats
-                            shutil.unpack_archive(abs_path, extract_dir)
-                        extracted_paths[file_path] = extract_dir
-                        logger.log(f"Extracted {file_path} to {extract_dir}")
-                    except Exception as e:
-                        logger.log(f"Error extracting {file_path}: {e}")
-
         # Analyze extracted contents and original files for worlds and datapacks
         worlds = []
         datapacks = []
@@ -137,34 +108,106 @@ class FileProcessor:
 
         logger.log(f"Found world directories: {[w['path'] for w in worlds]}")
         logger.log(f"Found datapack directories: {[d['path'] for d in datapacks]}")
+        return worlds, datapacks
+
+    def process_files(
+        self,
+        video_codes: Optional[List[str]],
+        image_codes: Optional[List[str]],
+        description: Optional[str],
+        version: Optional[str],
+        config: Dict[str, str],
+        file_paths: Optional[List[str]] = None,
+    ):
+        """
+        Process files and generate clusters based on the description and available resources.
+        Identifies and validates worlds and datapacks but does not handle loading them.
+        
+        Args:
+            video_codes: List of video file codes
+            image_codes: List of image file codes
+            description: Bug description text
+            version: Minecraft version
+            config: Configuration dictionary
+            file_paths: List of absolute paths to files in the bug report directory
+            
+        Returns:
+            A tuple containing:
+            - clusters: The generated step clusters
+            - worlds: List of world paths
+            - datapacks: List of datapack paths
+        """
+        # Attachments are unpacked, searched for worlds and datapacks and decoded on the attachment
+        # worker pool while the wiki and search stages wait on the network
+        attachments = None
+        if file_paths:
+            attachments = AttachmentPreparation(file_paths)
+            detection = get_executor().submit(lambda: self.find_worlds_and_datapacks(file_paths, attachments.archives()))
 
         # Continue with existing processing
         all_results = []
         if USE_WIKI:
             logger.log("Wiki RAG is being done.")
-            wiki_results = process_wiki(description, version, self.filenames)
+            with stage("process_wiki"):
+                if USE_ASYNC_STAGES:
+                    wiki_results = asyncio.run(aprocess_wiki(description, version, self.title_index))
+                else:
+                    wiki_results = process_wiki(description, version, self.title_index)
             all_results += wiki_results
 
         if USE_SEARCH:
             logger.log("Search tool is being used.")
-            search_results = search_iterations(description, wiki_results)
+            with stage("search_iterations"):
+                if USE_ASYNC_STAGES:
+                    search_results = asyncio.run(asearch_iterations(description, wiki_results))
+                else:
+                    search_results = search_iterations(description, wiki_results)
             logger.log(f"Search results processed: {search_results}")
             all_results += search_results
 
+        worlds, datapacks = [], []
+        if attachments:
+            with stage("prepare_attachments"):
+                worlds, datapacks = detection.result()
+
         datapack_list = list(set([d['path'] for d in datapacks]))
-        s2r = generate_s2r(description, all_results, datapack_list)
-        enhanced_s2r = enhance_s2r(s2r, all_results, description)
+        with stage("generate_s2r"):
+            s2r = generate_s2r(description, all_results, datapack_list)
+        with stage("enhance_s2r"):
+            if USE_PARALLEL_ENHANCE_S2R:
+                enhanced_s2r = asyncio.run(aenhance_s2r(s2r, all_results, description))
+            else:
+                enhanced_s2r = enhance_s2r(s2r, all_results, description)
         s2r = enhanced_s2r
 
-        clusters = process_clusters(s2r)
-        clusters = refine_clusters(clusters)
+        with stage("process_clusters"):
+            clusters = process_clusters(s2r)
+        with stage("refine_clusters"):
+            clusters = refine_clusters(clusters)
         clusters = remove_backslashes(clusters)
 
-        # Pass self.staged_files to the evaluation functions
-        image_datas = evaluate_images(clusters, all_results, image_codes, self.staged_files)
-        video_datas = evaluate_videos(clusters, all_results, video_codes, self.staged_files)
+        # The attachments get their own codes, next to the staged files
+        staged_files = self.staged_files
+        prepared_images, prepared_frames = {}, {}
+        if attachments:
+            with stage("prepare_attachments"):
+                attachment_files, attachment_images, attachment_videos, prepared_images, prepared_frames = attachments.media()
+            staged_files = {**self.staged_files, **attachment_files}
+            image_codes = list(image_codes or []) + attachment_images
+            video_codes = list(video_codes or []) + attachment_videos
+            logger.log(f"Prepared {len(attachment_images)} images and {len(attachment_videos)} videos from the attachments.")
+
+        # Pass the staged files to the evaluation functions
+        with stage("evaluate_images"):
+            if USE_ASYNC_STAGES:
+                image_datas = asyncio.run(aevaluate_images(clusters, all_results, image_codes, staged_files, prepared_images))
+            else:
+                image_datas = evaluate_images(clusters, all_results, image_codes, staged_files, prepared_images)
+        with stage("evaluate_videos"):
+            video_datas = evaluate_videos(clusters, all_results, video_codes, staged_files, prepared_frames)
         if USE_FINAL_CLUSTERING:
-            final_clustering(clusters, image_datas, video_datas)
+            with stage("final_clustering"):
+                final_clustering(clusters, image_datas, video_datas)
         logger.log("Bug report analyzed.", "end")
 
         # Return both clusters and world/datapack paths
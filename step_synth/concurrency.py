@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from langchain_core.runnables import RunnableLambda
+from step_synth.environment import MAX_CONCURRENT_LLM_CALLS
+
+# A thread semaphore rather than an asyncio one, so the limit holds across the event loops
+# of every thread in the process, e.g. the synthesis workers of a pipelined batch run.
+_llm_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LLM_CALLS)
+_loop_slots = weakref.WeakKeyDictionary()
+_loop_slots_lock = threading.Lock()
+
+def _loop_semaphore():
+    """
+    Returns the asyncio semaphore of the running event loop. It lets at most MAX_CONCURRENT_LLM_CALLS
+    tasks of the loop wait for a shared slot, so waiting never takes more threads than that.
+    """
+    loop = asyncio.get_running_loop()
+    with _loop_slots_lock:
+        if loop not in _loop_slots:
+            _loop_slots[loop] = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+        return _loop_slots[loop]
+
+async def _acquire_shared_slot():
+    if _llm_slots.acquire(blocking=False):
+        return
+    acquiring = asyncio.ensure_future(asyncio.to_thread(_llm_slots.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The waiting thread cannot be interrupted, the slot it gets is given back
+        acquiring.add_done_callback(lambda future: future.cancelled() or future.exception() or _llm_slots.release())
+        raise
+
+@asynccontextmanager
+async def llm_slot():
+    """Waits for one of the MAX_CONCURRENT_LLM_CALLS slots without blocking the event loop."""
+    async with _loop_semaphore():
+        await _acquire_shared_slot()
+        try:
+            yield
+        finally:
+            _llm_slots.release()
+
+async def ainvoke_limited(runnable, inputs):
+    async with llm_slot():
+        return await runnable.ainvoke(inputs)
+
+async def gather_limited(runnable, inputs_list):
+    """Invokes a runnable on every input concurrently. Results keep the order of the inputs."""
+    return await asyncio.gather(*(ainvoke_limited(runnable, inputs) for inputs in inputs_list))
+
+def invoke_limited(runnable, inputs, config=None):
+    """Blocking counterpart of ainvoke_limited, waits for one of the shared slots in the calling thread."""
+    with _llm_slots:
+        return runnable.invoke(inputs, config)
+
+def batch_limited(runnable, inputs_list, max_concurrency=MAX_CONCURRENT_LLM_CALLS):
+    """
+    Invokes a runnable on every input on a thread pool of max_concurrency threads, every call
+    holding one of the shared slots, so concurrent batches of several issues stay within the
+    process-wide limit. Results keep the order of the inputs.
+    """
+    limited = RunnableLambda(lambda inputs, config: invoke_limited(runnable, inputs, config))
+    return limited.batch(inputs_list, config={"max_concurrency": max_concurrency})
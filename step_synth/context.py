@@ -0,0 +1,145 @@
+import functools
+import math
+from step_synth.environment import MODEL_NAME, CONTEXT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGETS, CONTEXT_CHUNK_TOKENS
+from step_synth.logger import logger
+from step_synth.utils import array_to_dict, prepare_br
+from step_synth.wiki_retrieval import BM25Index
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(MODEL_NAME)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encodings are downloaded on first use, which fails offline
+        print(f"Could not load a tiktoken encoding, estimating tokens as characters / 4: {e}")
+        return None
+
+def count_tokens(text):
+    """Counts the tokens of a text with tiktoken, or estimates them as a quarter of its characters without it."""
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def context_budget(chain):
+    """Returns the token budget of the web content given to a chain, 0 if it gets all of it."""
+    return CONTEXT_TOKEN_BUDGETS.get(chain, CONTEXT_TOKEN_BUDGET)
+
+def chunk_text(text, chunk_tokens=CONTEXT_CHUNK_TOKENS):
+    """
+    Splits a text into chunks of about chunk_tokens tokens along its lines. Lines longer than
+    a chunk are split between words.
+    """
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        if count_tokens(line) <= chunk_tokens:
+            pieces.append(line)
+            continue
+        words = line.split(" ")
+        piece = ""
+        for word in words:
+            if piece and count_tokens(piece + word) > chunk_tokens:
+                pieces.append(piece)
+                piece = ""
+            piece += word + " "
+        pieces.append(piece)
+
+    chunks = []
+    chunk = ""
+    for piece in pieces:
+        if chunk and count_tokens(chunk + piece) > chunk_tokens:
+            chunks.append(chunk)
+            chunk = ""
+        chunk += piece
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def score_chunks(query, chunks):
+    """Scores chunks against a query with the BM25 index of the wiki retrieval, treating every chunk as an untitled page."""
+    return BM25Index.build(("", chunk) for chunk in chunks).scores(query).tolist()
+
+def _source_text(source):
+    return source["text"] if isinstance(source, dict) and "text" in source else str(source)
+
+def _render(sources, selected):
+    """Renders the selected chunks like array_to_dict renders the sources, keeping the source numbers and order."""
+    content = {}
+    for number, source in enumerate(sources):
+        chunks = [chunk for (source_number, chunk_number), chunk in sorted(selected.items()) if source_number == number]
+        if not chunks:
+            continue
+        text = " [...] ".join(chunks)
+        content[number + 1] = {**source, "text": text} if isinstance(source, dict) and "text" in source else text
+    return str(content)
+
+@functools.lru_cache(maxsize=32)
+def _assemble(query, sources_key, budget):
+    sources = [dict(source) if isinstance(source, tuple) else source for source in sources_key]
+    full_content = str(array_to_dict(sources))
+    full_tokens = count_tokens(full_content)
+    if full_tokens <= budget:
+        return full_content, full_tokens, full_tokens
+
+    chunks = {}
+    for source_number, source in enumerate(sources):
+        for chunk_number, chunk in enumerate(chunk_text(_source_text(source))):
+            chunks[(source_number, chunk_number)] = chunk
+    keys = list(chunks)
+    scores = dict(zip(keys, score_chunks(query, [chunks[key] for key in keys])))
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    selected = {}
+    used = 0
+    for key, score in ranked:
+        chunk_tokens = count_tokens(chunks[key])
+        if used + chunk_tokens <= budget:
+            selected[key] = chunks[key]
+            used += chunk_tokens
+    content = _render(sources, selected)
+    tokens = count_tokens(content)
+    # The rendering adds quotes, escapes and source titles on top of the chunks
+    while tokens > budget and selected:
+        del selected[min(selected, key=lambda key: (scores[key], key))]
+        content = _render(sources, selected)
+        tokens = count_tokens(content)
+    return content, tokens, full_tokens
+
+def prepare_context(bug_report, content, chain, budget=None):
+    """
+    Same as prepare_br, but the web content is cut down to the token budget of the chain.
+    The sources are split into chunks, scored against the bug report with BM25, and the best
+    chunks that fit the budget are kept in their original order.
+
+    Args:
+        bug_report: The bug report, steps or step clusters the content is given with.
+        content: The wiki pages, reasoning trajectories and search results.
+        chain: Name of the chain the prompt is for, selecting its budget.
+        budget: Token budget overriding the configured one of the chain.
+
+    Returns:
+        The prompt text in the format of prepare_br.
+    """
+    if budget is None:
+        budget = context_budget(chain)
+    if budget <= 0 or not content or isinstance(content, dict):
+        tokens = count_tokens(str(array_to_dict(content))) if content else 0
+        limit = f"budget {budget}" if budget > 0 else "no budget"
+        logger.log(f"Context for {chain}: {tokens} content tokens ({limit}).")
+        return prepare_br(bug_report, content)
+    sources_key = tuple(tuple(source.items()) if isinstance(source, dict) else str(source) for source in content)
+    content_str, tokens, full_tokens = _assemble(str(bug_report), sources_key, budget)
+    logger.log(f"Context for {chain}: {tokens} of {full_tokens} content tokens (budget {budget}).")
+    if len(content_str) > 4:
+        return str(bug_report) + "\nWEB CONTENT:\n" + content_str
+    return str(bug_report)
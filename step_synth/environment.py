@@ -20,10 +20,52 @@ USE_MOB_CHECKER = str_to_bool(os.getenv("USE_MOB_CHECKER", "True"))
 USE_REASONING_TRAJECTORY = str_to_bool(os.getenv("USE_REASONING_TRAJECTORY", "True"))
 USE_ALTERNATE_SOLUTIONS = str_to_bool(os.getenv("USE_ALTERNATE_SOLUTIONS", "False"))
 USE_FINAL_CLUSTERING = str_to_bool(os.getenv("USE_FINAL_CLUSTERING", "False"))
+USE_ASYNC_STAGES = str_to_bool(os.getenv("USE_ASYNC_STAGES", "False"))
+USE_PARALLEL_ENHANCE_S2R = str_to_bool(os.getenv("USE_PARALLEL_ENHANCE_S2R", "False"))
+USE_WIKI_CORPUS = str_to_bool(os.getenv("USE_WIKI_CORPUS", "True"))
 
 # Numerical values
 JUDGE_THRESHOLD = 7
 SOURCE_MAX_ITERATION = 1
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "8"))
+# "tavily" searches the web, "stub" searches the local wiki for offline tests and benchmarks
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "tavily").lower()
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "5"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "5"))
+# Search results are cached on disk by normalized query, entries older than the TTL are searched again (0 never expires them)
+USE_SEARCH_CACHE = str_to_bool(os.getenv("USE_SEARCH_CACHE", "True"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite")
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24"))
+WIKI_PAGE_CACHE_SIZE = int(os.getenv("WIKI_PAGE_CACHE_SIZE", "256"))
+# How process_wiki picks its candidate pages: "llm" extracts entities with an LLM and fuzzy matches them
+# with the titles, "bm25" ranks the pages with the local BM25 index instead, "hybrid" extracts and
+# matches like "llm" and keeps the WIKI_RETRIEVAL_TOP_K matches BM25 ranks highest.
+WIKI_RETRIEVAL_MODE = os.getenv("WIKI_RETRIEVAL_MODE", "llm").lower()
+WIKI_RETRIEVAL_TOP_K = int(os.getenv("WIKI_RETRIEVAL_TOP_K", "20"))
+# Token budget of the web content in every prompt, 0 gives the chains all of it. CONTEXT_TOKEN_BUDGETS
+# overrides it per chain, e.g. "judge_chain=2000,step_selection_chain=4000".
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+CONTEXT_TOKEN_BUDGETS = {
+    chain.strip(): int(budget)
+    for chain, budget in (item.split("=") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if item.strip())
+}
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "256"))
+# Video frames sent to the vision model: longest side in pixels (0 keeps the original size), image format and quality
+VIDEO_FRAME_MAX_SIZE = int(os.getenv("VIDEO_FRAME_MAX_SIZE", "1024"))
+VIDEO_FRAME_FORMAT = os.getenv("VIDEO_FRAME_FORMAT", "JPEG")
+VIDEO_FRAME_QUALITY = int(os.getenv("VIDEO_FRAME_QUALITY", "85"))
+# A video frame is analysed when its perceptual hash differs from the last analysed frame in more than
+# VIDEO_KEYFRAME_THRESHOLD of 64 bits, or from the previous frame in at least VIDEO_SCENE_CUT_THRESHOLD bits.
+# At most VIDEO_MAX_KEYFRAMES frames are analysed per video, 0 means no limit.
+VIDEO_KEYFRAME_THRESHOLD = int(os.getenv("VIDEO_KEYFRAME_THRESHOLD", "5"))
+VIDEO_SCENE_CUT_THRESHOLD = int(os.getenv("VIDEO_SCENE_CUT_THRESHOLD", "20"))
+VIDEO_MAX_KEYFRAMES = int(os.getenv("VIDEO_MAX_KEYFRAMES", "30"))
+# Images selected in one vision call, and video keyframes tiled into one mosaic per call; 1 sends them one by one
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "1"))
+VIDEO_MOSAIC_FRAMES = int(os.getenv("VIDEO_MOSAIC_FRAMES", "1"))
+# Worker threads that unpack, decode and downscale the attachments of bug reports, and the longest side of attached images
+ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", "4"))
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "1024"))
 
 # Model configuration
 MODEL_NAME = os.getenv("STEP_SYNTH_MODEL_NAME", "gpt-4o")
\ No newline at end of file
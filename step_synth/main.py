@@ -28,7 +28,7 @@ from step_synth.analyze import (
     final_clustering
 )
 from step_synth.logger import logger
-from step_synth.utils import get_filenames_from_folder
+from step_synth.wiki_index import get_title_index
 # Initialize the FastAPI application
 app = FastAPI()
 
@@ -44,12 +44,16 @@ app.add_middleware(
 class FileProcessorAPI:
     def __init__(self, app: FastAPI):
         self.app = app  # Correctly references the passed app instance
-        self.filenames = get_filenames_from_folder(WIKI_DIRECTORY)
         self.staged_files = {}  # Dictionary to store staged files
         self.app.post("/upload/")(self.upload_files)
         self.app.post("/stage-files/")(self.stage_files)
         self.app.get("/media/{file_code}")(self.serve_media)
 
+    @property
+    def title_index(self):
+        """Index of the wiki titles, loaded on first use from the file next to the wiki."""
+        return get_title_index(WIKI_DIRECTORY)
+
     def process_files(
         self,
         video_codes: Optional[List[str]],
@@ -61,7 +65,7 @@ class FileProcessorAPI:
         all_results = []
         if USE_WIKI:
             logger.log("Wiki RAG is being done.")
-            wiki_results = process_wiki(description, version, self.filenames)
+            wiki_results = process_wiki(description, version, self.title_index)
             all_results += wiki_results
 
         if USE_SEARCH:
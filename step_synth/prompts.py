@@ -357,6 +357,13 @@ step_selection_prompt = """Analyze the provided image and determine the most rel
 
 If the image correlates with the end of the steps, output 'END' and explain why the visual elements indicate the conclusion of the sequence. If the image does not relate to any of the given steps, output 'NOT RELEVANT' and describe why no connection can be drawn. Your output must include:
 
+1. **Reasoning Trace:** A step-by-step explanation of your analysis.
+2. **Image Annotation:** A detailed description of the image's relevant elements and their significance.
+3. **Conclusion:** The index of the selected step cluster, 'END,' or 'NOT RELEVANT.'"""
+batch_step_selection_prompt = """Analyze each of the provided images and determine the most relevant step cluster from the given step clusters for every image on its own. The images are numbered in the order they are given. For each decision, include a detailed reasoning trace explaining why a particular step cluster was selected, referencing the image's visual elements and their relationship to the steps provided. Provide annotations for every image, describing key features, context, and how they influence your decision-making.
+
+If an image correlates with the end of the steps, output 'END' for it and explain why the visual elements indicate the conclusion of the sequence. If an image does not relate to any of the given steps, output 'NOT RELEVANT' for it and describe why no connection can be drawn. Output exactly one selection per image, in the order of the images. Each selection must include:
+
 1. **Reasoning Trace:** A step-by-step explanation of your analysis.
 2. **Image Annotation:** A detailed description of the image's relevant elements and their significance.
 3. **Conclusion:** The index of the selected step cluster, 'END,' or 'NOT RELEVANT.'"""
@@ -369,6 +376,15 @@ If the video segment indicates the end of the sequence of steps, output 'END' an
 1. **Reasoning Trace:** A step-by-step explanation of your analysis, incorporating context from previous frames and the current frame.
 2. **Frame Annotation:** A detailed description of the current frame's relevant elements and their significance in light of the video context.
 3. **Conclusion:** The index of the selected step cluster, 'END,' or 'NOT RELEVANT.'"""
+video_mosaic_step_prompt = """Analyze the provided video segment, given as a mosaic of consecutive frames together with a summary of relevant features from previous frames, and determine the most relevant step cluster from the given step clusters for every frame of the mosaic. The frames are tiled in reading order, left to right and top to bottom, and each frame is labelled with its number and timestamp in its top left corner. For each decision, include a detailed reasoning trace explaining why a particular step cluster was selected, referencing the frame's visual elements, their relationship to the steps provided, and the context from the earlier frames.
+
+Additionally, provide annotations for every frame, describing key features, context, and how they influence your decision-making in combination with the summarized information from earlier frames.
+
+If a frame indicates the end of the sequence of steps, output 'END' for it and explain why the visual elements and context suggest the conclusion. If a frame does not relate to any of the given steps, output 'NOT RELEVANT' for it and describe why no connection can be drawn. Output exactly one selection per frame, in the order of the frames. Each selection must include:
+
+1. **Reasoning Trace:** A step-by-step explanation of your analysis, incorporating context from previous frames and the current frame.
+2. **Frame Annotation:** A detailed description of the frame's relevant elements and their significance in light of the video context.
+3. **Conclusion:** The index of the selected step cluster, 'END,' or 'NOT RELEVANT.'"""
 running_summary_prompt = """You will be provided with the current frame's annotations and a summary of relevant features from previous frames in a video sequence. Your task is to integrate the current frame's annotations into the summary to produce an updated and coherent description of the video’s progression. Ensure the updated summary reflects the cumulative context and captures any new developments or shifts indicated by the current frame's annotations.
 
 Specifically, follow these guidelines:
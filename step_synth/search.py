@@ -0,0 +1,199 @@
+import ast
+import json
+import re
+import sqlite3
+import threading
+import time
+from langchain_core.runnables import RunnableLambda
+from step_synth.environment import (
+    WIKI_DIRECTORY, SEARCH_BACKEND, USE_SEARCH_CACHE, SEARCH_CACHE_PATH, SEARCH_CACHE_TTL_HOURS, SEARCH_MAX_RESULTS
+)
+from step_synth.logger import logger
+
+def normalize_query(query):
+    """Lowercases a query and collapses its whitespace and surrounding punctuation, so trivially different queries share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s]+$|^[^\w\s]+", "", str(query).strip()).lower().split())
+
+def parse_queries(text):
+    """
+    Parses the query list written by query_chain without evaluating it as code. The list may be
+    wrapped in a code block or surrounded by text; without a list, every non-empty line is a query.
+
+    Returns:
+        The queries, without empty and repeated ones.
+    """
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    queries = None
+    if match:
+        try:
+            queries = ast.literal_eval(match.group(0))
+        except (ValueError, SyntaxError):
+            queries = None
+    if not isinstance(queries, (list, tuple)):
+        queries = [line.strip().strip('",') for line in text.splitlines() if line.strip() and not line.strip().startswith("```")]
+    unique = {}
+    for query in queries:
+        query = str(query).strip()
+        if query and normalize_query(query) not in unique:
+            unique[normalize_query(query)] = query
+    return list(unique.values())
+
+class SearchCache:
+    """
+    Disk-backed cache of search results keyed by backend, result count and normalized query, shared by every
+    issue and process using the same file. Entries older than the TTL are treated as misses.
+    """
+
+    def __init__(self, path, ttl_seconds=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "writes": 0}
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                backend TEXT NOT NULL,
+                query TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (backend, query)
+            )""")
+
+    def get(self, backend, query):
+        with self.lock:
+            row = self.connection.execute("SELECT results, created FROM search_cache WHERE backend = ? AND query = ?",
+                                          (backend, normalize_query(query))).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            if self.ttl_seconds and time.time() - row[1] > self.ttl_seconds:
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, backend, query, results):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_cache (backend, query, results, created) VALUES (?, ?, ?, ?)",
+                (backend, normalize_query(query), json.dumps(results), time.time()))
+            self.counters["writes"] += 1
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({"entries": entries, "hit_rate": stats["hits"] / lookups if lookups else None})
+        return stats
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """Returns the search cache of the SEARCH_CACHE_* settings, created on first use, or None if caching is off."""
+    global _search_cache
+    if not USE_SEARCH_CACHE:
+        return None
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache(SEARCH_CACHE_PATH, SEARCH_CACHE_TTL_HOURS * 3600 if SEARCH_CACHE_TTL_HOURS > 0 else None)
+        return _search_cache
+
+def search_cache_stats():
+    """Returns the counters of the search cache, or None if it was not used."""
+    with _search_cache_lock:
+        return _search_cache.stats() if _search_cache is not None else None
+
+def stub_search(query, max_results=SEARCH_MAX_RESULTS):
+    """
+    Offline search backend for tests and benchmarks: ranks the local wiki pages for the query
+    with BM25 and returns them in the shape of the Tavily results.
+    """
+    from step_synth.wiki_corpus import get_corpus
+    from step_synth.wiki_retrieval import rank_wiki_pages
+
+    corpus = get_corpus(WIKI_DIRECTORY)
+    results = []
+    for title in rank_wiki_pages(WIKI_DIRECTORY, query, max_results):
+        text = corpus.read(title) or ""
+        results.append({"url": f"wiki://{title}", "title": title, "content": text[:1000], "raw_content": text})
+    return results
+
+def make_search_tool(backend=SEARCH_BACKEND, max_results=SEARCH_MAX_RESULTS):
+    """
+    Returns the search tool of search_iterations: a runnable mapping a query to a list of result
+    dictionaries with at least "url" and "content", served from the search cache when possible.
+
+    Args:
+        backend: "tavily" for the Tavily web search, "stub" for the offline wiki search.
+        max_results: Results per query.
+    """
+    if backend == "tavily":
+        from langchain_community.tools import TavilySearchResults
+
+        tavily = TavilySearchResults(
+            max_results=max_results,
+            search_depth="advanced",
+            include_answer=False,
+            include_raw_content=True,
+            include_images=False,
+        )
+        search, asearch = tavily.invoke, tavily.ainvoke
+    elif backend == "stub":
+        def search(query):
+            return stub_search(query, max_results)
+
+        async def asearch(query):
+            return stub_search(query, max_results)
+    else:
+        raise ValueError(f"Unknown search backend: {backend}")
+    # Results searched with another result count are a different cache entry
+    cache_backend = f"{backend}:{max_results}"
+
+    def store(query, results):
+        # The tool returns an error message instead of a list when a search fails, which must not be cached
+        cache = get_search_cache()
+        if cache is not None and isinstance(results, list):
+            cache.put(cache_backend, query, results)
+        return results
+
+    def invoke(query):
+        cache = get_search_cache()
+        results = cache.get(cache_backend, query) if cache is not None else None
+        return results if results is not None else store(query, search(query))
+
+    async def ainvoke(query):
+        cache = get_search_cache()
+        results = cache.get(cache_backend, query) if cache is not None else None
+        return results if results is not None else store(query, await asearch(query))
+
+    return RunnableLambda(invoke, afunc=ainvoke, name="search_tool")
+
+def dedupe_results(queries, query_results, seen_urls):
+    """
+    Pairs every search result with its query, leaving out results whose URL was already returned
+    for another query of the issue, and failed searches.
+
+    Args:
+        queries: The searched queries.
+        query_results: The results of every query, in the same order.
+        seen_urls: URLs returned so far for the issue, updated in place.
+
+    Returns:
+        (query, result) pairs in query and result order.
+    """
+    pairs = []
+    for query, results in zip(queries, query_results):
+        if not isinstance(results, list):
+            logger.log(f"Search failed for {query}: {results}")
+            continue
+        for result in results:
+            url = result.get("url")
+            if url and url in seen_urls:
+                continue
+            seen_urls.add(url)
+            pairs.append((query, result))
+    return pairs
@@ -1,10 +1,14 @@
 import os
 import re
 import base64
+import subprocess
+import numpy as np
 from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 from PIL import Image
 import io
 from datetime import datetime, timedelta
+from step_synth.environment import VIDEO_FRAME_MAX_SIZE, VIDEO_FRAME_FORMAT, VIDEO_FRAME_QUALITY
 
 def get_filenames_from_folder(folder_path):
     """
@@ -181,11 +185,146 @@ def get_first_frames_each_second_as_base64(video_path):
 
     return base64_frames
 
+def encode_image(image, image_format=VIDEO_FRAME_FORMAT, quality=VIDEO_FRAME_QUALITY):
+    """Encodes a Pillow image in image_format and returns it base64 encoded."""
+    buffer = io.BytesIO()
+    if image_format.upper() in ("JPEG", "JPG"):
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def ffmpeg_binary():
+    """
+    Returns the ffmpeg executable moviepy decodes with: moviepy's FFMPEG_BINARY setting if it
+    names one, otherwise the one installed with imageio-ffmpeg.
+    """
+    binary = os.getenv("FFMPEG_BINARY", "ffmpeg-imageio")
+    if binary not in ("ffmpeg-imageio", "auto-detect"):
+        return binary
+    try:
+        from imageio_ffmpeg import get_ffmpeg_exe
+    except ImportError:
+        return "ffmpeg"
+    return get_ffmpeg_exe()
+
+def iter_video_frames(video_path, max_size=VIDEO_FRAME_MAX_SIZE, image_format=VIDEO_FRAME_FORMAT, quality=VIDEO_FRAME_QUALITY):
+    """
+    Yields the same frames as get_first_frames_each_second_as_base64 one at a time, downscaled
+    and compressed, so that only one decoded frame is held in memory and the first frame can be
+    evaluated while the rest of the video is still being decoded.
+
+    The video is decoded once from start to end by ffmpeg, which only passes on the frames
+    VideoFileClip.get_frame returns for every whole second, frame int(fps * t) at the frame rate
+    moviepy reads from the video, and the frame it returns for the duration, already scaled to
+    max_size pixels on the longest side.
+
+    :param video_path: Path to the video file.
+    :param max_size: Longest side of the yielded frames in pixels, 0 keeps the original size.
+    :param image_format: Pillow format the frames are encoded in, e.g. JPEG, WEBP or PNG.
+    :param quality: Encoding quality of the lossy formats.
+    :return: Generator of dictionaries with 'base64' and 'timestamp' keys, and the 'dhash' of the frame.
+    """
+    infos = ffmpeg_parse_infos(video_path)
+    width, height = infos["video_size"]
+    if infos.get("video_rotation", 0) in (90, 270):
+        # ffmpeg rotates the frames upright
+        width, height = height, width
+    if max_size and max(width, height) > max_size:
+        scale = max_size / max(width, height)
+        # Most encoders and filters want even dimensions
+        width, height = max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+    duration = infos["duration"]
+    fps = infos["video_fps"]
+
+    def seconds_to_timecode(seconds):
+        return str(timedelta(seconds=int(seconds))).zfill(8)
+
+    def to_frame(frame, t):
+        image = Image.fromarray(frame)
+        return {'base64': encode_image(image, image_format, quality), 'timestamp': seconds_to_timecode(t), 'dhash': dhash(image)}
+
+    frame_size = width * height * 3
+    # Frame n is selected if it is frame int(fps * t + 0.00001) of a whole second t before the last one,
+    # like moviepy picks it, or the frame get_frame picks for the duration. The first frame is always
+    # selected, moviepy reads it when it opens the video.
+    last_second = max(int(fps * int(duration) + 0.00001), 1)
+    last_frame = int(fps * duration + 0.00001)
+    select = f"lt(n\\,{last_second})*eq(floor({fps}*ceil((n-0.00001)/{fps})+0.00001)\\,n)+eq(n\\,{last_frame})"
+    command = [
+        ffmpeg_binary(), "-v", "error", "-i", video_path,
+        "-vf", f"select='{select}',scale={width}:{height}",
+        "-vsync", "vfr", "-f", "image2pipe", "-pix_fmt", "rgb24", "-vcodec", "rawvideo", "-",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_size)
+    frame = None
+    try:
+        for t in range(0, int(duration)):
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            frame = np.frombuffer(data, dtype=np.uint8).reshape((height, width, 3))
+            yield to_frame(frame, t)
+        # Like get_frame, the last frame read stands for the duration if the video ends before it
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            frame = np.frombuffer(data, dtype=np.uint8).reshape((height, width, 3))
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+    if frame is not None:
+        yield to_frame(frame, duration)
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of an image: one bit per horizontally adjacent pixel pair of a tiny
+    grayscale version, set where the right pixel is brighter. Visually similar images have
+    hashes that differ in few bits, unlike their encoded bytes.
+    """
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count("1")
+
+def make_mosaic(frames, image_format=VIDEO_FRAME_FORMAT, quality=VIDEO_FRAME_QUALITY):
+    """
+    Tiles video frames into one image, in reading order on a near-square grid, with the
+    number and timestamp of every frame written in its top left corner.
+
+    :param frames: Frames as yielded by iter_video_frames.
+    :return: The mosaic, base64 encoded in image_format.
+    """
+    from PIL import ImageDraw
+
+    images = [Image.open(io.BytesIO(base64.b64decode(frame['base64']))).convert("RGB") for frame in frames]
+    columns = int(np.ceil(np.sqrt(len(images))))
+    rows = int(np.ceil(len(images) / columns))
+    tile_width = max(image.width for image in images)
+    tile_height = max(image.height for image in images)
+    mosaic = Image.new("RGB", (columns * tile_width, rows * tile_height))
+    draw = ImageDraw.Draw(mosaic)
+    for i, (image, frame) in enumerate(zip(images, frames)):
+        x, y = (i % columns) * tile_width, (i // columns) * tile_height
+        mosaic.paste(image, (x, y))
+        label = f"{i + 1}: {frame['timestamp']}"
+        draw.rectangle(draw.textbbox((x + 4, y + 4), label), fill="black")
+        draw.text((x + 4, y + 4), label, fill="white")
+    return encode_image(mosaic, image_format, quality)
+
 def find_matches(array, main_string):
     """
     Find which phrases in the array are present in the main string with a fuzzy matching
     of maximum edit distance 1 (including transpositions), ignoring case.
+    The array can also be a WikiTitleIndex built from the phrases, which finds the same matches much faster.
     """
+    if isinstance(array, WikiTitleIndex):
+        return array.find_matches(main_string)
+
     # Tokenize the main string into words
     main_words = re.findall(r'\w+', main_string.lower())
 
@@ -214,6 +353,66 @@ def find_matches(array, main_string):
 
     return matches
 
+class WikiTitleIndex:
+    """
+    Precomputed index of the wiki titles that returns the same matches as find_matches
+    without comparing every title with every word sequence of the text.
+
+    Every normalized title is stored under itself and under each string obtained by
+    deleting one of its characters. Two strings within one Damerau-Levenshtein edit of
+    each other always share one of these keys, so a word sequence only has to look up its
+    own keys and verify the few candidates found. Word sequences longer than the longest
+    title plus one character can never match and are not generated.
+    """
+
+    def __init__(self, titles, normalized_titles=None, keys=None):
+        """
+        Args:
+            titles: The wiki titles.
+            normalized_titles: normalize() of every title, if already known.
+            keys: The normalized titles stored under every deletion key, if already known,
+                as written by a previous index over the same titles.
+        """
+        if normalized_titles is None:
+            normalized_titles = [normalize(title) for title in titles]
+        self.titles = {}
+        for title, norm_title in zip(titles, normalized_titles):
+            self.titles.setdefault(norm_title, []).append(title)
+        if keys is None:
+            keys = {}
+            for norm_title in self.titles:
+                for key in self.deletion_keys(norm_title):
+                    keys.setdefault(key, set()).add(norm_title)
+        self.keys = keys
+        self.max_length = max((len(norm_title) for norm_title in self.titles), default=0)
+
+    @staticmethod
+    def deletion_keys(s):
+        keys = {s}
+        for i in range(len(s)):
+            keys.add(s[:i] + s[i + 1:])
+        return keys
+
+    def find_matches(self, main_string):
+        """Same as find_matches(titles, main_string)."""
+        main_words = re.findall(r'\w+', main_string.lower())
+        matches = set()
+        checked = set()
+        for i in range(len(main_words)):
+            norm_substr = ""
+            for j in range(i, len(main_words)):
+                norm_substr += normalize(main_words[j])
+                if len(norm_substr) > self.max_length + 1:
+                    break
+                if norm_substr in checked:
+                    continue
+                checked.add(norm_substr)
+                for key in self.deletion_keys(norm_substr):
+                    for norm_title in self.keys.get(key, ()):
+                        if is_within_one_damerau_levenshtein(norm_title, norm_substr):
+                            matches.update(self.titles[norm_title])
+        return matches
+
 def array_to_dict(arr):
     if type(arr) is dict:
         return arr
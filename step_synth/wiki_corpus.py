@@ -0,0 +1,215 @@
+import argparse
+import functools
+import json
+import mmap
+import os
+import threading
+import time
+from step_synth.environment import WIKI_DIRECTORY, WIKI_PAGE_CACHE_SIZE
+
+def corpus_paths(wiki_directory):
+    """
+    Returns the data file and the offset index of the packed corpus of a wiki. Both are stored
+    next to the wiki folder rather than inside it, so writing them does not change the wiki.
+    """
+    base = os.path.normpath(os.path.abspath(wiki_directory))
+    return base + ".corpus", base + ".corpus_index"
+
+def page_key(wiki_directory, file_path):
+    """Returns the name read_files would use for a page: its path below the wiki without the .txt extension."""
+    relative_path = os.path.relpath(file_path, wiki_directory)
+    return relative_path[:-len(".txt")].replace(os.sep, "/")
+
+def scan_pages(wiki_directory):
+    """
+    Returns:
+        The modification time of every folder of the wiki, and the path, modification time and size of every page.
+    """
+    directories = {}
+    pages = {}
+    for root, dirs, files in os.walk(wiki_directory):
+        directories[root] = os.stat(root).st_mtime_ns
+        for file in files:
+            if file.endswith(".txt"):
+                file_path = os.path.join(root, file)
+                file_stat = os.stat(file_path)
+                pages[page_key(wiki_directory, file_path)] = (file_path, file_stat.st_mtime_ns, file_stat.st_size)
+    return directories, pages
+
+def build_corpus(wiki_directory):
+    """
+    Packs every page of a wiki into one data file and writes the offset index next to it.
+    Pages are stored as read_files reads them, decoded as UTF-8 with universal newlines;
+    pages that cannot be decoded are left out and keep being read from disk.
+
+    Returns:
+        The number of packed pages.
+    """
+    wiki_directory = os.path.abspath(wiki_directory)
+    data_path, index_path = corpus_paths(wiki_directory)
+    directories, pages = scan_pages(wiki_directory)
+    index = {
+        "wiki_directory": wiki_directory,
+        "directories": directories,
+        "files": {key: [mtime_ns, size] for key, (file_path, mtime_ns, size) in pages.items()},
+        "pages": {},
+    }
+    offset = 0
+    with open(f"{data_path}.{os.getpid()}.tmp", "wb") as data_file:
+        for key, (file_path, mtime_ns, size) in pages.items():
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    data = f.read().encode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                continue
+            data_file.write(data)
+            index["pages"][key] = [offset, len(data)]
+            offset += len(data)
+    with open(f"{index_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, ensure_ascii=False)
+    # The index is replaced last, an index always describes a complete data file
+    os.replace(f"{data_path}.{os.getpid()}.tmp", data_path)
+    os.replace(f"{index_path}.{os.getpid()}.tmp", index_path)
+    return len(index["pages"])
+
+class WikiCorpus:
+    """
+    Packed wiki pages read through a memory mapping, with an LRU cache of decoded pages.
+
+    Pages missing from the corpus are read from the wiki folder like read_files does. On Windows,
+    where the wiki folder is case-insensitive, a page is also found under a differently cased name.
+    """
+
+    def __init__(self, wiki_directory, cache_size=WIKI_PAGE_CACHE_SIZE):
+        self.wiki_directory = os.path.abspath(wiki_directory)
+        data_path, index_path = corpus_paths(self.wiki_directory)
+        with open(index_path, "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.pages = self.index["pages"]
+        self.folded_pages = {key.lower(): key for key in self.pages} if os.name == "nt" else {}
+        with open(data_path, "rb") as f:
+            # An empty file cannot be mapped, it can only belong to a wiki without readable pages
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.disk_reads = 0
+        self.decode = functools.lru_cache(maxsize=cache_size)(self._decode)
+
+    def is_current(self):
+        """
+        Checks that no page of the wiki was added, removed or modified since the corpus was packed.
+        Adding, removing or renaming a page changes the modification time of its folder, so the
+        folders are checked instead of walking the wiki; pages edited in place are found by their
+        modification time and size.
+        """
+        if self.index["wiki_directory"] != self.wiki_directory or "files" not in self.index:
+            return False
+        try:
+            for directory, mtime_ns in self.index["directories"].items():
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return False
+            for key, (mtime_ns, size) in self.index["files"].items():
+                file_stat = os.stat(os.path.join(self.wiki_directory, f"{key}.txt"))
+                if file_stat.st_mtime_ns != mtime_ns or file_stat.st_size != size:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def _decode(self, key):
+        offset, length = self.pages[key]
+        return self.data[offset:offset + length].decode("utf-8")
+
+    def iter_pages(self):
+        """Yields the name and text of every packed page, bypassing the page cache."""
+        for key in self.pages:
+            yield key, self._decode(key)
+
+    def read(self, file_name):
+        """
+        Returns:
+            The text of a page, or None if the page does not exist.
+        """
+        key = file_name if file_name in self.pages else self.folded_pages.get(file_name.lower())
+        if key is not None:
+            return self.decode(key)
+        file_path = os.path.join(self.wiki_directory, f"{file_name}.txt")
+        if not os.path.exists(file_path):
+            return None
+        self.disk_reads += 1
+        with open(file_path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def stats(self):
+        cache_info = self.decode.cache_info()
+        lookups = cache_info.hits + cache_info.misses
+        return {
+            "pages": len(self.pages),
+            "hits": cache_info.hits,
+            "misses": cache_info.misses,
+            "cached": cache_info.currsize,
+            "cache_size": cache_info.maxsize,
+            "hit_rate": cache_info.hits / lookups if lookups else None,
+            "disk_reads": self.disk_reads,
+        }
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+def get_corpus(wiki_directory):
+    """
+    Returns the packed corpus of a wiki, shared by every caller in the process. The corpus is
+    checked against the wiki folders once when first opened and packed again if it is missing or stale.
+    """
+    wiki_directory = os.path.abspath(wiki_directory)
+    with _corpora_lock:
+        if wiki_directory not in _corpora:
+            corpus = None
+            try:
+                corpus = WikiCorpus(wiki_directory)
+                if not corpus.is_current():
+                    corpus.close()
+                    corpus = None
+            except (OSError, ValueError):
+                corpus = None
+            if corpus is None:
+                start = time.perf_counter()
+                packed = build_corpus(wiki_directory)
+                print(f"Packed {packed} wiki pages in {time.perf_counter() - start:.1f}s")
+                corpus = WikiCorpus(wiki_directory)
+            _corpora[wiki_directory] = corpus
+        return _corpora[wiki_directory]
+
+def read_wiki_pages(base_directory, file_names):
+    """
+    Same as read_files, served from the packed corpus of the wiki.
+
+    Returns:
+        A list of {"title", "text"} dictionaries for the pages that exist.
+    """
+    corpus = get_corpus(base_directory)
+    file_objects = []
+    for file_name in file_names:
+        text = corpus.read(file_name)
+        if text is not None:
+            file_objects.append({"title": file_name, "text": text})
+        else:
+            print(f"File not found: {os.path.join(base_directory, f'{file_name}.txt')}")
+    return file_objects
+
+def wiki_corpus_stats():
+    """Returns the page cache counters of every corpus opened in this process, keyed by wiki folder."""
+    with _corpora_lock:
+        return {wiki_directory: corpus.stats() for wiki_directory, corpus in _corpora.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs the wiki pages into a memory-mapped corpus read by the step synthesizer.")
+    parser.add_argument("wiki_directory", nargs="?", default=WIKI_DIRECTORY, help="Wiki folder (default: WIKI_DIRECTORY).")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    packed = build_corpus(args.wiki_directory)
+    data_path, index_path = corpus_paths(args.wiki_directory)
+    print(f"Packed {packed} pages into {data_path} and {index_path} in {time.perf_counter() - start:.1f}s")
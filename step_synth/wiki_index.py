@@ -0,0 +1,182 @@
+import json
+import mmap
+import os
+import pickle
+import threading
+from step_synth.utils import WikiTitleIndex, normalize
+
+INDEX_MAGIC = b"STEP_SYNTH_WIKI_TITLES 1\n"
+
+def index_path(wiki_directory):
+    """
+    Returns where the title index of a wiki is stored: next to the wiki folder rather than inside it,
+    so that writing the index does not change the folder it describes.
+    """
+    return os.path.normpath(os.path.abspath(wiki_directory)) + ".title_index"
+
+def keys_path(wiki_directory):
+    """Returns where the deletion keys of the WikiTitleIndex of a wiki are stored, next to its title index."""
+    return index_path(wiki_directory) + ".keys"
+
+def scan_wiki(wiki_directory):
+    """
+    Walks the wiki like get_filenames_from_folder.
+
+    Returns:
+        The titles in walk order, and the modification time of every folder of the wiki keyed by its path.
+    """
+    titles = []
+    directories = {}
+    for root, dirs, files in os.walk(os.path.abspath(wiki_directory)):
+        directories[root] = os.stat(root).st_mtime_ns
+        for file in files:
+            filename, _ = os.path.splitext(file)
+            titles.append(filename)
+    return titles, directories
+
+def write_title_index(path, wiki_directory, titles, directories):
+    """
+    Writes the titles and their normalized forms to the index file, replacing it atomically.
+    The file is a magic line, a JSON header line with the folder modification times and
+    the NUL-separated title and normalized title pairs.
+    """
+    header = {
+        "wiki_directory": os.path.abspath(wiki_directory),
+        "count": len(titles),
+        "directories": directories,
+    }
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+        for title in titles:
+            f.write(title.encode("utf-8", "surrogateescape") + b"\0")
+            f.write(normalize(title).encode("utf-8", "surrogateescape") + b"\0")
+    os.replace(temp_path, path)
+
+def write_title_keys(path, wiki_directory, keys, directories):
+    """
+    Pickles the deletion keys of a WikiTitleIndex with the folder modification times of the
+    title index they were built with, replacing the file atomically. The normalized titles of
+    every key are stored as a tuple, which unpickles several times faster than a set.
+    """
+    data = {
+        "wiki_directory": os.path.abspath(wiki_directory),
+        "directories": directories,
+        "keys": {key: tuple(norm_titles) for key, norm_titles in keys.items()},
+    }
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+def read_title_keys(path, wiki_directory, directories):
+    """
+    Returns:
+        The deletion keys stored in the file, or None if the file is missing, unreadable or was
+        written for other folder modification times than the title index being loaded.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+    if data.get("wiki_directory") != os.path.abspath(wiki_directory) or data.get("directories") != directories:
+        return None
+    return data["keys"]
+
+class PersistedTitleIndex:
+    """
+    Memory-mapped title index file. Only the header is parsed when opened; the titles are
+    decoded from the mapping when first needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not a wiki title index")
+        header_end = self.data.find(b"\n", len(INDEX_MAGIC))
+        self.header = json.loads(self.data[len(INDEX_MAGIC):header_end].decode("utf-8"))
+        self.body_start = header_end + 1
+
+    def is_current(self, wiki_directory):
+        """
+        Checks whether the wiki is unchanged since the index was written. Adding, removing or
+        renaming a page changes the modification time of its folder, so only the folders are checked.
+        """
+        if self.header["wiki_directory"] != os.path.abspath(wiki_directory):
+            return False
+        for directory, mtime_ns in self.header["directories"].items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def titles(self):
+        """
+        Returns:
+            The titles and their normalized forms, as two lists.
+        """
+        fields = self.data[self.body_start:].split(b"\0")[:-1]
+        decoded = [field.decode("utf-8", "surrogateescape") for field in fields]
+        return decoded[0::2], decoded[1::2]
+
+    def close(self):
+        self.data.close()
+
+def load_title_index(wiki_directory):
+    """
+    Loads the title index of a wiki and the deletion keys of its WikiTitleIndex from their files,
+    rebuilding and rewriting a file if it is missing or the wiki changed since it was written.
+
+    Returns:
+        The wiki titles and a WikiTitleIndex over them.
+    """
+    path = index_path(wiki_directory)
+    try:
+        persisted = PersistedTitleIndex(path)
+    except (OSError, ValueError):
+        persisted = None
+    if persisted is not None:
+        try:
+            if persisted.is_current(wiki_directory):
+                titles, normalized_titles = persisted.titles()
+                directories = persisted.header["directories"]
+                keys = read_title_keys(keys_path(wiki_directory), wiki_directory, directories)
+                if keys is not None:
+                    return titles, WikiTitleIndex(titles, normalized_titles, keys)
+                title_index = WikiTitleIndex(titles, normalized_titles)
+                try:
+                    write_title_keys(keys_path(wiki_directory), wiki_directory, title_index.keys, directories)
+                except OSError as e:
+                    print(f"Could not write the wiki title keys to {keys_path(wiki_directory)}: {e}")
+                return titles, title_index
+        finally:
+            persisted.close()
+
+    titles, directories = scan_wiki(wiki_directory)
+    title_index = WikiTitleIndex(titles)
+    try:
+        write_title_index(path, wiki_directory, titles, directories)
+        write_title_keys(keys_path(wiki_directory), wiki_directory, title_index.keys, directories)
+    except OSError as e:
+        print(f"Could not write the wiki title index to {path}: {e}")
+    return titles, title_index
+
+_title_indexes = {}
+_title_indexes_lock = threading.Lock()
+
+def get_title_index(wiki_directory):
+    """
+    Returns the WikiTitleIndex of a wiki, loading it on first use. The index is shared by
+    every caller in the process and checked against the wiki only when first loaded.
+    """
+    with _title_indexes_lock:
+        if wiki_directory not in _title_indexes:
+            _title_indexes[wiki_directory] = load_title_index(wiki_directory)[1]
+        return _title_indexes[wiki_directory]
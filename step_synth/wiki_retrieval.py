@@ -0,0 +1,205 @@
+import argparse
+import math
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import Counter
+import numpy as np
+from step_synth.environment import WIKI_DIRECTORY
+from step_synth.wiki_corpus import corpus_paths, get_corpus
+
+# Words too common in bug reports and wiki pages to tell pages apart
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have he her his how i if in into is it its
+me my no not of on or our she so than that the their them then there these they this to was we were what
+when where which while who will with would you your
+""".split())
+
+# Title words are counted this many times, a page is most often about what its title says
+TITLE_WEIGHT = 3
+K1 = 1.2
+B = 0.75
+
+def tokenize(text):
+    return [token for token in re.findall(r'\w+', text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+def index_path(wiki_directory):
+    """Returns where the BM25 index of a wiki is stored, next to its packed corpus."""
+    return os.path.normpath(os.path.abspath(wiki_directory)) + ".bm25.npz"
+
+def _join(strings):
+    return np.frombuffer("\0".join(strings).encode("utf-8", "surrogateescape"), dtype=np.uint8)
+
+def _split(array):
+    return array.tobytes().decode("utf-8", "surrogateescape").split("\0") if len(array) else []
+
+class BM25Index:
+    """
+    Inverted index over the titles and bodies of the wiki pages, ranking pages for a text with BM25.
+
+    The postings of all terms are stored in two flat arrays, sorted by term, with the start of
+    every term's postings in `offsets`, so the whole index is a handful of numpy arrays.
+    """
+
+    def __init__(self, titles, terms, offsets, doc_ids, term_freqs, doc_lengths):
+        self.titles = titles
+        self.terms = terms
+        self.term_rows = {term: row for row, term in enumerate(terms)}
+        self.title_rows = {title: row for row, title in enumerate(titles)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self.norms = K1 * (1 - B + B * doc_lengths / max(average_length, 1.0))
+
+    @classmethod
+    def build(cls, pages):
+        """
+        Args:
+            pages: (title, text) pairs of the wiki pages.
+        """
+        titles = []
+        doc_lengths = []
+        postings = {}
+        for doc_id, (title, text) in enumerate(pages):
+            counts = Counter(tokenize(text))
+            for token in tokenize(title):
+                counts[token] += TITLE_WEIGHT
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+            titles.append(title)
+            doc_lengths.append(sum(counts.values()))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids = []
+        term_freqs = []
+        for row, term in enumerate(terms):
+            for doc_id, count in postings[term]:
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+            offsets[row + 1] = len(doc_ids)
+        return cls(titles, terms, offsets, np.array(doc_ids, dtype=np.int32),
+                   np.array(term_freqs, dtype=np.float32), np.array(doc_lengths, dtype=np.float32))
+
+    def save(self, path, signature):
+        """Writes the index and the signature of the corpus it was built from, replacing the file atomically."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, titles=_join(self.titles), terms=_join(self.terms), offsets=self.offsets, doc_ids=self.doc_ids,
+                     term_freqs=self.term_freqs, doc_lengths=self.doc_lengths, signature=np.array(signature, dtype=np.int64))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns:
+            The index and the signature of the corpus it was built from.
+        """
+        with np.load(path) as arrays:
+            index = cls(_split(arrays["titles"]), _split(arrays["terms"]), arrays["offsets"], arrays["doc_ids"],
+                        arrays["term_freqs"], arrays["doc_lengths"])
+            return index, tuple(int(value) for value in arrays["signature"])
+
+    def scores(self, text):
+        """Returns the BM25 score of every page for a text, in page order."""
+        scores = np.zeros(len(self.titles), dtype=np.float32)
+        for term in set(tokenize(text)):
+            row = self.term_rows.get(term)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            doc_ids = self.doc_ids[start:end]
+            term_freqs = self.term_freqs[start:end]
+            idf = math.log(1 + (len(self.titles) - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[doc_ids] += idf * term_freqs * (K1 + 1) / (term_freqs + self.norms[doc_ids])
+        return scores
+
+    def rank(self, text, k):
+        """
+        Returns:
+            The titles of the k best scoring pages for a text, best first. Pages sharing no term with the text are left out.
+        """
+        scores = self.scores(text)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = sorted(best, key=lambda doc_id: (-scores[doc_id], self.titles[doc_id]))
+        return [self.titles[doc_id] for doc_id in best]
+
+    def narrow(self, text, titles, k):
+        """
+        Returns:
+            The k titles of a candidate list whose pages score best for a text, best first.
+            Candidates without a page in the index rank last.
+        """
+        scores = self.scores(text)
+        def score(title):
+            row = self.title_rows.get(title)
+            return float(scores[row]) if row is not None else -1.0
+        return sorted(titles, key=lambda title: (-score(title), title))[:k]
+
+def corpus_signature(wiki_directory):
+    """Identifies the packed corpus an index is built from; the corpus is repacked whenever the wiki changes."""
+    corpus_stat = os.stat(corpus_paths(wiki_directory)[1])
+    return corpus_stat.st_mtime_ns, corpus_stat.st_size
+
+def build_index(wiki_directory):
+    corpus = get_corpus(wiki_directory)
+    index = BM25Index.build(corpus.iter_pages())
+    index.save(index_path(wiki_directory), corpus_signature(wiki_directory))
+    return index
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_bm25_index(wiki_directory):
+    """
+    Returns the BM25 index of a wiki, shared by every caller in the process. It is loaded from
+    disk and rebuilt first if it is missing or was built from an older packed corpus.
+    """
+    wiki_directory = os.path.abspath(wiki_directory)
+    with _indexes_lock:
+        if wiki_directory not in _indexes:
+            # Opening the corpus repacks it if the wiki changed, which changes its signature
+            get_corpus(wiki_directory)
+            index = None
+            try:
+                index, signature = BM25Index.load(index_path(wiki_directory))
+                if signature != corpus_signature(wiki_directory):
+                    index = None
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                index = None
+            if index is None:
+                start = time.perf_counter()
+                index = build_index(wiki_directory)
+                print(f"Built the BM25 index of {len(index.titles)} wiki pages in {time.perf_counter() - start:.1f}s")
+            _indexes[wiki_directory] = index
+        return _indexes[wiki_directory]
+
+def rank_wiki_pages(wiki_directory, text, k):
+    """Returns the titles of the k wiki pages that best match a text, best first."""
+    return get_bm25_index(wiki_directory).rank(text, k)
+
+def narrow_wiki_pages(wiki_directory, text, titles, k):
+    """Keeps the k titles of a candidate list whose wiki pages best match a text, best first."""
+    return get_bm25_index(wiki_directory).narrow(text, titles, k)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the BM25 index of the wiki, or ranks the wiki pages for a query.")
+    parser.add_argument("query", nargs="?", help="Text to rank the wiki pages for.")
+    parser.add_argument("--wiki-directory", default=WIKI_DIRECTORY, help="Wiki folder (default: WIKI_DIRECTORY).")
+    parser.add_argument("--top-k", type=int, default=20, help="Number of pages to print for the query.")
+    args = parser.parse_args()
+
+    if args.query is None:
+        start = time.perf_counter()
+        index = build_index(args.wiki_directory)
+        print(f"Indexed {len(index.titles)} pages into {index_path(args.wiki_directory)} in {time.perf_counter() - start:.1f}s")
+    else:
+        for title in rank_wiki_pages(args.wiki_directory, args.query, args.top_k):
+            print(title)
@@ -1,11 +1,14 @@
 import json
+import os
+import sys
+from result_sink import latest_results
 
 def count_unique_versions(json_data):
     """
     Counts the number of unique Minecraft versions found in the given JSON data.
 
     Args:
-        json_data: A list of dictionaries representing bug report data.
+        json_data: An iterable of dictionaries representing bug report data.
 
     Returns:
         The number of unique Minecraft versions found.
@@ -26,14 +29,18 @@ def count_unique_versions(json_data):
     
     return len(versions)
 
-# Load the JSON data from the file
-try:
-    with open('step_clusters_log.json', 'r') as f:
-        data = json.load(f)
-except FileNotFoundError:
-    print("Error: File 'step_clusters_log.json' not found.")
+# Load the data from either the legacy log or the JSONL results stream
+log_path = sys.argv[1] if len(sys.argv) > 1 else 'step_clusters_log.json'
+if not os.path.exists(log_path):
+    print(f"Error: File '{log_path}' not found.")
     exit()  # Exit the script if the file is not found
 
+if log_path.endswith('.jsonl'):
+    data = latest_results(log_path)
+else:
+    with open(log_path, 'r') as f:
+        data = json.load(f)
+
 # Count the unique versions
 unique_version_count = count_unique_versions(data)
 
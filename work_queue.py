@@ -0,0 +1,250 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+SYNTHESIS_STAGE = "synthesis"
+REPRODUCTION_STAGE = "reproduction"
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class WorkQueue:
+    """
+    Durable work queue stored in a SQLite file, shared by a coordinator and any number of worker processes.
+
+    Workers lease a job, process it and ack it. A lease that is not renewed before it expires,
+    e.g. because the worker crashed, is handed out again until the job runs out of attempts.
+    Game slots are leased the same way so every slot is driven by exactly one reproduction worker.
+    """
+
+    def __init__(self, path, lease_seconds=900, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.close()
+        with self.transaction() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    stage TEXT NOT NULL,
+                    issue_json TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    last_error TEXT,
+                    updated REAL NOT NULL,
+                    UNIQUE (stage, issue_json)
+                )""")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS slots (
+                    slot TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    lease_expires REAL NOT NULL
+                )""")
+
+    def transaction(self):
+        # A fresh connection per operation keeps the queue usable from several threads and processes.
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return _Transaction(connection)
+
+    def enqueue(self, stage, issue_json, payload=None):
+        """
+        Adds a job, or puts an existing job of the same stage and issue back in the queue with the new payload.
+        A job that is leased to a worker whose lease has not expired is left alone, so it does not run twice.
+
+        Returns:
+            True if the job was queued, False if it is still being processed.
+        """
+        with self.transaction() as connection:
+            cursor = connection.execute("""
+                INSERT INTO jobs (stage, issue_json, payload, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT (stage, issue_json) DO UPDATE SET
+                    payload = excluded.payload, status = 'queued', attempts = 0,
+                    lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated = excluded.updated
+                WHERE jobs.status != 'leased' OR jobs.lease_expires < excluded.updated
+                """, (stage, issue_json, json.dumps(payload), time.time()))
+            return cursor.rowcount == 1
+
+    def lease(self, stage, owner):
+        """
+        Leases the oldest queued job of a stage.
+
+        Returns:
+            A dictionary with the job's id, issue_json, payload and attempts, or None if nothing is queued.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            self._expire_leases(connection, now)
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE stage = ? AND status = 'queued' ORDER BY id LIMIT 1", (stage,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("""
+                UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated = ?
+                WHERE id = ?""", (owner, now + self.lease_seconds, now, row["id"]))
+            return {
+                "id": row["id"],
+                "stage": row["stage"],
+                "issue_json": row["issue_json"],
+                "payload": json.loads(row["payload"]) if row["payload"] else None,
+                "attempts": row["attempts"] + 1,
+            }
+
+    def _expire_leases(self, connection, now):
+        connection.execute("""
+            UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                lease_owner = NULL, lease_expires = NULL, last_error = 'Lease expired', updated = ?
+            WHERE status = 'leased' AND lease_expires < ?""", (self.max_attempts, now, now))
+
+    def renew(self, job_id, owner):
+        """Extends a lease. Returns False if the lease was lost in the meantime."""
+        with self.transaction() as connection:
+            cursor = connection.execute("""
+                UPDATE jobs SET lease_expires = ?, updated = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?""",
+                (time.time() + self.lease_seconds, time.time(), job_id, owner))
+            return cursor.rowcount == 1
+
+    def ack(self, job_id, owner):
+        with self.transaction() as connection:
+            connection.execute("""
+                UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated = ?
+                WHERE id = ? AND lease_owner = ?""", (time.time(), job_id, owner))
+
+    def fail(self, job_id, owner, error=None):
+        """Gives a job back. It is queued again unless it has used up its attempts."""
+        with self.transaction() as connection:
+            connection.execute("""
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    lease_owner = NULL, lease_expires = NULL, last_error = ?, updated = ?
+                WHERE id = ? AND lease_owner = ?""", (self.max_attempts, error, time.time(), job_id, owner))
+
+    def pending(self, stage):
+        """Returns the number of queued or leased jobs of a stage."""
+        with self.transaction() as connection:
+            self._expire_leases(connection, time.time())
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE stage = ? AND status IN ('queued', 'leased')", (stage,)
+            ).fetchone()[0]
+
+    def counts(self):
+        """Returns the number of jobs per stage and status."""
+        with self.transaction() as connection:
+            rows = connection.execute("SELECT stage, status, COUNT(*) AS n FROM jobs GROUP BY stage, status").fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["stage"], {})[row["status"]] = row["n"]
+        return counts
+
+    def claim_slot(self, slot, owner):
+        """
+        Binds a game slot to a worker. Returns False if another live worker holds it.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("""
+                INSERT INTO slots (slot, owner, lease_expires) VALUES (?, ?, ?)
+                ON CONFLICT (slot) DO UPDATE SET owner = excluded.owner, lease_expires = excluded.lease_expires
+                WHERE slots.owner = excluded.owner OR slots.lease_expires < ?""",
+                (slot, owner, now + self.lease_seconds, now))
+            row = connection.execute("SELECT owner FROM slots WHERE slot = ?", (slot,)).fetchone()
+            return row["owner"] == owner
+
+    def release_slot(self, slot, owner):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM slots WHERE slot = ? AND owner = ?", (slot, owner))
+
+class _Transaction:
+    """Runs the statements of a `with` block in one immediate transaction and closes the connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.connection.close()
+
+class LeaseKeeper:
+    """Renews a job lease, and optionally a slot lease, from a background thread while the job runs."""
+
+    def __init__(self, work_queue, job_id, owner, slot=None):
+        self.work_queue = work_queue
+        self.job_id = job_id
+        self.owner = owner
+        self.slot = slot
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        interval = max(1.0, self.work_queue.lease_seconds / 3)
+        while not self.stopped.wait(interval):
+            if not self.work_queue.renew(self.job_id, self.owner):
+                print(f"Lost the lease of job {self.job_id}")
+            if self.slot and not self.work_queue.claim_slot(self.slot, self.owner):
+                print(f"Lost game slot {self.slot}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stopped.set()
+        self.thread.join()
+
+def run_worker(work_queue, stage, owner, handle, upstream_stages=(), slot=None, poll_interval=10):
+    """
+    Leases and processes jobs of one stage until it and its upstream stages have drained.
+
+    Args:
+        work_queue: The WorkQueue to pull from.
+        stage: The stage this worker processes.
+        owner: Unique id of this worker.
+        handle: Function taking a leased job. Returning a string fails the job with that error,
+                anything else acks it.
+        upstream_stages: Stages that may still enqueue work for this one.
+        slot: Game slot this worker is bound to, renewed together with each lease and on every idle poll.
+        poll_interval: Seconds to wait before polling again while upstream work is pending.
+
+    Returns:
+        The number of jobs processed.
+    """
+    processed = 0
+    while True:
+        job = work_queue.lease(stage, owner)
+        if job is None:
+            if work_queue.pending(stage) == 0 and all(work_queue.pending(s) == 0 for s in upstream_stages):
+                return processed
+            # The slot is only renewed with job leases otherwise, it would expire while waiting on upstream work
+            if slot and not work_queue.claim_slot(slot, owner):
+                print(f"Lost game slot {slot} while idle, stopping.")
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Leased {stage} job {job['id']} for {job['issue_json']} (attempt {job['attempts']})")
+        with LeaseKeeper(work_queue, job["id"], owner, slot):
+            try:
+                error = handle(job)
+            except Exception:
+                error = traceback.format_exc()
+        if isinstance(error, str):
+            work_queue.fail(job["id"], owner, error)
+        else:
+            work_queue.ack(job["id"], owner)
+        processed += 1